@@ -0,0 +1,46 @@
+"""
+Shared helpers for the scripts in this package.
+
+Run a benchmark from the repository root, e.g. ``python -m benchmarks.search``.
+Every benchmark works on a throwaway copy of the schema (the configured test
+database), never on the development database.
+"""
+import os
+import statistics
+import time
+from contextlib import contextmanager
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+django.setup()
+
+from django.db import DEFAULT_DB_ALIAS, connections  # noqa: E402
+
+
+@contextmanager
+def scratch_database(*aliases):
+    """Swap the databases in ``aliases`` (just 'default' when none are given) for fresh test copies."""
+    old_names = {}
+    for alias in aliases or (DEFAULT_DB_ALIAS,):
+        old_names[alias] = connections[alias].settings_dict['NAME']
+        connections[alias].creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        for alias, old_name in old_names.items():
+            connections[alias].creation.destroy_test_db(old_name, verbosity=0)
+
+
+def measure(func, repeat=5):
+    """Call ``func`` ``repeat`` times; return the wall-clock samples in ms."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(label, samples):
+    print(f"{label:<40} median {statistics.median(samples):9.2f} ms   min {min(samples):9.2f} ms")
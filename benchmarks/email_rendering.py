@@ -0,0 +1,70 @@
+"""
+Time rendering the activation email (HTML and plain text) per message.
+
+    python -m benchmarks.email_rendering [--messages 5000]
+"""
+import argparse
+import time
+from types import SimpleNamespace
+
+from benchmarks.common import measure, report
+
+from django.template.loader import get_template, render_to_string  # noqa: E402
+from django.utils.html import strip_tags  # noqa: E402
+
+from pages.email_utils import get_shells, render_emails  # noqa: E402
+
+
+def contexts(count):
+    return [
+        {
+            'user': SimpleNamespace(first_name=f'First{i}', last_name=f'Last{i}'),
+            'activation_link': f'https://example.com/activate/{i:048d}/',
+        }
+        for i in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--messages', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    batch = contexts(args.messages)
+
+    def per_call_render():
+        # What the senders did before: render_to_string + strip_tags
+        for context in batch:
+            html = render_to_string('emails/activation_email.html', context)
+            strip_tags(html)
+
+    html_template = get_template('emails/activation_email.html')
+    text_template = get_template('emails/activation_email.txt')
+
+    def cached_templates():
+        for context in batch:
+            html_template.render(context)
+            text_template.render(context)
+
+    get_shells('activation_email')
+
+    def shells():
+        render_emails('activation_email', batch)
+
+    for label, func in [
+        ('render_to_string + strip_tags', per_call_render),
+        ('cached Template.render, .txt template', cached_templates),
+        ('render_emails (cached shells)', shells),
+    ]:
+        samples = measure(func, args.repeat)
+        report(label, samples)
+        print(f"{'':<40} {args.messages / (min(samples) / 1000):,.0f} messages/s")
+
+    start = time.perf_counter()
+    get_shells.cache_clear()
+    get_shells('activation_email')
+    print(f"Compiling the shells once: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
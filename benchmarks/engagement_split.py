@@ -0,0 +1,120 @@
+"""
+Write throughput under concurrent donors with every table in one SQLite
+file and with Donation, Rating, Comment and Report split into their own
+(PAGES_SPLIT_ENGAGEMENT). Donor processes call record_donation; alongside
+them --writers processes each file reports (engagement tables only) and
+record logins (account table only), like the rest of the site does between
+donations.
+
+    python -m benchmarks.engagement_split [--donors 6] [--writers 1] [--duration 10]
+"""
+import argparse
+import multiprocessing
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from benchmarks.common import scratch_database
+
+from django.conf import settings  # noqa: E402
+from django.db import OperationalError, close_old_connections, connections  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from pages.db_utils import ENGAGEMENT_DATABASE  # noqa: E402
+from pages.donation_utils import record_donation  # noqa: E402
+from pages.models import Category, CustomUser, Project, Report  # noqa: E402
+
+
+def seed(projects, users):
+    category = Category.objects.create(name='Benchmark')
+    donors = CustomUser.objects.bulk_create([
+        CustomUser(username=f'bench{i}@example.com', email=f'bench{i}@example.com', password='!',
+                   mobile_phone=f'010{i:08d}', is_active=True)
+        for i in range(users)
+    ])
+    now = timezone.now()
+    Project.objects.bulk_create([
+        Project(creator=donors[i % users], title=f'Project {i}', details='Benchmark project', category=category,
+                total_target=100000, start_date=now, end_date=now + timezone.timedelta(days=30))
+        for i in range(projects)
+    ])
+    return list(Project.objects.values_list('pk', flat=True)), donors
+
+
+def work(operation, deadline, seed, results):
+    rng = random.Random(seed)
+    latencies, errors = [], 0
+    while time.time() < deadline:
+        close_old_connections()
+        start = time.perf_counter()
+        try:
+            operation(rng)
+        except OperationalError as e:
+            if 'locked' not in str(e) and 'busy' not in str(e):
+                raise
+            errors += 1
+        else:
+            latencies.append((time.perf_counter() - start) * 1000)
+        close_old_connections()
+    connections.close_all()
+    results.put((operation.__name__, latencies, errors))
+
+
+def run(split, donors_count, writers, duration, project_ids, donors):
+    settings.PAGES_SPLIT_ENGAGEMENT = split
+    connections.close_all()
+
+    def donate(rng):
+        record_donation(rng.choice(project_ids), rng.choice(donors), Decimal(rng.randint(10, 500)))
+
+    def report(rng):
+        Report.objects.create(reporter=rng.choice(donors), report_type='project',
+                              project_id=rng.choice(project_ids), reason='Benchmark')
+
+    def login(rng):
+        CustomUser.objects.filter(pk=rng.choice(donors).pk).update(last_login=timezone.now())
+
+    # Forked, so the workers inherit the scratch databases and the setting
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    deadline = time.time() + duration
+    processes = [
+        context.Process(target=work, args=(operation, deadline, seed, results))
+        for seed, operation in enumerate([donate] * donors_count + [report, login] * writers)
+    ]
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    print(f"\n{'split (two files)' if split else 'single file'}")
+    for label, name in (('donations', 'donate'), ('reports', 'report'), ('logins', 'login')):
+        latencies = [latency for kind, samples, _ in outcomes if kind == name for latency in samples]
+        errors = sum(count for kind, _, count in outcomes if kind == name)
+        attempts = len(latencies) + errors
+        p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else 0
+        print(f"  {label:<10} {len(latencies) / duration:8.1f}/s   lock errors {errors:5d} "
+              f"({errors / attempts if attempts else 0:6.1%})   p95 {p95:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--donors', type=int, default=6)
+    parser.add_argument('--writers', type=int, default=1)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--projects', type=int, default=500)
+    parser.add_argument('--users', type=int, default=200)
+    args = parser.parse_args()
+
+    with scratch_database('default', ENGAGEMENT_DATABASE):
+        project_ids, donors = seed(args.projects, args.users)
+        print(f"{args.donors} donors, {args.writers} reporters and {args.writers} logins for {args.duration:.0f}s each "
+              f"({settings.SQLITE_PROFILE} SQLite profile)")
+        for split in (False, True):
+            run(split, args.donors, args.writers, args.duration, project_ids, donors)
+
+
+if __name__ == '__main__':
+    main()
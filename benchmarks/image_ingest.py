@@ -0,0 +1,98 @@
+"""
+Time creating a project with large photos, with the images decoded inside the
+request (as before) and staged for the background pool, plus how long the
+background pool takes to attach them.
+
+    python -m benchmarks.image_ingest [--images 10] [--size 4000x3000] [--repeat 3]
+"""
+import argparse
+import io
+import shutil
+import tempfile
+import time
+
+from benchmarks.common import measure, report, scratch_database
+
+from django.core.cache import cache  # noqa: E402
+from django.core.files.uploadedfile import SimpleUploadedFile  # noqa: E402
+from django.test import Client, override_settings  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from PIL import Image  # noqa: E402
+
+from pages.ingest_utils import _dispatcher  # noqa: E402
+from pages.models import Category, CustomUser, ProjectImage, StagedImage  # noqa: E402
+
+
+def make_photo(width, height, seed):
+    # Noise compresses like a real photo, so uploads have realistic sizes
+    image = Image.effect_noise((width, height), 64).convert('RGB')
+    image = Image.merge('RGB', [band.point(lambda v, s=seed + i: (v * (i + 2) + s) % 256) for i, band in enumerate(image.split())])
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--images', type=int, default=10)
+    parser.add_argument('--size', default='4000x3000')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    width, height = (int(part) for part in args.size.split('x'))
+
+    photos = [make_photo(width, height, seed) for seed in range(args.images)]
+    print(f"{args.images} uploads of {width}x{height}, {sum(map(len, photos)) / 1e6:.1f} MB in total")
+
+    location = tempfile.mkdtemp()
+    with scratch_database(), override_settings(MEDIA_ROOT=location):
+        setup_test_environment()  # Allows the test client's host
+        user = CustomUser.objects.create_user(
+            username='bench@example.com', email='bench@example.com', password='password', mobile_phone='01000000000'
+        )
+        category = Category.objects.create(name='Benchmark')
+        client = Client()
+        client.force_login(user)
+        today = timezone.localdate()
+
+        def create_project():
+            cache.clear()
+            client.post('/projects/create/', {
+                'title': 'Benchmark project',
+                'details': 'Large photos',
+                'category': category.pk,
+                'total_target': '50000',
+                'tags': 'photos',
+                'start_date': today.isoformat(),
+                'end_date': (today + timezone.timedelta(days=30)).isoformat(),
+                'images': [SimpleUploadedFile(f'{i}.jpg', data, 'image/jpeg') for i, data in enumerate(photos)],
+            })
+
+        try:
+            with override_settings(IMAGE_INGEST_MODE='inline'):
+                report('Request, decoded in the request', measure(create_project, args.repeat))
+
+            with override_settings(IMAGE_INGEST_MODE='background'):
+                # Warm the pool up so its start-up is not billed to the first sample
+                _dispatcher.submit(lambda: None).result()
+                create_project()
+                _dispatcher.submit(lambda: None).result()
+
+                request_samples, attach_samples = [], []
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    create_project()
+                    request_samples.append((time.perf_counter() - start) * 1000)
+                    _dispatcher.submit(lambda: None).result()
+                    attach_samples.append((time.perf_counter() - start) * 1000)
+                report('Request, staged for the pool', request_samples)
+                report('Until the images are attached', attach_samples)
+
+            print(f"\n{ProjectImage.objects.count()} images attached, {StagedImage.objects.count()} left staged")
+        finally:
+            shutil.rmtree(location, True)
+
+
+if __name__ == '__main__':
+    main()
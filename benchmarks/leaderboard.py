@@ -0,0 +1,122 @@
+"""
+Time the home page's top-rated query as the Rating table grows, comparing the
+original aggregate over ratings, the per-project counters and the leaderboard.
+
+    python -m benchmarks.leaderboard [--projects 20000] [--users 1000] [--steps 10000,100000,1000000]
+"""
+import argparse
+import io
+import random
+import time
+
+from benchmarks.common import measure, report, scratch_database
+
+from django.core.cache import cache  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connection, transaction  # noqa: E402
+from django.db.models import Avg, F, FloatField, ExpressionWrapper  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from pages.leaderboard_utils import top_rated_projects  # noqa: E402
+from pages.models import Category, CustomUser, Project, Rating  # noqa: E402
+
+
+def seed(projects, users):
+    rng = random.Random(11)
+    categories = [Category.objects.create(name=f'Category {i}') for i in range(12)]
+    creators = CustomUser.objects.bulk_create([
+        CustomUser(
+            username=f'bench{i}@example.com', email=f'bench{i}@example.com', password='!',
+            mobile_phone=f'010{i:08d}', is_active=True
+        )
+        for i in range(users)
+    ], batch_size=5000)
+    now = timezone.now()
+    Project.objects.bulk_create([
+        Project(
+            creator=rng.choice(creators),
+            title=f'Project {i}',
+            details='Benchmark project',
+            category=rng.choice(categories),
+            total_target=10000,
+            start_date=now,
+            end_date=now + timezone.timedelta(days=30),
+        )
+        for i in range(projects)
+    ], batch_size=5000)
+    return rng, list(Project.objects.values_list('pk', flat=True)), [user.pk for user in creators]
+
+
+def insert_ratings(rng, pairs, project_ids, user_ids, quality):
+    now = timezone.now()
+    table = Rating._meta.db_table
+    rows = []
+    for pair in pairs:
+        project_id = project_ids[pair % len(project_ids)]
+        user_id = user_ids[pair // len(project_ids)]
+        value = min(5, max(1, round(rng.gauss(quality[project_id], 1))))
+        rows.append((project_id, user_id, value, now))
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {table} (project_id, user_id, rating, created_at) VALUES (%s, %s, %s, %s)', rows
+        )
+
+
+def aggregate_query():
+    # What the home page ran before the counters: AVG over every rating
+    return list(Project.objects.filter(is_active=True).annotate(
+        avg_rating=Avg('ratings__rating')
+    ).filter(avg_rating__isnull=False).order_by('-avg_rating')[:5])
+
+
+def counter_query():
+    return list(Project.objects.filter(is_active=True, rating_count__gt=0).annotate(
+        avg_rating=ExpressionWrapper(F('rating_sum') * 1.0 / F('rating_count'), output_field=FloatField())
+    ).order_by('-avg_rating')[:5])
+
+
+def leaderboard_query():
+    return list(top_rated_projects()[:5])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--projects', type=int, default=20000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--steps', default='10000,100000,1000000')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    steps = [int(step) for step in args.steps.split(',')]
+
+    with scratch_database():
+        print(f"Seeding {args.projects} projects and {args.users} users...")
+        rng, project_ids, user_ids = seed(args.projects, args.users)
+        quality = {pk: rng.uniform(1.5, 4.5) for pk in project_ids}
+        # Distinct (project, user) pairs, consumed in prefixes so every step
+        # only inserts the new ratings
+        pairs = rng.sample(range(len(project_ids) * len(user_ids)), steps[-1])
+        setup_test_environment()  # Allows the test client's host
+        client = Client()
+
+        inserted = 0
+        for step in steps:
+            start = time.perf_counter()
+            insert_ratings(rng, pairs[inserted:step], project_ids, user_ids, quality)
+            inserted = step
+            call_command('rebuild_counters', stdout=io.StringIO())
+            print(f"\n{step} ratings (seeded and rebuilt in {time.perf_counter() - start:.1f}s)")
+
+            report('  AVG over Rating', measure(aggregate_query, args.repeat))
+            report('  Counters, sorted scan', measure(counter_query, args.repeat))
+            report('  Leaderboard index', measure(leaderboard_query, args.repeat))
+
+            def home_page():
+                cache.clear()
+                client.get('/')
+            report('  Home page, cold cache', measure(home_page, args.repeat))
+
+
+if __name__ == '__main__':
+    main()
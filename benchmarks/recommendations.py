@@ -0,0 +1,91 @@
+"""
+Time a full similar-projects rebuild and one incremental update.
+
+    python -m benchmarks.recommendations [--projects 50000]
+"""
+import argparse
+import random
+import time
+
+from benchmarks.common import scratch_database
+from benchmarks.search import make_vocabulary
+
+from django.test import override_settings  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from pages.models import Category, CustomUser, Project, SimilarProject, Tag  # noqa: E402
+from pages.recommendation_utils import (  # noqa: E402
+    rebuild_similar_projects, similar_projects_for, update_similar_projects,
+)
+
+
+def seed(count):
+    rng = random.Random(7)
+    vocabulary, weights = make_vocabulary(rng)
+    user = CustomUser.objects.create_user(
+        username='bench@example.com', email='bench@example.com', password='bench', mobile_phone='01000000000'
+    )
+    categories = [Category.objects.create(name=f'Category {i}') for i in range(12)]
+    tags = Tag.objects.bulk_create([Tag(name=f'tag{i}') for i in range(2000)])
+    tag_weights = [1.0 / (rank + 5) for rank in range(len(tags))]
+    now = timezone.now()
+
+    projects = []
+    for i in range(count):
+        projects.append(Project(
+            creator=user,
+            title=' '.join(rng.choices(vocabulary, weights, k=4)).title(),
+            details=' '.join(rng.choices(vocabulary, weights, k=80)),
+            category=rng.choice(categories),
+            total_target=10000,
+            start_date=now,
+            end_date=now + timezone.timedelta(days=30),
+        ))
+    projects = Project.objects.bulk_create(projects, batch_size=5000)
+
+    ProjectTag = Project.tag_objects.through
+    links = []
+    for project in projects:
+        for tag in set(rng.choices(tags, tag_weights, k=3)):
+            links.append(ProjectTag(project_id=project.pk, tag_id=tag.pk))
+    ProjectTag.objects.bulk_create(links, batch_size=5000)
+    return user, categories[0], rng.sample(tags, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--projects', type=int, default=50000)
+    args = parser.parse_args()
+
+    with scratch_database():
+        print(f"Seeding {args.projects} projects...")
+        user, category, tags = seed(args.projects)
+
+        start = time.perf_counter()
+        projects, links = rebuild_similar_projects()
+        print(f"Full rebuild: {projects} projects, {links} links in {time.perf_counter() - start:.1f}s")
+
+        start = time.perf_counter()
+        now = timezone.now()
+        with override_settings(PAGES_RECOMMENDATION_UPDATES='off'):
+            project = Project.objects.create(
+                creator=user, title='New campaign', details='A brand new campaign', category=category,
+                total_target=1000, tags=', '.join(tag.name for tag in tags),
+                start_date=now, end_date=now + timezone.timedelta(days=30),
+            )
+        print(f"Create one project: {(time.perf_counter() - start) * 1000:.0f} ms")
+
+        # What the background thread runs after the save commits
+        start = time.perf_counter()
+        update_similar_projects(project.pk)
+        elapsed = time.perf_counter() - start
+        print(f"Incremental update: {elapsed * 1000:.0f} ms, "
+              f"{SimilarProject.objects.filter(project=project).count()} links")
+
+        start = time.perf_counter()
+        similar_projects_for(project)
+        print(f"Detail-page lookup: {(time.perf_counter() - start) * 1000:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Compare the FTS5 project search with the old icontains scan.
+
+    python -m benchmarks.search [--projects 100000]
+"""
+import argparse
+import random
+
+from benchmarks.common import measure, report, scratch_database
+
+from django.db.models import Q  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from pages.models import Category, CustomUser, Project  # noqa: E402
+from pages.search_utils import rebuild_index, search_projects  # noqa: E402
+
+WORDS = (
+    'water school health clinic books children village farm solar energy '
+    'library food orphans hospital clean wells education art music sports '
+    'women training garden bakery computers trees recycling startup app '
+    'community shelter medicine teachers bridge roads internet youth'
+).split()
+
+
+def make_vocabulary(rng, size=20000):
+    # Theme words plus a long tail of rarer words, so terms have realistic
+    # selectivity instead of matching nearly every project
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    tail = {''.join(rng.choices(letters, k=rng.randint(4, 9))) for _ in range(size)}
+    vocabulary = WORDS + sorted(tail - set(WORDS))
+    weights = [1.0 / (rank + 10) for rank in range(len(vocabulary))]
+    return vocabulary, weights
+
+
+def seed(count):
+    rng = random.Random(42)
+    vocabulary, weights = make_vocabulary(rng)
+    user = CustomUser.objects.create_user(
+        username='bench@example.com', email='bench@example.com', password='bench', mobile_phone='01000000000'
+    )
+    categories = [Category.objects.create(name=f'Category {i}') for i in range(8)]
+    now = timezone.now()
+    batch = []
+    for i in range(count):
+        batch.append(Project(
+            creator=user,
+            title=' '.join(rng.choices(WORDS, k=4)).title(),
+            details=' '.join(rng.choices(vocabulary, weights, k=120)),
+            category=rng.choice(categories),
+            total_target=10000,
+            tags=', '.join(rng.sample(WORDS, 3)),
+            start_date=now,
+            end_date=now + timezone.timedelta(days=30),
+        ))
+        if len(batch) == 5000:
+            Project.objects.bulk_create(batch)
+            batch = []
+    Project.objects.bulk_create(batch)
+    rebuild_index()
+    return categories, vocabulary
+
+
+def icontains_search(projects, search_query):
+    return projects.filter(
+        Q(title__icontains=search_query) |
+        Q(tags__icontains=search_query) |
+        Q(details__icontains=search_query)
+    )
+
+
+def first_page(queryset):
+    # What project_list renders: a COUNT(*) plus the first 12 rows
+    queryset.count()
+    list(queryset[:12])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--projects', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with scratch_database():
+        print(f"Seeding {args.projects} projects...")
+        categories, vocabulary = seed(args.projects)
+        base = Project.objects.filter(is_active=True).order_by('-created_at')
+
+        # Common theme words, a prefix, a mid-frequency word and a miss
+        for term in ('solar', 'wat', 'clean wells', vocabulary[2000], 'nonexistentword'):
+            report(f"icontains  '{term}'", measure(lambda: first_page(icontains_search(base, term)), args.repeat))
+            report(f"fts5       '{term}'", measure(lambda: first_page(search_projects(base, term)), args.repeat))
+
+        category_base = base.filter(category=categories[0])
+        report("icontains  'solar' + category", measure(lambda: first_page(icontains_search(category_base, 'solar')), args.repeat))
+        report("fts5       'solar' + category", measure(lambda: first_page(search_projects(category_base, 'solar')), args.repeat))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+Mixed reader and writer processes (like web workers) against the same
+SQLite file, once with plain SQLite (rollback journal, a new connection per
+request) and once with the settings.SQLITE_PROFILES['production'] profile.
+Readers load a listing page and a comment thread; writers record donations,
+post comments and rate projects through the view, whose transaction reads
+before it writes.
+
+    python -m benchmarks.sqlite_concurrency [--readers 8] [--writers 4] [--duration 10]
+"""
+import argparse
+import logging
+import multiprocessing
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from benchmarks.common import scratch_database
+
+from django.conf import settings  # noqa: E402
+from django.db import OperationalError, close_old_connections, connection, connections  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from pages.comment_utils import load_comment_thread  # noqa: E402
+from pages.donation_utils import record_donation  # noqa: E402
+from pages.models import Category, Comment, CustomUser, Project  # noqa: E402
+
+
+def seed(projects, users):
+    category = Category.objects.create(name='Benchmark')
+    donors = CustomUser.objects.bulk_create([
+        CustomUser(username=f'bench{i}@example.com', email=f'bench{i}@example.com', password='!',
+                   mobile_phone=f'010{i:08d}', is_active=True)
+        for i in range(users)
+    ])
+    now = timezone.now()
+    Project.objects.bulk_create([
+        Project(creator=donors[i % users], title=f'Project {i}', details='Benchmark project', category=category,
+                total_target=100000, start_date=now, end_date=now + timezone.timedelta(days=30))
+        for i in range(projects)
+    ])
+    return list(Project.objects.values_list('pk', flat=True)), donors
+
+
+def apply_profile(name):
+    profile = settings.SQLITE_PROFILES[name]
+    # Workers build their connections from this dict
+    connections.settings['default'].update(
+        OPTIONS={
+            **profile['options'],
+            'init_command': ''.join(f'PRAGMA {key}={value};' for key, value in profile['pragmas'].items()),
+        },
+        CONN_MAX_AGE=profile['conn_max_age'],
+    )
+    connection.close()
+    if 'journal_mode' not in profile['pragmas']:
+        # WAL is remembered by the file; go back to the rollback journal
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode=DELETE')
+        connection.close()
+
+
+def work(operation, deadline, seed, results):
+    rng = random.Random(seed)
+    latencies, errors = [], 0
+    while time.time() < deadline:
+        close_old_connections()  # As at the start and end of a request
+        start = time.perf_counter()
+        try:
+            operation(rng)
+        except OperationalError as e:
+            if 'locked' not in str(e) and 'busy' not in str(e):
+                raise
+            errors += 1
+        else:
+            latencies.append((time.perf_counter() - start) * 1000)
+        close_old_connections()
+    connection.close()
+    results.put((operation.__name__, latencies, errors))
+
+
+def run(profile, readers, writers, duration, project_ids, donors):
+    apply_profile(profile)
+
+    def read(rng):
+        list(Project.objects.for_cards().filter(is_active=True).order_by('-created_at')[:12])
+        load_comment_thread(Project.objects.get(pk=rng.choice(project_ids)))
+
+    clients = {}
+
+    def write(rng):
+        choice = rng.random()
+        if choice < 0.4:
+            record_donation(rng.choice(project_ids), rng.choice(donors), Decimal(rng.randint(10, 500)))
+        elif choice < 0.7:
+            Comment.objects.create(project_id=rng.choice(project_ids), user=rng.choice(donors), content='Benchmark')
+        else:
+            if 'rater' not in clients:
+                clients['rater'] = Client(raise_request_exception=True)
+                clients['rater'].force_login(rng.choice(donors))
+            clients['rater'].post(f'/projects/{rng.choice(project_ids)}/rate/', {'rating': rng.randint(1, 5)})
+
+    # Forked, so the workers inherit the scratch database settings and these closures
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    deadline = time.time() + duration
+    processes = [
+        context.Process(target=work, args=(operation, deadline, seed, results))
+        for seed, operation in enumerate([read] * readers + [write] * writers)
+    ]
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    print(f"\n{profile}")
+    for label, name in (('reads', 'read'), ('writes', 'write')):
+        latencies = [latency for kind, samples, _ in outcomes if kind == name for latency in samples]
+        errors = sum(count for kind, _, count in outcomes if kind == name)
+        attempts = len(latencies) + errors
+        p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else 0
+        print(f"  {label:<7} {len(latencies) / duration:8.1f}/s   lock errors {errors:5d} "
+              f"({errors / attempts if attempts else 0:6.1%})   p95 {p95:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--projects', type=int, default=500)
+    parser.add_argument('--users', type=int, default=200)
+    args = parser.parse_args()
+
+    with scratch_database():
+        setup_test_environment()  # Allows the test client's host
+        # Lock errors in the view are counted, not logged as 500s
+        logging.getLogger('django.request').setLevel(logging.CRITICAL)
+        project_ids, donors = seed(args.projects, args.users)
+        print(f"{args.readers} readers and {args.writers} writers for {args.duration:.0f}s each")
+        for profile in ('default', 'production'):
+            run(profile, args.readers, args.writers, args.duration, project_ids, donors)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+"""
+Latency, query count and peak memory of the main pages, driven through the
+test client against a database filled by ``manage.py seed_platform``.
+
+    python -m benchmarks.views [--repeat 100] [--save baseline.json]
+    python -m benchmarks.views --compare baseline.json [--threshold 0.2]
+
+With --compare, views slower (p50/p95/p99) or hungrier (peak memory) than
+the baseline by more than the threshold, or running more queries than it,
+are listed as regressions and the exit status is 1. Compare baselines made
+with the same seeding options on the same machine.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.common import scratch_database
+
+import django  # noqa: E402
+from django.core.cache import cache  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db.models import Count  # noqa: E402
+from django.test import Client, override_settings  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+from django.urls import reverse  # noqa: E402
+
+from pages.db_utils import ENGAGEMENT_DATABASE  # noqa: E402
+from pages.instrumentation_utils import record_request  # noqa: E402
+from pages.models import Category, CustomUser, Project  # noqa: E402
+
+SEED_OPTIONS = ('users', 'projects', 'donations', 'comments', 'ratings', 'reports', 'seed')
+LATENCIES = ('p50', 'p95', 'p99')
+
+
+def seed(options):
+    start = time.perf_counter()
+    call_command(
+        'seed_platform', stdout=io.StringIO(), skip_recommendations=True,
+        **{name: getattr(options, name) for name in SEED_OPTIONS}
+    )
+    print(f"Seeded {options.donations} donations and {options.comments} comments in {time.perf_counter() - start:.1f}s")
+
+
+def cases():
+    """``(name, client kind, method, url, data)`` for every page measured."""
+    busiest = Project.objects.filter(is_active=True).order_by('-comment_count').first()
+    category = Category.objects.annotate(projects=Count('project')).order_by('-projects').first()
+    return [
+        ('home', 'anonymous', 'get', reverse('home'), None),
+        ('project_list', 'anonymous', 'get', reverse('project_list'), None),
+        ('project_list search', 'anonymous', 'get', reverse('project_list'), {'search': 'clinic'}),
+        ('project_list category', 'anonymous', 'get', reverse('project_list'), {'category': category.pk}),
+        ('project_detail', 'anonymous', 'get', reverse('project_detail', args=[busiest.pk]), None),
+        ('profile', 'donor', 'get', reverse('profile'), None),
+        ('donate_to_project', 'donor', 'post', reverse('donate_to_project', args=[busiest.pk]), {'amount': '50'}),
+        ('project_analytics', 'creator', 'get', reverse('project_analytics', args=[busiest.pk]), None),
+        ('project_analytics hour', 'creator', 'get', reverse('project_analytics', args=[busiest.pk]), {'period': 'hour'}),
+    ]
+
+
+def percentile(samples, point):
+    return statistics.quantiles(samples, n=100, method='inclusive')[point - 1]
+
+
+def measure_view(client, method, url, data, repeat, warm_cache):
+    def call():
+        if not warm_cache:
+            cache.clear()
+        response = getattr(client, method)(url, data)
+        if response.status_code not in (200, 302):
+            raise SystemExit(f'{method.upper()} {url} returned {response.status_code}')
+
+    for _ in range(3):
+        call()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        samples.append((time.perf_counter() - start) * 1000)
+
+    # Counted and traced in separate requests, so neither skews the timings
+    with record_request() as recorder:
+        call()
+    tracemalloc.start()
+    try:
+        call()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    result = {name: round(percentile(samples, int(name[1:])), 2) for name in LATENCIES}
+    result.update(mean=round(statistics.fmean(samples), 2), queries=len(recorder.queries), peak_kib=round(peak / 1024))
+    return result
+
+
+def print_results(results):
+    print(f"\n{'view':<24}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}{'peak KiB':>10}")
+    for name, result in results.items():
+        print(f"{name:<24}{result['p50']:>10.2f}{result['p95']:>10.2f}{result['p99']:>10.2f}"
+              f"{result['queries']:>9}{result['peak_kib']:>10}")
+
+
+def regressions(baseline, results, threshold):
+    """``[(view, measure, baseline value, value)]`` for everything worse than ``baseline``."""
+    found = []
+    for name, result in results.items():
+        before = baseline['views'].get(name)
+        if before is None:
+            continue
+        for measure in LATENCIES + ('peak_kib',):
+            if result[measure] > before[measure] * (1 + threshold):
+                found.append((name, measure, before[measure], result[measure]))
+        if result['queries'] > before['queries']:
+            found.append((name, 'queries', before['queries'], result['queries']))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--projects', type=int, default=5000)
+    parser.add_argument('--donations', type=int, default=300000)
+    parser.add_argument('--comments', type=int, default=50000)
+    parser.add_argument('--ratings', type=int, default=50000)
+    parser.add_argument('--reports', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=100, help='Timed requests per view.')
+    parser.add_argument('--warm-cache', action='store_true', help='Keep cached fragments between requests.')
+    parser.add_argument('--save', metavar='PATH', help='Write the results to a JSON baseline.')
+    parser.add_argument('--compare', metavar='PATH', help='Check the results against a saved baseline.')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Allowed slowdown, 0.2 for 20%%.')
+    options = parser.parse_args()
+
+    baseline = None
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)
+        seeded = {name: getattr(options, name) for name in SEED_OPTIONS}
+        if baseline['seeded'] != seeded:
+            print(f"Warning: the baseline was seeded with {baseline['seeded']}, not {seeded}")
+
+    setup_test_environment()
+    with scratch_database('default', ENGAGEMENT_DATABASE), override_settings(MEDIA_ROOT=tempfile.mkdtemp()):
+        seed(options)
+        clients = {'anonymous': Client(), 'donor': Client(), 'creator': Client()}
+        # The most active donor has the longest history on the profile page
+        clients['donor'].force_login(CustomUser.objects.annotate(given=Count('donations')).order_by('-given').first())
+        # The busiest campaign's creator, for its analytics
+        clients['creator'].force_login(Project.objects.filter(is_active=True).order_by('-comment_count').first().creator)
+
+        results = {}
+        for name, client, method, url, data in cases():
+            results[name] = measure_view(clients[client], method, url, data, options.repeat, options.warm_cache)
+            print(f"  {name}: p95 {results[name]['p95']:.2f} ms")
+
+    print_results(results)
+    if options.save:
+        document = {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'environment': {
+                'python': platform.python_version(), 'django': django.get_version(), 'sqlite': sqlite3.sqlite_version,
+                'machine': platform.machine(), 'cpus': os.cpu_count(),
+            },
+            'seeded': {name: getattr(options, name) for name in SEED_OPTIONS},
+            'repeat': options.repeat,
+            'warm_cache': options.warm_cache,
+            'views': results,
+        }
+        with open(options.save, 'w') as f:
+            json.dump(document, f, indent=2)
+        print(f"\nSaved the baseline to {options.save}")
+
+    if baseline is not None:
+        found = regressions(baseline, results, options.threshold)
+        if not found:
+            print(f"\nNo regressions against {options.compare} (threshold {options.threshold:.0%})")
+            return
+        print(f"\nRegressions against {options.compare} (threshold {options.threshold:.0%}):")
+        for name, measure, before, after in found:
+            print(f"  {name:<24}{measure:<10}{before:>10} -> {after}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,3 +4,5 @@ class PagesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'pages'
 
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,73 @@
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+KEY_PREFIX = 'pages'
+# Seconds a lock holder may take to rebuild an entry before another worker
+# is allowed to try
+LOCK_TIMEOUT = 30
+WAIT_INTERVAL = 0.05
+WAIT_ATTEMPTS = 40
+
+
+def _cache():
+    return caches[getattr(settings, 'PAGES_CACHE_ALIAS', 'default')]
+
+
+def _version_key(group):
+    return f'{KEY_PREFIX}:version:{group}'
+
+
+def _group_version(cache, group):
+    version = cache.get(_version_key(group))
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(_version_key(group), version, None):
+            version = cache.get(_version_key(group), version)
+    return version
+
+
+def get_or_build(name, group, builder, timeout=None):
+    """
+    Return the cached value of ``name``, rebuilding it with ``builder()`` when
+    ``group`` was invalidated since it was stored.
+
+    Only the worker that takes the lock rebuilds; the others keep serving the
+    stale value meanwhile, or wait briefly for the fresh one if there is none.
+    """
+    cache = _cache()
+    if timeout is None:
+        timeout = getattr(settings, 'PAGES_CACHE_TIMEOUT', 300)
+    version = _group_version(cache, group)
+    key = f'{KEY_PREFIX}:{name}'
+
+    entry = cache.get(key)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+
+    lock_key = f'{key}:lock'
+    if cache.add(lock_key, version, LOCK_TIMEOUT):
+        try:
+            value = builder()
+            cache.set(key, (version, value), timeout)
+        finally:
+            cache.delete(lock_key)
+        return value
+
+    if entry is not None:
+        return entry[1]
+
+    for _ in range(WAIT_ATTEMPTS):
+        time.sleep(WAIT_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+    return builder()
+
+
+def invalidate(group):
+    """Mark every entry of ``group`` stale once the current transaction commits."""
+    transaction.on_commit(lambda: _cache().set(_version_key(group), uuid.uuid4().hex, None))
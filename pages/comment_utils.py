@@ -0,0 +1,67 @@
+from operator import attrgetter
+
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value, Window
+from django.db.models.functions import Coalesce, RowNumber
+
+from .db_utils import join_related
+from .models import Comment
+from .pagination_utils import keyset_paginate
+
+COMMENTS_PER_PAGE = 10
+# Replies rendered with their comment; the rest load on demand
+PREVIEW_REPLIES = 3
+REPLIES_PER_PAGE = 20
+
+
+def _reply_counts():
+    return Coalesce(
+        Subquery(
+            Comment.objects.filter(parent_comment=OuterRef('pk'))
+            .order_by()
+            .values('parent_comment')
+            .annotate(count=Count('pk'))
+            .values('count'),
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    )
+
+
+def load_comment_thread(project, cursor='', per_page=COMMENTS_PER_PAGE, preview_replies=PREVIEW_REPLIES):
+    """
+    Return a ``KeysetPage`` of ``project``'s top-level comments, newest
+    first, in two queries whatever the page holds: one for the comments
+    with their users and reply counts, one for the first ``preview_replies``
+    replies of every comment on the page. Each comment gets
+    ``preview_replies`` (a list) and ``more_replies`` (a count).
+    """
+    page = keyset_paginate(
+        join_related(Comment.objects.filter(project=project, parent_comment=None), 'user')
+        .annotate(reply_count=_reply_counts()),
+        cursor,
+        per_page,
+        count_group=None
+    )
+    comments = {comment.pk: comment for comment in page}
+    for comment in comments.values():
+        comment.preview_replies = []
+
+    if comments and preview_replies:
+        replies = join_related(Comment.objects.filter(parent_comment__in=comments), 'user').annotate(
+            position=Window(RowNumber(), partition_by=F('parent_comment'), order_by=F('pk').asc())
+        ).filter(position__lte=preview_replies).order_by()
+        # Ordered here: sorting the few rows in SQL takes a temporary B-tree
+        for reply in sorted(replies, key=attrgetter('pk')):
+            comments[reply.parent_comment_id].preview_replies.append(reply)
+
+    for comment in comments.values():
+        comment.more_replies = comment.reply_count - len(comment.preview_replies)
+    return page
+
+
+def load_replies(comment, after=0, per_page=REPLIES_PER_PAGE):
+    """Return ``(replies, has_more)``: the next replies to ``comment`` after reply id ``after``, oldest first."""
+    replies = list(
+        join_related(comment.replies.filter(pk__gt=after), 'user').order_by('pk')[:per_page + 1]
+    )
+    return replies[:per_page], len(replies) > per_page
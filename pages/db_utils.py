@@ -0,0 +1,115 @@
+from contextlib import contextmanager
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, router, transaction
+
+# The write-heavy tables, which can live in their own SQLite file so their
+# writes do not queue behind (or hold up) the rest of the site's
+ENGAGEMENT_DATABASE = 'engagement'
+ENGAGEMENT_MODELS = (  # In copy order: reports point at comments
+    'comment', 'report', 'donation', 'rating', 'donorsummary', 'donationrollup',
+)
+# Totals updated in place, so they are rebuilt from the copied donations rather than copied
+DERIVED_ENGAGEMENT_MODELS = ('donorsummary', 'donationrollup')
+
+
+def engagement_db():
+    """
+    The alias holding Donation, Rating, Comment, Report and the donation
+    totals: 'engagement' with PAGES_SPLIT_ENGAGEMENT on, 'default' otherwise. Run
+    ``manage.py split_engagement_db`` before turning the setting on.
+    """
+    return ENGAGEMENT_DATABASE if getattr(settings, 'PAGES_SPLIT_ENGAGEMENT', False) else DEFAULT_DB_ALIAS
+
+
+def is_lock_error(error):
+    """SQLite's "database is locked": another writer held the lock past the busy timeout."""
+    return isinstance(error, OperationalError) and 'locked' in str(error)
+
+
+def is_engagement_model(model):
+    return model._meta.app_label == 'pages' and model._meta.model_name in ENGAGEMENT_MODELS
+
+
+def engagement_models(derived=True):
+    return [
+        apps.get_model('pages', name) for name in ENGAGEMENT_MODELS if derived or name not in DERIVED_ENGAGEMENT_MODELS
+    ]
+
+
+class EngagementRouter:
+    """
+    Sends the engagement models to ``engagement_db()`` and everything else
+    to 'default'. The 'default' database keeps (empty) engagement tables as
+    well, so its migrations and cascades run the same either way; the
+    'engagement' database gets only the engagement tables. Their foreign
+    keys to Project and CustomUser have no database constraint, and
+    ``delete_engagement`` stands in for CASCADE across the two files.
+    """
+
+    def db_for_read(self, model, **hints):
+        # Always answer, so a related object is read from its own database
+        # rather than from the one its instance came from
+        return engagement_db() if is_engagement_model(model) else DEFAULT_DB_ALIAS
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == ENGAGEMENT_DATABASE:
+            # Data migrations (no model_name) backfill tables that are not here
+            return app_label == 'pages' and model_name in ENGAGEMENT_MODELS
+        return None
+
+
+def join_related(queryset, *fields):
+    """
+    ``select_related`` for the relations in ``fields`` that are in the
+    queryset's database and ``prefetch_related`` (one more query each) for
+    those that are not, since a JOIN cannot span two SQLite files. A
+    prefetched relation whose row is missing reads as an
+    ObjectDoesNotExist, which templates render as empty.
+    """
+    joined, prefetched = [], []
+    for name in fields:
+        related = queryset.model._meta.get_field(name).related_model
+        (joined if router.db_for_read(related) == queryset.db else prefetched).append(name)
+    if joined:
+        queryset = queryset.select_related(*joined)
+    if prefetched:
+        queryset = queryset.prefetch_related(*prefetched)
+    return queryset
+
+
+@contextmanager
+def engagement_atomic():
+    """
+    ``transaction.atomic()`` over the engagement database and, inside it,
+    the default one. The default database commits first; should the
+    engagement commit then fail, the Project counters run ahead until
+    ``manage.py rebuild_counters``.
+    """
+    if engagement_db() == DEFAULT_DB_ALIAS:
+        with transaction.atomic():
+            yield
+        return
+    with transaction.atomic(using=ENGAGEMENT_DATABASE), transaction.atomic(using=DEFAULT_DB_ALIAS):
+        yield
+
+
+def delete_engagement(instance):
+    """
+    Delete the engagement rows pointing at ``instance`` (a Project or
+    CustomUser) when they are in the other database, where CASCADE does not
+    reach.
+    """
+    using = engagement_db()
+    if using == DEFAULT_DB_ALIAS:
+        return
+    for model in engagement_models():
+        for field in model._meta.concrete_fields:
+            if field.is_relation and isinstance(instance, field.related_model):
+                model._base_manager.using(using).filter(**{field.name: instance.pk}).delete()
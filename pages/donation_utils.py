@@ -0,0 +1,130 @@
+import random
+import time
+
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, OperationalError, transaction
+from django.db.models import Count, F, Max, Sum
+
+from .db_utils import engagement_db, is_lock_error
+from .models import Donation, DonorSummary, Project
+from .rollup_utils import add_to_rollups
+
+# A donation whose transaction found the database locked is retried this
+# many times, after LOCK_BACKOFF seconds doubled on every attempt (jittered)
+LOCK_RETRIES = 3
+LOCK_BACKOFF = 0.05
+
+
+def record_donation(project_id, donor, amount, message='', idempotency_key=None):
+    """
+    Record a donation and bump the project and donor totals and the donation
+    rollups in one short transaction.
+
+    The project, DonorSummary and DonationRollup rows are incremented in the
+    database (no read-modify-write), so concurrent donations never lose
+    updates, and only the changed columns are written. Returns ``(donation, created)``; ``created`` is False when the
+    same donor already submitted ``idempotency_key``.
+
+    Raises ``Project.DoesNotExist`` if the project is missing or inactive,
+    and the OperationalError when the database stays locked through
+    LOCK_RETRIES retries (or inside the caller's own transaction, which
+    cannot be retried from here).
+    """
+    idempotency_key = idempotency_key or None
+    attempt = 0
+    while True:
+        try:
+            return _record_donation(project_id, donor, amount, message, idempotency_key)
+        except OperationalError as e:
+            nested = any(transaction.get_connection(alias).in_atomic_block for alias in {engagement_db(), DEFAULT_DB_ALIAS})
+            if not is_lock_error(e) or nested or attempt == LOCK_RETRIES:
+                raise
+        time.sleep(LOCK_BACKOFF * 2 ** attempt * random.uniform(0.5, 1))
+        attempt += 1
+
+
+def _record_donation(project_id, donor, amount, message, idempotency_key):
+    # One attempt; a lock error rolls all of it back
+    if idempotency_key:
+        existing = Donation.objects.filter(donor=donor, idempotency_key=idempotency_key).first()
+        if existing:
+            return existing, False
+
+    try:
+        with transaction.atomic(using=engagement_db()):
+            # Written first: a deferred transaction that read before its first
+            # write would take a read lock it cannot upgrade while another
+            # donor's transaction holds one too ("database is locked" at once)
+            donation = Donation.objects.create(
+                project_id=project_id,
+                donor=donor,
+                amount=amount,
+                message=message,
+                idempotency_key=idempotency_key,
+            )
+            new_project = not Donation.objects.filter(donor=donor, project_id=project_id).exclude(pk=donation.pk).exists()
+            count_donation(donation, new_project)
+            # With the engagement tables split out (pages.db_utils) the project
+            # row is in the other database; updating it last, in the inner
+            # transaction, holds that database's write lock the shortest
+            with transaction.atomic(using=DEFAULT_DB_ALIAS):
+                updated = Project.objects.filter(pk=project_id, is_active=True).update(
+                    current_amount=F('current_amount') + amount,
+                    donation_count=F('donation_count') + 1,
+                )
+                if not updated:
+                    raise Project.DoesNotExist
+                category_id = Project.objects.filter(pk=project_id).values_list('category_id', flat=True).get()
+            add_to_rollups(donation, category_id)
+    except IntegrityError:
+        if not idempotency_key:
+            raise
+        # A concurrent submit with the same key won the race; the whole
+        # transaction above was rolled back, so nothing was charged twice
+        return Donation.objects.get(donor=donor, idempotency_key=idempotency_key), False
+
+    return donation, True
+
+
+def count_donation(donation, new_project):
+    """Add ``donation`` to its donor's DonorSummary, creating it on their first donation."""
+    changes = {
+        'total_donated': F('total_donated') + donation.amount,
+        'donation_count': F('donation_count') + 1,
+        'projects_backed': F('projects_backed') + int(new_project),
+        'last_donation_at': donation.created_at,
+    }
+    if DonorSummary.objects.filter(user_id=donation.donor_id).update(**changes):
+        return
+    try:
+        with transaction.atomic(using=engagement_db()):
+            DonorSummary.objects.create(
+                user_id=donation.donor_id,
+                total_donated=donation.amount,
+                donation_count=1,
+                projects_backed=1,
+                last_donation_at=donation.created_at,
+            )
+    except IntegrityError:  # Their other donation created it meanwhile; count on that row
+        DonorSummary.objects.filter(user_id=donation.donor_id).update(**changes)
+
+
+def rebuild_donor_summaries(using=None, batch_size=1000):
+    """Recompute every DonorSummary from the donations in ``using`` (their database by default). Returns the count."""
+    using = using or engagement_db()
+    totals = (
+        Donation.objects.using(using).order_by().values('donor')
+        .annotate(total=Sum('amount'), count=Count('id'), projects=Count('project', distinct=True), last=Max('created_at'))
+    )
+    with transaction.atomic(using=using):
+        DonorSummary.objects.using(using).all().delete()
+        summaries = DonorSummary.objects.using(using).bulk_create(
+            (
+                DonorSummary(
+                    user_id=row['donor'], total_donated=row['total'], donation_count=row['count'],
+                    projects_backed=row['projects'], last_donation_at=row['last'],
+                )
+                for row in totals.iterator()
+            ),
+            batch_size=batch_size,
+        )
+    return len(summaries)
@@ -1,39 +1,114 @@
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
-from django.conf import settings
+import logging
+import re
+from functools import lru_cache
+
+from django.core.exceptions import ImproperlyConfigured
+from django.template.loader import get_template
+from django.utils.html import escape
+
+from .outbox_utils import enqueue_email
+
+logger = logging.getLogger(__name__)
+
+# Subject and the per-message fields of every transactional email. The
+# templates (emails/<name>.html and .txt) may only print these fields as
+# they are: they are rendered once with placeholders, and each message is
+# the cached static text with the escaped field values spliced in.
+EMAILS = {
+    'activation_email': (
+        'تفعيل حسابك - CrowdFund Egypt',
+        ('user.first_name', 'user.last_name', 'activation_link'),
+    ),
+    'password_reset_email': (
+        'إعادة تعيين كلمة المرور - CrowdFund Egypt',
+        ('user.first_name', 'user.last_name', 'reset_link'),
+    ),
+    'welcome_email': (
+        'مرحباً بك في CrowdFund Egypt! 🎉',
+        ('user.first_name', 'user.last_name', 'projects_url'),
+    ),
+}
+
+_SLOT_RE = re.compile('\x00(\\d+)\x00')
+
+
+class EmailShell:
+    """A template pre-rendered into static chunks with numbered field slots between them."""
+
+    def __init__(self, template_name, fields, html):
+        placeholders = {}
+        for index, field in enumerate(fields):
+            *parents, leaf = field.split('.')
+            target = placeholders
+            for part in parents:
+                target = target.setdefault(part, {})
+            target[leaf] = f'\x00{index}\x00'
+
+        parts = _SLOT_RE.split(get_template(template_name).render(placeholders))
+        self.chunks = parts[::2]
+        self.slots = [int(slot) for slot in parts[1::2]]
+        missing = set(range(len(fields))) - set(self.slots)
+        if missing:
+            raise ImproperlyConfigured(
+                f'{template_name} does not print {", ".join(fields[i] for i in sorted(missing))} verbatim'
+            )
+        self.escape = escape if html else str
+
+    def render(self, values):
+        out = [self.chunks[0]]
+        for slot, chunk in zip(self.slots, self.chunks[1:]):
+            out.append(self.escape(values[slot]))
+            out.append(chunk)
+        return ''.join(out)
+
+
+@lru_cache(maxsize=None)
+def get_shells(name):
+    """The cached ``(html, text)`` shells of one email; compiled once per process."""
+    _, fields = EMAILS[name]
+    return (
+        EmailShell(f'emails/{name}.html', fields, html=True),
+        EmailShell(f'emails/{name}.txt', fields, html=False),
+    )
+
+
+def _field_values(fields, context):
+    values = []
+    for field in fields:
+        value = context
+        for part in field.split('.'):
+            value = value[part] if isinstance(value, dict) else getattr(value, part)
+        values.append('' if value is None else str(value))
+    return values
+
+
+def render_emails(name, contexts):
+    """Render ``(subject, text, html)`` for every context, reusing the compiled shells."""
+    subject, fields = EMAILS[name]
+    html_shell, text_shell = get_shells(name)
+    rendered = []
+    for context in contexts:
+        values = _field_values(fields, context)
+        rendered.append((subject, text_shell.render(values), html_shell.render(values)))
+    return rendered
+
+
+def render_email(name, **context):
+    return render_emails(name, [context])[0]
 
 
 def send_activation_email(user, activation_link):
     """
     إرسال رسالة تفعيل الحساب
     """
-    subject = 'تفعيل حسابك - CrowdFund Egypt'
-    
-    # تحضير السياق للقالب
-    context = {
-        'user': user,
-        'activation_link': activation_link,
-    }
-    
-    # تحضير الرسالة HTML
-    html_message = render_to_string('emails/activation_email.html', context)
-    
-    # تحضير الرسالة النصية (بدون HTML)
-    plain_message = strip_tags(html_message)
-    
+    subject, plain_message, html_message = render_email('activation_email', user=user, activation_link=activation_link)
+
+    # Queued; `manage.py send_queued_email` delivers it outside the request
     try:
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[user.email],
-            html_message=html_message,
-            fail_silently=False,
-        )
+        enqueue_email(subject, user.email, plain_message, html_message)
         return True
-    except Exception as e:
-        print(f"Error sending activation email: {e}")
+    except Exception:
+        logger.exception('Error queueing activation email to %s', user.email)
         return False
 
 
@@ -41,32 +116,14 @@ def send_password_reset_email(user, reset_link):
     """
     إرسال رسالة إعادة تعيين كلمة المرور
     """
-    subject = 'إعادة تعيين كلمة المرور - CrowdFund Egypt'
-    
-    # تحضير السياق للقالب
-    context = {
-        'user': user,
-        'reset_link': reset_link,
-    }
-    
-    # تحضير الرسالة HTML
-    html_message = render_to_string('emails/password_reset_email.html', context)
-    
-    # تحضير الرسالة النصية (بدون HTML)
-    plain_message = strip_tags(html_message)
-    
+    subject, plain_message, html_message = render_email('password_reset_email', user=user, reset_link=reset_link)
+
+    # Queued; `manage.py send_queued_email` delivers it outside the request
     try:
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[user.email],
-            html_message=html_message,
-            fail_silently=False,
-        )
+        enqueue_email(subject, user.email, plain_message, html_message)
         return True
-    except Exception as e:
-        print(f"Error sending password reset email: {e}")
+    except Exception:
+        logger.exception('Error queueing password reset email to %s', user.email)
         return False
 
 
@@ -74,71 +131,13 @@ def send_welcome_email(user):
     """
     إرسال رسالة ترحيب بعد تفعيل الحساب
     """
-    subject = 'مرحباً بك في CrowdFund Egypt! 🎉'
-    
     # استخدام رابط نسبي بدلاً من SITE_URL
-    projects_url = "/projects/"
-    
-    html_message = f"""
-    <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-        <div style="background: linear-gradient(135deg, #6D9DC5, #4A90E2); color: white; padding: 30px; text-align: center; border-radius: 10px 10px 0 0;">
-            <h1 style="margin: 0; font-size: 28px;">🎉 مرحباً بك في CrowdFund Egypt!</h1>
-            <p style="margin: 10px 0 0 0; opacity: 0.9;">تم تفعيل حسابك بنجاح</p>
-        </div>
-        
-        <div style="padding: 40px 30px; background: white; border-radius: 0 0 10px 10px;">
-            <h2 style="color: #6D9DC5;">مرحباً {user.first_name} {user.last_name}!</h2>
-            
-            <p style="color: #666; line-height: 1.6;">
-                تم تفعيل حسابك بنجاح في منصة CrowdFund Egypt. يمكنك الآن:
-            </p>
-            
-            <ul style="color: #666; line-height: 1.8;">
-                <li>🚀 إنشاء مشاريع تمويل جماعي جديدة</li>
-                <li>💝 دعم المشاريع المميزة</li>
-                <li>💬 التفاعل مع المجتمع</li>
-                <li>📊 متابعة تقدم المشاريع</li>
-                <li>⭐ تقييم المشاريع والتعليق عليها</li>
-            </ul>
-            
-            <div style="text-align: center; margin: 30px 0;">
-                <a href="{projects_url}" style="display: inline-block; background: linear-gradient(135deg, #6D9DC5, #4A90E2); color: white; text-decoration: none; padding: 15px 40px; border-radius: 50px; font-weight: 600;">
-                    🚀 استكشف المشاريع
-                </a>
-            </div>
-            
-            <div style="background-color: #f8f9fa; border-left: 4px solid #6D9DC5; padding: 20px; border-radius: 5px; margin: 30px 0;">
-                <h3 style="color: #6D9DC5; margin: 0 0 10px 0;">💡 نصائح للبدء:</h3>
-                <p style="margin: 0; color: #666;">
-                    • اكمل ملفك الشخصي لإضافة المزيد من المعلومات<br>
-                    • استكشف المشاريع الموجودة للتعرف على المنصة<br>
-                    • ابدأ بإنشاء مشروعك الأول أو دعم مشروع موجود
-                </p>
-            </div>
-            
-            <p style="color: #666; font-size: 14px; text-align: center;">
-                إذا كان لديك أي أسئلة، لا تتردد في التواصل معنا.
-            </p>
-        </div>
-        
-        <div style="background-color: #f8f9fa; padding: 20px; text-align: center; border-radius: 10px; margin-top: 20px;">
-            <p style="margin: 0; color: #666; font-size: 14px;">© 2024 CrowdFund Egypt. جميع الحقوق محفوظة.</p>
-        </div>
-    </div>
-    """
-    
-    plain_message = strip_tags(html_message)
-    
+    subject, plain_message, html_message = render_email('welcome_email', user=user, projects_url='/projects/')
+
+    # Queued; `manage.py send_queued_email` delivers it outside the request
     try:
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[user.email],
-            html_message=html_message,
-            fail_silently=False,
-        )
+        enqueue_email(subject, user.email, plain_message, html_message)
         return True
-    except Exception as e:
-        print(f"Error sending welcome email: {e}")
+    except Exception:
+        logger.exception('Error queueing welcome email to %s', user.email)
         return False
@@ -0,0 +1,158 @@
+import io
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from PIL import Image, ImageOps
+
+from .storage_utils import content_name, file_digest
+
+# Widths generated for every uploaded image, stored next to the original
+# as "<name>.<kind>-<width>w.<ext>" and offered to browsers with srcset
+PROJECT_IMAGE_RENDITIONS = {
+    'card': (400, 800),
+    'carousel': (800, 1200, 1600),
+}
+# Profile pictures are cropped square
+AVATAR_RENDITIONS = {
+    'avatar': (64, 128, 256),
+}
+
+FORMATS = {
+    'JPEG': ('jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'WEBP': ('webp', {'quality': 80, 'method': 4}),
+}
+
+# Uploads are checked and normalised by ingest_image before they are attached
+INGEST_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp', 'GIF': 'gif'}
+MAX_INGEST_PIXELS = 50_000_000
+MAX_INGEST_DIMENSION = 2560
+
+
+def rendition_format():
+    """The configured IMAGE_RENDITION_FORMAT, 'JPEG' (default) or 'WEBP'."""
+    return getattr(settings, 'IMAGE_RENDITION_FORMAT', 'JPEG').upper()
+
+
+def rendition_name(name, kind, width, image_format=None):
+    stem, _ = os.path.splitext(name)
+    extension, _ = FORMATS[image_format or rendition_format()]
+    return f'{stem}.{kind}-{width}w.{extension}'
+
+
+def rendition_url(name, kind, width):
+    return default_storage.url(rendition_name(name, kind, width))
+
+
+def srcset(name, kind, renditions):
+    return ', '.join(f'{rendition_url(name, kind, width)} {width}w' for width in renditions[kind])
+
+
+def resize_to_targets(image, targets, image_format):
+    """Return ``[(name, bytes)]`` for every ``(name, width, square)`` target of a decoded image."""
+    _, options = FORMATS[image_format]
+    if image_format == 'JPEG' or image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if image_format == 'WEBP' and image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+
+    results = []
+    for name, width, square in targets:
+        if square:
+            size = min(width, *image.size)
+            rendition = ImageOps.fit(image, (size, size), Image.LANCZOS)
+        else:
+            rendition = image.copy()
+            rendition.thumbnail((width, width * 4), Image.LANCZOS)  # Never upscales
+        buffer = io.BytesIO()
+        rendition.save(buffer, image_format, **options)
+        results.append((name, buffer.getvalue()))
+    return results
+
+
+def render_renditions(source, targets, image_format):
+    """
+    Decode ``source`` (a path or file object) once and return ``[(name, bytes)]``
+    for every ``(name, width, square)`` target. Pure Pillow, so it can run
+    in a worker process.
+    """
+    widest = max(width for _, width, _ in targets)
+    with Image.open(source) as image:
+        # Let the JPEG decoder downscale by a power of two while reading
+        image.draft('RGB', (widest, widest))
+        return resize_to_targets(ImageOps.exif_transpose(image), targets, image_format)
+
+
+class InvalidImage(Exception):
+    pass
+
+
+def ingest_image(source, directory, renditions, square, image_format):
+    """
+    Validate an upload and return ``[(name, bytes)]``: the upload re-encoded
+    (upright, at most MAX_INGEST_DIMENSION, without EXIF or other metadata)
+    under its content name in ``directory``, followed by its renditions, all
+    from one decode. Pure Pillow, so it can run in a worker process.
+    """
+    try:
+        with Image.open(source) as image:
+            if image.format not in INGEST_FORMATS:
+                raise InvalidImage(f'Unsupported image format {image.format}.')
+            if image.width * image.height > MAX_INGEST_PIXELS:
+                raise InvalidImage(f'Image is too large ({image.width}x{image.height}).')
+            image.draft('RGB', (MAX_INGEST_DIMENSION, MAX_INGEST_DIMENSION))
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((MAX_INGEST_DIMENSION, MAX_INGEST_DIMENSION), Image.LANCZOS)
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+        raise InvalidImage(f'Not a valid image: {e}') from e
+
+    # Transparency survives as PNG, everything else becomes a JPEG
+    original_format = 'PNG' if image.mode in ('RGBA', 'LA') or 'transparency' in image.info else 'JPEG'
+    if original_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    elif original_format == 'PNG' and image.mode != 'RGBA':
+        image = image.convert('RGBA')
+    buffer = io.BytesIO()
+    # Only pixels are written: Pillow drops EXIF, GPS and comments unless asked to keep them
+    image.save(buffer, original_format, **({'quality': 90, 'optimize': True} if original_format == 'JPEG' else {}))
+    data = buffer.getvalue()
+    # Named like ContentAddressedStorage would, so renditions can be named now
+    digest, _ = file_digest([data])
+    name = content_name(directory, digest, f'.{INGEST_FORMATS[original_format]}')
+
+    return [(name, data)] + resize_to_targets(
+        image, rendition_targets(name, renditions, square, image_format), image_format
+    )
+
+
+def rendition_targets(name, renditions, square, image_format=None):
+    return [
+        (rendition_name(name, kind, width, image_format), width, square)
+        for kind, widths in renditions.items()
+        for width in widths
+    ]
+
+
+def rendition_job(name, renditions, square, storage=default_storage):
+    """Arguments for ``render_renditions`` for the stored file ``name``."""
+    try:
+        source = storage.path(name)
+    except NotImplementedError:  # Remote storage: ship the bytes instead
+        with storage.open(name, 'rb') as f:
+            source = io.BytesIO(f.read())
+    return source, rendition_targets(name, renditions, square), rendition_format()
+
+
+def save_renditions(results, storage=default_storage):
+    for name, data in results:
+        if storage.exists(name):
+            storage.delete(name)
+        storage.save(name, ContentFile(data))
+
+
+def generate_project_image_renditions(project_image):
+    save_renditions(render_renditions(*rendition_job(project_image.image.name, PROJECT_IMAGE_RENDITIONS, False)))
+
+
+def generate_avatar_renditions(user):
+    save_renditions(render_renditions(*rendition_job(user.profile_picture.name, AVATAR_RENDITIONS, True)))
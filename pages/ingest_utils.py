@@ -0,0 +1,204 @@
+import io
+import logging
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .cache_utils import invalidate
+from .image_utils import (
+    AVATAR_RENDITIONS, PROJECT_IMAGE_RENDITIONS, InvalidImage, ingest_image, rendition_format, save_renditions
+)
+from .models import CustomUser, ProjectImage, StagedImage
+
+logger = logging.getLogger(__name__)
+
+CLAIM_LEASE = timedelta(minutes=10)
+BATCH_SIZE = 50
+
+# Where each kind of upload ends up and which renditions it gets
+TARGETS = {
+    'project_image': ('project_images', PROJECT_IMAGE_RENDITIONS, False),
+    'profile_picture': ('profile_pics', AVATAR_RENDITIONS, True),
+}
+
+_pool = None
+_pool_lock = threading.Lock()
+# One thread per web process feeds the pool, so requests never wait on it
+_dispatcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix='image-ingest')
+
+
+def ingest_mode():
+    """
+    IMAGE_INGEST_MODE: 'background' (default) processes uploads in a pool
+    owned by the web process once the request commits, 'queue' leaves them
+    for ``manage.py process_staged_images`` and 'inline' processes them
+    before the response, as uploads used to be.
+    """
+    return getattr(settings, 'IMAGE_INGEST_MODE', 'background')
+
+
+def stage_upload(uploaded_file, target, user, project=None):
+    """
+    Store an upload as-is under staging/ and queue it. Django has already
+    streamed it to a temporary file in chunks; this is one file copy.
+    """
+    staged = StagedImage(target=target, user=user, project=project)
+    staged.file.save(f'{uuid.uuid4().hex}{os.path.splitext(uploaded_file.name)[1][:10]}', uploaded_file, save=False)
+    staged.save()
+    return staged
+
+
+def schedule_ingest():
+    """Process the staged uploads according to ``ingest_mode()``."""
+    mode = ingest_mode()
+    if mode == 'inline':
+        process_staged_images(workers=0)
+    elif mode == 'background':
+        transaction.on_commit(lambda: _dispatcher.submit(_drain_in_background))
+
+
+def schedule_renditions(generate):
+    """
+    Run ``generate()``, which renders the renditions of a file saved outside
+    the upload path (the admin, a shell), once the transaction commits: on
+    the ingest thread in 'background' mode, before the response in
+    'inline' mode. In 'queue' mode ``manage.py generate_renditions`` picks
+    the file up.
+    """
+    mode = ingest_mode()
+    if mode == 'inline':
+        transaction.on_commit(generate)
+    elif mode == 'background':
+        transaction.on_commit(lambda: _dispatcher.submit(_render_in_background, generate))
+
+
+def _render_in_background(generate):
+    try:
+        generate()
+    finally:
+        connection.close()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Spawned rather than forked: the web process has threads running
+            _pool = ProcessPoolExecutor(
+                max_workers=getattr(settings, 'IMAGE_INGEST_WORKERS', min(4, os.cpu_count() or 1)),
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _pool
+
+
+def _drain_in_background():
+    try:
+        process_staged_images(pool=_get_pool())
+    except Exception:
+        logger.exception('Error processing staged images')
+    finally:
+        connection.close()
+
+
+def claim_staged(worker_id, limit=BATCH_SIZE):
+    """Claim up to ``limit`` pending uploads with a single UPDATE, like pages.outbox_utils.claim_batch."""
+    now = timezone.now()
+    due = StagedImage.objects.filter(
+        Q(status='pending') | Q(status='processing', claimed_until__lt=now)
+    ).order_by('pk').values('pk')[:limit]
+    claimed = StagedImage.objects.filter(pk__in=due).update(
+        status='processing', claimed_by=worker_id, claimed_until=now + CLAIM_LEASE
+    )
+    if not claimed:
+        return []
+    return list(StagedImage.objects.filter(status='processing', claimed_by=worker_id).order_by('pk'))
+
+
+def _job(staged):
+    directory, renditions, square = TARGETS[staged.target]
+    try:
+        source = staged.file.path
+    except NotImplementedError:  # Remote storage: ship the bytes instead
+        with staged.file.open('rb') as f:
+            source = io.BytesIO(f.read())
+    return source, directory, renditions, square, rendition_format()
+
+
+def _attach(staged, results):
+    (name, data), renditions = results[0], results[1:]
+    if staged.target == 'project_image':
+        field = ProjectImage._meta.get_field('image')
+    else:
+        field = CustomUser._meta.get_field('profile_picture')
+    # The same content may be stored already, renditions included
+    name = field.storage.save(name, ContentFile(data))
+    save_renditions([(rendition, data) for rendition, data in renditions if not default_storage.exists(rendition)])
+
+    if staged.target == 'project_image':
+        ProjectImage.objects.create(project_id=staged.project_id, image=name, has_renditions=True)
+    else:
+        previous = CustomUser.objects.filter(pk=staged.user_id).values_list('profile_picture', flat=True).first()
+        CustomUser.objects.filter(pk=staged.user_id).update(profile_picture=name, profile_picture_renditions=name)
+        if previous:
+            field.storage.delete(previous)
+
+
+def process_staged_images(workers=None, pool=None, limit=BATCH_SIZE):
+    """
+    Validate, downscale and strip every pending upload, attach the results
+    and return ``(attached, failed)``. Decoding runs in ``pool``, in a new
+    pool of ``workers`` processes, or in this process with ``workers=0``.
+    Images are attached in upload order, so a project's first image stays
+    its cover.
+    """
+    worker_id = uuid.uuid4().hex
+    attached = failed = 0
+    own_pool = None
+    if pool is None and workers != 0:
+        pool = own_pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        while True:
+            batch = claim_staged(worker_id, limit)
+            if not batch:
+                break
+            # Submit the whole batch first so the pool decodes in parallel
+            outcomes = []
+            for staged in batch:
+                try:
+                    job = _job(staged)
+                    outcomes.append(ingest_image(*job) if pool is None else pool.submit(ingest_image, *job))
+                except (InvalidImage, OSError) as e:
+                    outcomes.append(e)
+
+            for staged, outcome in zip(batch, outcomes):
+                try:
+                    if isinstance(outcome, Future):
+                        outcome = outcome.result()
+                    if isinstance(outcome, Exception):
+                        raise outcome
+                    _attach(staged, outcome)
+                except Exception as e:
+                    failed += 1
+                    StagedImage.objects.filter(pk=staged.pk).update(status='failed', error=str(e))
+                else:
+                    attached += 1
+                    staged.delete()
+                staged.file.delete(save=False)
+    finally:
+        if own_pool is not None:
+            own_pool.shutdown()
+
+    if attached:
+        invalidate('projects')
+    return attached, failed
+
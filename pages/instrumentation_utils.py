@@ -0,0 +1,176 @@
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.template import base as template_base
+from django.template.backends import django as django_backend
+
+logger = logging.getLogger('pages.instrumentation')
+
+# "IN (%s, %s, %s)" has one shape whatever the list length
+IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+PROJECT_DIR = str(settings.BASE_DIR)
+_current = threading.local()
+
+
+class BudgetExceeded(AssertionError):
+    """A request went over its PAGES_REQUEST_BUDGETS entry with PAGES_BUDGET_ACTION = 'raise'."""
+
+
+def instrumentation_enabled():
+    return getattr(settings, 'PAGES_INSTRUMENTATION', False)
+
+
+def request_budget(url_name):
+    """
+    PAGES_REQUEST_BUDGETS maps URL names to limits on ``queries``,
+    ``sql_ms``, ``template_ms``, ``wall_ms`` and ``repeated_queries`` (the
+    N+1 groups found); the '*' entry applies to every URL name, and a URL
+    name's own entry overrides its limits.
+    """
+    budgets = getattr(settings, 'PAGES_REQUEST_BUDGETS', {})
+    return {**budgets.get('*', {}), **budgets.get(url_name, {})}
+
+
+def query_shape(sql):
+    return IN_LIST_RE.sub('IN (...)', sql)
+
+
+def query_origin():
+    """
+    Where the running query comes from: the innermost template node being
+    rendered (``template.html:12``), else the innermost frame of this
+    project's own code (``pages/views.py:141``).
+    """
+    frame = sys._getframe(2)
+    code_line = None
+    while frame is not None:
+        if frame.f_code is template_base.Node.render_annotated.__code__:
+            node = frame.f_locals['self']
+            token = getattr(node, 'token', None)
+            origin = getattr(node, 'origin', None)
+            if token is not None and origin is not None:
+                return f'{origin.template_name}:{token.lineno}'
+        elif code_line is None:
+            filename = frame.f_code.co_filename
+            if filename.startswith(PROJECT_DIR) and 'site-packages' not in filename and filename != __file__:
+                code_line = f'{os.path.relpath(filename, PROJECT_DIR)}:{frame.f_lineno}'
+        frame = frame.f_back
+    return code_line or '?'
+
+
+class RequestRecorder:
+    """Queries, SQL time and template render time of one request, from every database connection."""
+
+    def __init__(self):
+        self.queries = []  # (shape, alias, ms, origin)
+        self.template_ms = 0.0
+        self.template_depth = 0
+
+    def wrapper(self, alias):
+        def record(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                ms = (time.perf_counter() - start) * 1000
+                self.queries.append((query_shape(sql), alias, ms, query_origin()))
+        return record
+
+    def repeated_queries(self, threshold):
+        """Query shapes run at least ``threshold`` times, most frequent first (likely N+1)."""
+        groups = defaultdict(list)
+        for shape, alias, ms, origin in self.queries:
+            groups[(alias, shape)].append((ms, origin))
+        repeated = [
+            {
+                'sql': shape,
+                'database': alias,
+                'count': len(runs),
+                'ms': round(sum(ms for ms, _ in runs), 2),
+                'origins': sorted({origin for _, origin in runs}),
+            }
+            for (alias, shape), runs in groups.items()
+            if len(runs) >= threshold
+        ]
+        return sorted(repeated, key=lambda group: -group['count'])
+
+    def summary(self, url_name, method, status, wall_ms):
+        threshold = getattr(settings, 'PAGES_N_PLUS_ONE_THRESHOLD', 3)
+        return {
+            'url_name': url_name,
+            'method': method,
+            'status': status,
+            'wall_ms': round(wall_ms, 2),
+            'queries': len(self.queries),
+            'sql_ms': round(sum(ms for _, _, ms, _ in self.queries), 2),
+            'template_ms': round(self.template_ms, 2),
+            'repeated_queries': self.repeated_queries(threshold),
+        }
+
+
+def over_budget(record):
+    """``{measure: (value, limit)}`` for every limit of the request's budget it went over."""
+    exceeded = {}
+    for measure, limit in request_budget(record['url_name']).items():
+        value = record[measure]
+        if measure == 'repeated_queries':
+            value = len(value)
+        if value > limit:
+            exceeded[measure] = (value, limit)
+    return exceeded
+
+
+class record_request:
+    """Context manager collecting a RequestRecorder for the code it wraps."""
+
+    def __enter__(self):
+        self.recorder = RequestRecorder()
+        self.stack = ExitStack()
+        for alias in connections:
+            # Connections opened later in the request are wrapped too: the
+            # wrapper list lives on the (thread-local) connection object
+            self.stack.enter_context(connections[alias].execute_wrapper(self.recorder.wrapper(alias)))
+        _current.recorder = self.recorder
+        return self.recorder
+
+    def __exit__(self, *exc_info):
+        _current.recorder = None
+        self.stack.close()
+
+
+def _timed_render(render):
+    def timed(self, *args, **kwargs):
+        recorder = getattr(_current, 'recorder', None)
+        if recorder is None:
+            return render(self, *args, **kwargs)
+        # Only the outermost render counts; render_to_string inside a view's
+        # template would be counted twice otherwise
+        recorder.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return render(self, *args, **kwargs)
+        finally:
+            recorder.template_depth -= 1
+            if not recorder.template_depth:
+                recorder.template_ms += (time.perf_counter() - start) * 1000
+    timed.instrumented = True
+    return timed
+
+
+def install_template_timer():
+    """Time django.template renders (once per process; a no-op without a recorder)."""
+    if not getattr(django_backend.Template.render, 'instrumented', False):
+        django_backend.Template.render = _timed_render(django_backend.Template.render)
+
+
+def write_record(record):
+    logger.info(json.dumps(record))
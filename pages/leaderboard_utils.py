@@ -0,0 +1,68 @@
+from django.conf import settings
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Cast
+
+from .models import LeaderboardEntry, Project
+
+
+def _prior():
+    return (
+        getattr(settings, 'LEADERBOARD_PRIOR_MEAN', 3.0),
+        getattr(settings, 'LEADERBOARD_PRIOR_VOTES', 5),
+    )
+
+
+def bayesian_score(rating_sum, rating_count):
+    prior_mean, prior_votes = _prior()
+    return (prior_mean * prior_votes + rating_sum) / (prior_votes + rating_count)
+
+
+def update_project_rank(project_id):
+    """Recompute one project's entry from its rating counters."""
+    project = Project.objects.filter(pk=project_id).values('is_active', 'rating_sum', 'rating_count').first()
+    if project is None or not project['is_active'] or project['rating_count'] == 0:
+        LeaderboardEntry.objects.filter(project_id=project_id).delete()
+        return
+    LeaderboardEntry.objects.update_or_create(
+        project_id=project_id,
+        defaults={
+            'score': bayesian_score(project['rating_sum'], project['rating_count']),
+            'average': project['rating_sum'] / project['rating_count'],
+            'rating_count': project['rating_count'],
+        }
+    )
+
+
+def rebuild_leaderboard():
+    """Recreate every entry from the project rating counters. Returns the entry count."""
+    prior_mean, prior_votes = _prior()
+    rating_sum = Cast('rating_sum', FloatField())
+    rated = Project.objects.filter(is_active=True, rating_count__gt=0).annotate(
+        bayesian=(Value(prior_mean * prior_votes) + rating_sum) / (Value(float(prior_votes)) + F('rating_count')),
+        mean=rating_sum / F('rating_count'),
+    ).values_list('pk', 'bayesian', 'mean', 'rating_count')
+
+    LeaderboardEntry.objects.all().delete()
+    entries = LeaderboardEntry.objects.bulk_create(
+        (
+            LeaderboardEntry(project_id=pk, score=score, average=average, rating_count=count)
+            for pk, score, average, count in rated.iterator()
+        ),
+        batch_size=1000,
+    )
+    return len(entries)
+
+
+def top_rated_projects():
+    """
+    Active project cards by Bayesian score, read in leaderboard index order.
+    Only active projects have an entry (update_project_rank drops it on
+    deactivation), so there is no is_active filter: with one SQLite would
+    drive the query from the project index and sort every match instead.
+    """
+    return Project.objects.for_cards().filter(
+        leaderboard_entry__isnull=False
+    ).annotate(
+        avg_rating=F('leaderboard_entry__average'),
+        leaderboard_score=F('leaderboard_entry__score')
+    ).order_by('-leaderboard_entry__score', '-leaderboard_entry__project')
@@ -0,0 +1,137 @@
+import os
+import shutil
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from pages.models import CustomUser, ProjectImage, StoredFile
+from pages.storage_utils import content_name_for, content_storage, file_digest
+
+# Every field stored with ContentAddressedStorage
+FIELDS = [(ProjectImage, 'image'), (CustomUser, 'profile_picture')]
+
+
+def derived_files(storage, name):
+    """Files next to ``name`` derived from it, such as its renditions ("<stem>.card-400w.jpg")."""
+    directory, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    try:
+        siblings = storage.listdir(directory)[1]
+    except FileNotFoundError:
+        return []
+    return [sibling for sibling in siblings if sibling != filename and sibling.startswith(f'{stem}.')]
+
+
+def link_or_copy(source, destination):
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+
+class Command(BaseCommand):
+    help = (
+        'Move every referenced upload to its content-hash name, keeping identical files once, '
+        'point the rows at it, recount StoredFile references and report the bytes reclaimed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be reclaimed without changing anything.')
+        parser.add_argument('--delete-orphans', action='store_true', help='Also delete upload files no row refers to.')
+
+    def handle(self, *args, **options):
+        storage = content_storage
+        references = Counter()
+        for model, field in FIELDS:
+            for name in model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True}).values_list(field, flat=True):
+                references[name] += 1
+
+        # Old name -> content name, for the file and everything derived from it
+        renames = {}
+        missing = 0
+        for name in references:
+            path = storage.path(name)
+            if not os.path.exists(path):
+                self.stderr.write(f'Missing file: {name}')
+                missing += 1
+                continue
+            with storage.open(name, 'rb') as f:
+                digest, _ = file_digest(f.chunks())
+            directory = os.path.dirname(name)
+            target = content_name_for(name, digest)
+            renames[name] = target
+            target_stem = os.path.splitext(os.path.basename(target))[0]
+            stem = os.path.splitext(os.path.basename(name))[0]
+            for sibling in derived_files(storage, name):
+                renames.setdefault(f'{directory}/{sibling}', f'{os.path.dirname(target)}/{target_stem}{sibling[len(stem):]}')
+
+        before = sum(os.path.getsize(storage.path(name)) for name in renames)
+        kept = {}
+        for old, new in renames.items():
+            kept.setdefault(new, old)
+        after = sum(os.path.getsize(storage.path(old)) for old in kept.values())
+        moved = sum(1 for old, new in renames.items() if old != new)
+        derived = len(renames) - (len(references) - missing)
+
+        counts = Counter()
+        for name, count in references.items():
+            counts[renames.get(name, name)] += count
+
+        orphans = self.find_orphans(storage, set(renames) | set(renames.values()))
+        orphan_bytes = sum(os.path.getsize(storage.path(name)) for name in orphans)
+
+        if not options['dry_run']:
+            # New names are linked before rows point at them, and old names
+            # only go once no row does: an interrupted run loses nothing
+            for old, new in renames.items():
+                if old != new and not storage.exists(new):
+                    link_or_copy(storage.path(old), storage.path(new))
+
+            with transaction.atomic():
+                for name, new in renames.items():
+                    if name == new or name not in references:
+                        continue
+                    for model, field in FIELDS:
+                        model.objects.filter(**{field: name}).update(**{field: new})
+                    CustomUser.objects.filter(profile_picture_renditions=name).update(profile_picture_renditions=new)
+                for name, count in counts.items():
+                    if name in kept:
+                        StoredFile.objects.update_or_create(
+                            name=name, defaults={'size': os.path.getsize(storage.path(name)), 'references': count}
+                        )
+                # Rows for files nothing refers to any more
+                StoredFile.objects.exclude(name__in=list(counts)).delete()
+
+            for old, new in renames.items():
+                if old != new:
+                    os.remove(storage.path(old))
+            if options['delete_orphans']:
+                for name in orphans:
+                    os.remove(storage.path(name))
+
+        prefix = 'Would reclaim' if options['dry_run'] else 'Reclaimed'
+        reclaimed = before - after + (orphan_bytes if options['delete_orphans'] else 0)
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix} {reclaimed / 1e6:.2f} MB: {len(references) - missing} referenced uploads and {derived} '
+            f'derived files ({before / 1e6:.2f} MB) are {len(kept)} distinct files ({after / 1e6:.2f} MB); '
+            f'{moved} renamed to content names.'
+        ))
+        if missing:
+            self.stdout.write(self.style.WARNING(f'{missing} referenced files are missing.'))
+        if orphans:
+            action = 'deleted' if options['delete_orphans'] and not options['dry_run'] else 'left in place (--delete-orphans removes them)'
+            self.stdout.write(f'{len(orphans)} files ({orphan_bytes / 1e6:.2f} MB) no row refers to, {action}.')
+
+    def find_orphans(self, storage, accounted):
+        orphans = []
+        for model, field in FIELDS:
+            upload_to = model._meta.get_field(field).upload_to.strip('/')
+            root = storage.path(upload_to)
+            for directory, _, filenames in os.walk(root):
+                for filename in filenames:
+                    name = os.path.relpath(os.path.join(directory, filename), storage.location).replace(os.sep, '/')
+                    if name not in accounted and not filename.startswith('.upload-'):
+                        orphans.append(name)
+        return orphans
@@ -0,0 +1,71 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+
+from pages.image_utils import (
+    AVATAR_RENDITIONS, PROJECT_IMAGE_RENDITIONS, render_renditions, rendition_job, save_renditions
+)
+from pages.models import CustomUser, ProjectImage
+
+
+class Command(BaseCommand):
+    help = 'Generate missing card, carousel and avatar renditions for existing media with a process pool.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Decoding processes.')
+        parser.add_argument('--force', action='store_true', help='Regenerate renditions that already exist.')
+
+    def handle(self, *args, **options):
+        images = ProjectImage.objects.exclude(image='')
+        users = CustomUser.objects.exclude(profile_picture='').exclude(profile_picture=None)
+        if not options['force']:
+            images = images.filter(has_renditions=False)
+        jobs = [
+            ('image', pk, name, PROJECT_IMAGE_RENDITIONS, False)
+            for pk, name in images.values_list('pk', 'image')
+        ] + [
+            ('avatar', pk, name, AVATAR_RENDITIONS, True)
+            for pk, name, done in users.values_list('pk', 'profile_picture', 'profile_picture_renditions')
+            if options['force'] or done != name
+        ]
+        if not jobs:
+            self.stdout.write(self.style.SUCCESS('All renditions are up to date.'))
+            return
+
+        start = time.perf_counter()
+        done, failed, written = [], 0, 0
+        # Decoding and resizing run in the pool; the parent only writes files
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            futures = {}
+            for kind, pk, name, renditions, square in jobs:
+                try:
+                    job = rendition_job(name, renditions, square)
+                except OSError as e:
+                    self.stderr.write(f'{name}: {e}')
+                    failed += 1
+                    continue
+                futures[pool.submit(render_renditions, *job)] = (kind, pk, name)
+            for future in as_completed(futures):
+                kind, pk, name = futures[future]
+                try:
+                    results = future.result()
+                except Exception as e:
+                    self.stderr.write(f'{name}: {e}')
+                    failed += 1
+                    continue
+                save_renditions(results)
+                written += sum(len(data) for _, data in results)
+                done.append((kind, pk, name))
+
+        ProjectImage.objects.filter(pk__in=[pk for kind, pk, _ in done if kind == 'image']).update(has_renditions=True)
+        for kind, pk, name in done:
+            if kind == 'avatar':
+                CustomUser.objects.filter(pk=pk).update(profile_picture_renditions=name)
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated renditions for {len(done)} files ({written / 1e6:.1f} MB) in {elapsed:.1f}s'
+            f'{f", {failed} failed" if failed else ""}.'
+        ))
@@ -0,0 +1,237 @@
+import csv
+import json
+import os
+import re
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import URLValidator, validate_email
+from django.db import IntegrityError, transaction
+from django.urls import reverse
+from django.utils.dateparse import parse_date
+
+from pages.email_utils import render_emails
+from pages.models import EGYPTIAN_PHONE_REGEX, CustomUser
+from pages.outbox_utils import enqueue_emails
+from pages.token_utils import make_tokens
+
+REQUIRED_FIELDS = ('email', 'first_name', 'last_name', 'mobile_phone')
+OPTIONAL_FIELDS = ('birthdate', 'country', 'facebook_profile')
+PHONE_RE = re.compile(EGYPTIAN_PHONE_REGEX)
+validate_url = URLValidator()
+
+
+def read_rows(stream, file_format):
+    """Yield ``(line number, dict)`` from a CSV (with a header row) or JSON Lines stream."""
+    if file_format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(stream, 1):
+        if line.strip():
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_number, row if isinstance(row, dict) else None
+
+
+def hash_passwords(passwords, pool, workers):
+    """``make_password`` for every password (None gives an unusable one), in the pool when there is one."""
+    if pool is None:
+        return [make_password(password) for password in passwords]
+    return list(pool.map(make_password, passwords, chunksize=max(1, len(passwords) // (workers * 4))))
+
+
+class Command(BaseCommand):
+    help = (
+        'Create accounts in bulk from a CSV or JSON Lines file with the columns email, first_name, last_name, '
+        'mobile_phone and optionally password, birthdate, country and facebook_profile.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import, or - for standard input.')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Users validated, hashed and inserted together.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Password hashing processes; 0 hashes in this process.')
+        parser.add_argument('--active', action='store_true', help='Create active accounts and send no activation email.')
+        parser.add_argument('--dry-run', action='store_true', help='Validate only.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        if path == '-':
+            stream = sys.stdin
+        else:
+            try:
+                stream = open(path, newline='', encoding='utf-8-sig')
+            except OSError as e:
+                raise CommandError(e)
+
+        self.skipped = Counter()
+        self.seen_emails, self.seen_phones = set(), set()
+        created = emails = 0
+        hashing = 0.0
+        start = time.perf_counter()
+        pool = ProcessPoolExecutor(max_workers=options['workers']) if options['workers'] else None
+        rows = read_rows(stream, file_format)
+        try:
+            while True:
+                rows_read = list(islice(rows, options['batch_size']))
+                if not rows_read:
+                    break
+                batch = self.validate(rows_read)
+                if not batch or options['dry_run']:
+                    created += len(batch)
+                    continue
+
+                hash_start = time.perf_counter()
+                passwords = hash_passwords([row.get('password') or None for _, row in batch], pool, options['workers'])
+                hashing += time.perf_counter() - hash_start
+                users = [
+                    (line_number, self.build_user(row, password, options['active']))
+                    for (line_number, row), password in zip(batch, passwords)
+                ]
+                saved, sent = self.save(users, not options['active'])
+                created += saved
+                emails += sent
+        finally:
+            if pool is not None:
+                pool.shutdown()
+            if stream is not sys.stdin:
+                stream.close()
+
+        elapsed = time.perf_counter() - start
+        verb = 'Validated' if options['dry_run'] else 'Created'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {created} users in {elapsed:.1f}s ({created / elapsed if elapsed else 0:.0f} users/s'
+            f'{f", {hashing:.1f}s hashing" if hashing else ""}); {emails} activation emails queued.'
+        ))
+        if self.skipped:
+            self.stdout.write(self.style.WARNING(
+                f'Skipped {sum(self.skipped.values())}: '
+                + ', '.join(f'{count} {reason}' for reason, count in self.skipped.most_common())
+            ))
+
+    def skip(self, line_number, reason, detail=''):
+        self.skipped[reason] += 1
+        self.stderr.write(f'Line {line_number}: {reason}{f" ({detail})" if detail else ""}')
+
+    def validate(self, rows):
+        """The valid, new rows of one batch; uniqueness is checked with one query per column."""
+        candidates = []
+        for line_number, row in rows:
+            if row is None:
+                self.skip(line_number, 'unreadable row')
+                continue
+            row = {key.strip(): str(value).strip() for key, value in row.items() if key and value is not None}
+            missing = [field for field in REQUIRED_FIELDS if not row.get(field)]
+            if missing:
+                self.skip(line_number, 'missing fields', ', '.join(missing))
+                continue
+            row['email'] = CustomUser.objects.normalize_email(row['email'])
+            try:
+                validate_email(row['email'])
+            except ValidationError:
+                self.skip(line_number, 'invalid email', row['email'])
+                continue
+            if not PHONE_RE.match(row['mobile_phone']):
+                self.skip(line_number, 'invalid mobile phone', row['mobile_phone'])
+                continue
+            invalid = self.invalid_optional_field(row)
+            if invalid:
+                self.skip(line_number, f'invalid {invalid}', row[invalid])
+                continue
+            if row['email'].lower() in self.seen_emails or row['mobile_phone'] in self.seen_phones:
+                self.skip(line_number, 'duplicate in file', row['email'])
+                continue
+            self.seen_emails.add(row['email'].lower())
+            self.seen_phones.add(row['mobile_phone'])
+            candidates.append((line_number, row))
+        return self.exclude_existing(candidates)
+
+    def invalid_optional_field(self, row):
+        """The first optional column of ``row`` that would not save, if any; birthdate is parsed in place."""
+        for field in OPTIONAL_FIELDS:
+            value = row.get(field)
+            if not value:
+                continue
+            if len(value) > (CustomUser._meta.get_field(field).max_length or len(value)):
+                return field
+            if field == 'birthdate':
+                try:
+                    birthdate = parse_date(value)
+                except ValueError:  # Well formed but not a real date
+                    birthdate = None
+                if birthdate is None:
+                    return field
+                row[field] = birthdate
+            elif field == 'facebook_profile':
+                try:
+                    validate_url(value)
+                except ValidationError:
+                    return field
+        return None
+
+    def exclude_existing(self, candidates):
+        emails = [row['email'] for _, row in candidates]
+        phones = [row['mobile_phone'] for _, row in candidates]
+        taken_emails = set(CustomUser.objects.filter(email__in=emails).values_list('email', flat=True))
+        taken_emails |= set(CustomUser.objects.filter(username__in=emails).values_list('username', flat=True))
+        taken_phones = set(CustomUser.objects.filter(mobile_phone__in=phones).values_list('mobile_phone', flat=True))
+        batch = []
+        for line_number, row in candidates:
+            if row['email'] in taken_emails:
+                self.skip(line_number, 'email already registered', row['email'])
+            elif row['mobile_phone'] in taken_phones:
+                self.skip(line_number, 'mobile phone already registered', row['mobile_phone'])
+            else:
+                batch.append((line_number, row))
+        return batch
+
+    def build_user(self, row, password, active):
+        return CustomUser(
+            username=row['email'],
+            email=row['email'],
+            first_name=row['first_name'],
+            last_name=row['last_name'],
+            mobile_phone=row['mobile_phone'],
+            password=password,
+            is_active=active,
+            **{field: row[field] for field in OPTIONAL_FIELDS if row.get(field)}
+        )
+
+    def save(self, numbered_users, send_activation):
+        """Insert one batch with its activation emails; return how many users were created and emails queued."""
+        try:
+            with transaction.atomic():
+                users = CustomUser.objects.bulk_create([user for _, user in numbered_users])
+                if not send_activation:
+                    return len(users), 0
+                tokens = make_tokens(users, 'activation')
+                contexts = [
+                    {'user': user, 'activation_link': f"{settings.SITE_URL}{reverse('activate', args=[token])}"}
+                    for user, token in zip(users, tokens)
+                ]
+                rendered = render_emails('activation_email', contexts)
+                enqueue_emails([
+                    (subject, user.email, text, html) for user, (subject, text, html) in zip(users, rendered)
+                ])
+                return len(users), len(users)
+        except IntegrityError:
+            # Someone registered one of these meanwhile: drop the clashes and retry
+            remaining = self.exclude_existing([
+                (line_number, {'email': user.email, 'mobile_phone': user.mobile_phone, 'user': user})
+                for line_number, user in numbered_users
+            ])
+            if len(remaining) == len(numbered_users):
+                raise
+            return self.save([(line_number, row['user']) for line_number, row in remaining], send_activation)
@@ -0,0 +1,33 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from pages.ingest_utils import BATCH_SIZE, process_staged_images
+
+
+class Command(BaseCommand):
+    help = 'Validate, shrink and attach staged project images and profile pictures with a process pool.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Decoding processes; 0 decodes in this process.')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Uploads claimed per round trip.')
+        parser.add_argument('--loop', action='store_true', help='Keep polling instead of exiting once drained.')
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds between polls with --loop.')
+
+    def handle(self, *args, **options):
+        while True:
+            start = time.perf_counter()
+            attached, failed = process_staged_images(workers=options['workers'], limit=options['batch_size'])
+            if attached or failed or not options['loop']:
+                style = self.style.SUCCESS if not failed else self.style.WARNING
+                self.stdout.write(style(
+                    f'Attached {attached} images in {time.perf_counter() - start:.1f}s'
+                    f'{f", {failed} rejected" if failed else ""}.'
+                ))
+            if not options['loop']:
+                return
+            try:
+                time.sleep(options['poll_interval'])
+            except KeyboardInterrupt:
+                return
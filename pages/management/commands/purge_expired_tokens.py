@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from pages.token_utils import purge_expired_tokens
+
+
+class Command(BaseCommand):
+    help = 'Delete expired activation and password reset token rows in bulk.'
+
+    def handle(self, *args, **options):
+        purged = purge_expired_tokens()
+        self.stdout.write(self.style.SUCCESS(
+            'Purged ' + ', '.join(f'{count} {purpose.replace("_", " ")}' for purpose, count in purged.items()) + ' tokens.'
+        ))
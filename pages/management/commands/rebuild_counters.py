@@ -0,0 +1,87 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from pages.db_utils import engagement_db
+from pages.donation_utils import rebuild_donor_summaries
+from pages.leaderboard_utils import rebuild_leaderboard
+from pages.models import Comment, Donation, Project, Rating
+from pages.rollup_utils import rebuild_rollups
+from pages.tag_utils import rebuild_tag_counts
+
+
+def _per_project(queryset, aggregate):
+    """Correlated subquery returning one aggregate for the outer project."""
+    return Coalesce(
+        Subquery(
+            queryset.filter(project=OuterRef('pk'))
+            .order_by()
+            .values('project')
+            .annotate(value=aggregate)
+            .values('value'),
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    )
+
+
+def _grouped(queryset, **aggregates):
+    """``{project id: {name: value}}`` of ``aggregates`` per project, in one GROUP BY query."""
+    return {
+        row.pop('project'): row
+        for row in queryset.order_by().values('project').annotate(**aggregates)
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the denormalized project engagement counters, donor summaries, donation rollups, tag usage counts '
+        'and rating leaderboard.'
+    )
+
+    def handle(self, *args, **options):
+        if engagement_db() == DEFAULT_DB_ALIAS:
+            # One UPDATE statement with correlated subqueries, no per-row round trips
+            updated = Project.objects.update(
+                donation_count=_per_project(Donation.objects.all(), Count('id')),
+                comment_count=_per_project(Comment.objects.all(), Count('id')),
+                rating_count=_per_project(Rating.objects.all(), Count('id')),
+                rating_sum=_per_project(Rating.objects.all(), Sum('rating')),
+            )
+        else:
+            updated = self.rebuild_across_databases()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt counters for {updated} projects.'))
+
+        donors = rebuild_donor_summaries()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt donation summaries for {donors} donors.'))
+
+        buckets = rebuild_rollups()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {buckets} hourly and daily donation rollups.'))
+
+        tags = rebuild_tag_counts()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt usage counts for {tags} tags.'))
+
+        entries = rebuild_leaderboard()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt the leaderboard with {entries} rated projects.'))
+
+    def rebuild_across_databases(self, batch_size=1000):
+        # The engagement tables are in another file: aggregate there, then write the totals back in batches
+        donations = _grouped(Donation.objects.all(), count=Count('id'))
+        comments = _grouped(Comment.objects.all(), count=Count('id'))
+        ratings = _grouped(Rating.objects.all(), count=Count('id'), total=Sum('rating'))
+        projects = []
+        for pk in Project.objects.values_list('pk', flat=True).iterator():
+            rating = ratings.get(pk, {})
+            projects.append(Project(
+                pk=pk,
+                donation_count=donations.get(pk, {}).get('count', 0),
+                comment_count=comments.get(pk, {}).get('count', 0),
+                rating_count=rating.get('count', 0),
+                rating_sum=rating.get('total') or 0,
+            ))
+        with transaction.atomic():
+            Project.objects.bulk_update(
+                projects, ['donation_count', 'comment_count', 'rating_count', 'rating_sum'], batch_size=batch_size
+            )
+        return len(projects)
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pages.recommendation_utils import TOP_K, rebuild_similar_projects, recommendations_enabled
+
+
+class Command(BaseCommand):
+    help = 'Recompute the similar-projects table for all active projects.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=TOP_K, help='Neighbours stored per project.')
+
+    def handle(self, *args, **options):
+        if not recommendations_enabled():
+            raise CommandError('NumPy is required to build recommendations.')
+        start = time.perf_counter()
+        projects, links = rebuild_similar_projects(top_k=options['top_k'])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored {links} similar-project links for {projects} projects in {elapsed:.1f}s.'
+        ))
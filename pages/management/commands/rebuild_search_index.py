@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from pages.search_utils import fts_enabled, rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the FTS5 full-text index used by project search.'
+
+    def handle(self, *args, **options):
+        if not fts_enabled():
+            raise CommandError('The full-text index is only available on SQLite.')
+        count = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} active projects.'))
@@ -0,0 +1,518 @@
+import bisect
+import io
+import itertools
+import math
+import random
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router, transaction
+from django.db.models import F, Max
+
+from PIL import Image, ImageDraw
+
+from pages.cache_utils import invalidate
+from pages.image_utils import PROJECT_IMAGE_RENDITIONS, render_renditions, rendition_job, save_renditions
+from pages.leaderboard_utils import rebuild_leaderboard
+from pages.models import (
+    Category, Comment, CustomUser, Donation, DonationRollup, DonorSummary, Project, ProjectImage, Rating, Report,
+    StoredFile, Tag,
+)
+from pages.recommendation_utils import rebuild_similar_projects, recommendations_enabled
+from pages.rollup_utils import rebuild_rollups
+from pages.search_utils import fts_enabled, rebuild_index
+from pages.tag_utils import rebuild_tag_counts
+
+CATEGORIES = (
+    'Technology', 'Education', 'Healthcare', 'Environment', 'Arts & Culture', 'Business', 'Social Impact',
+)
+FIRST_NAMES = (
+    'Ahmed', 'Mohamed', 'Omar', 'Youssef', 'Mahmoud', 'Mostafa', 'Karim', 'Hassan', 'Ali', 'Tarek',
+    'Fatma', 'Mariam', 'Nour', 'Salma', 'Aya', 'Hana', 'Yasmin', 'Laila', 'Dina', 'Reem',
+)
+LAST_NAMES = (
+    'Hassan', 'Ibrahim', 'Mahmoud', 'Abdelrahman', 'Farouk', 'Saleh', 'Mansour', 'Fawzy', 'Nasser', 'Kamal',
+    'Shawky', 'Radwan', 'Zaki', 'Soliman', 'Gamal', 'Helmy', 'Lotfy', 'Sabry', 'Hamdy', 'Wahba',
+)
+ADJECTIVES = (
+    'solar', 'mobile', 'community', 'open', 'green', 'smart', 'rural', 'urban', 'affordable', 'clean',
+    'digital', 'local', 'independent', 'shared', 'portable', 'accessible', 'sustainable', 'youth', 'free', 'new',
+)
+NOUNS = (
+    'library', 'clinic', 'garden', 'workshop', 'water pump', 'school', 'studio', 'kitchen', 'bakery', 'app',
+    'film', 'album', 'makerspace', 'bike lane', 'radio', 'theatre', 'lab', 'market', 'shelter', 'festival',
+)
+PLACES = (
+    'Cairo', 'Alexandria', 'Giza', 'Aswan', 'Luxor', 'Mansoura', 'Tanta', 'Port Said', 'Suez', 'Ismailia',
+    'Fayoum', 'Minya', 'Assiut', 'Sohag', 'Qena', 'Hurghada', 'Damietta', 'Zagazig', 'Benha', 'Siwa',
+)
+WORDS = (
+    'we', 'will', 'build', 'help', 'families', 'students', 'neighbours', 'every', 'month', 'support',
+    'materials', 'training', 'equipment', 'volunteers', 'together', 'first', 'year', 'launch', 'grow', 'share',
+    'your', 'donation', 'covers', 'costs', 'of', 'the', 'and', 'for', 'with', 'in', 'our', 'town', 'project',
+    'thank', 'you', 'great', 'idea', 'progress', 'update', 'when', 'next', 'photos', 'love', 'this', 'good',
+)
+TAGS = tuple(sorted({f'{adjective} {noun}' for adjective in ADJECTIVES[:10] for noun in NOUNS[:10]} | set(ADJECTIVES)))
+DONATION_MESSAGES = ('Good luck!', 'Happy to help.', 'Keep going!', 'For my hometown.', 'Proud of you all.')
+REPORT_REASONS = ('Spam', 'Misleading description', 'Offensive content', 'Duplicate campaign', 'Looks like a scam')
+RATING_WEIGHTS = (5, 7, 15, 33, 40)  # 1 to 5 stars, mostly favourable
+EPOCH = datetime(1970, 1, 1)
+
+
+def db_time(timestamp):
+    """A POSIX timestamp as SQLite stores a UTC DateTimeField value."""
+    return str(EPOCH + timedelta(seconds=timestamp))
+
+
+def zipf_weights(count, exponent, rng):
+    """Weights of ``1 / rank ** exponent`` handed out in random order: a few very popular items and a long tail."""
+    weights = [1 / rank ** exponent for rank in range(1, count + 1)]
+    rng.shuffle(weights)
+    return weights
+
+
+def arrivals(rng, count, start, end):
+    """``count`` ascending timestamps spread evenly over ``start``..``end`` (a Poisson process)."""
+    rate = count / (end - start)
+    moment = start
+    for _ in range(count):
+        moment += rng.expovariate(rate)
+        yield min(moment, end)
+
+
+def sentence(rng, words=12):
+    return ' '.join(rng.choices(WORDS, k=words)).capitalize() + '.'
+
+
+class Population:
+    """
+    Items created over time, oldest first, with a popularity weight each.
+    ``pick(when)`` returns the index of a weighted choice among the items
+    created by ``when`` in O(log n), so donations and comments only come
+    from users who had joined by then.
+    """
+
+    def __init__(self, created, weights):
+        self.created = created
+        self.cumulative = list(itertools.accumulate(weights))
+
+    def pick(self, rng, when):
+        available = bisect.bisect_right(self.created, when) or 1
+        return bisect.bisect_right(self.cumulative, rng.random() * self.cumulative[available - 1])
+
+
+class Inserter:
+    """
+    Batched ``INSERT`` of rows of database-ready values for ``columns`` into
+    the database the router picks for ``model``; other fields get their
+    defaults. Raw rather than bulk_create: bulk_create overwrites the
+    spread-out created_at values with now (auto_now_add) and spends most of
+    its time building model instances. Rows pointing at rows still buffered
+    in another Inserter name it in ``after``, which is flushed first.
+    """
+
+    def __init__(self, model, columns, batch_size, after=()):
+        self.alias = router.db_for_write(model)
+        connection = connections[self.alias]
+        fields = [model._meta.get_field(name) for name in columns]
+        rest = [field for field in model._meta.concrete_fields if field not in fields and not field.primary_key]
+        self.defaults = tuple(field.get_db_prep_save(field.get_default(), connection) for field in rest)
+        names = ', '.join(connection.ops.quote_name(field.column) for field in fields + rest)
+        placeholders = ', '.join(['%s'] * (len(fields) + len(rest)))
+        self.sql = f'INSERT INTO {connection.ops.quote_name(model._meta.db_table)} ({names}) VALUES ({placeholders})'
+        self.batch_size = batch_size
+        self.after = after
+        self.rows = []
+        self.count = 0
+
+    def add(self, row):
+        self.rows.append(row + self.defaults)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        for inserter in self.after:
+            inserter.flush()
+        if self.rows:
+            with transaction.atomic(using=self.alias), connections[self.alias].cursor() as cursor:
+                cursor.executemany(self.sql, self.rows)
+            self.count += len(self.rows)
+            self.rows = []
+
+
+@contextmanager
+def deferred_indexes(model):
+    """
+    Drop the secondary indexes of ``model``'s table for a bulk load and
+    build them again afterwards (SQLite only): sorting the keys once is
+    several times faster than updating every index row by row. Unique
+    constraints stay in place.
+    """
+    connection = connections[router.db_for_write(model)]
+    if connection.vendor != 'sqlite':
+        yield
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = %s AND sql IS NOT NULL",
+            [model._meta.db_table]
+        )
+        indexes = cursor.fetchall()
+        for name, _ in indexes:
+            cursor.execute(f'DROP INDEX {connection.ops.quote_name(name)}')
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            for _, sql in indexes:
+                cursor.execute(sql)
+
+
+def next_id(model):
+    return (model.objects.using(router.db_for_write(model)).aggregate(last=Max('pk'))['last'] or 0) + 1
+
+
+def placeholder_image(rng, index):
+    """A small JPEG with a colour gradient, different for every index."""
+    start = tuple(rng.randrange(256) for _ in range(3))
+    end = tuple(rng.randrange(256) for _ in range(3))
+    image = Image.new('RGB', (1200, 800))
+    draw = ImageDraw.Draw(image)
+    for x in range(0, 1200, 8):
+        blend = x / 1200
+        draw.rectangle([x, 0, x + 8, 800], fill=tuple(round(a + (b - a) * blend) for a, b in zip(start, end)))
+    draw.text((40, 40), f'Seed image {index}', fill=(255, 255, 255))
+    output = io.BytesIO()
+    image.save(output, 'JPEG', quality=80)
+    return output.getvalue()
+
+
+class Command(BaseCommand):
+    help = (
+        'Fill the database with a reproducible synthetic platform: users, projects with images and tags, '
+        'donations, comments with replies, ratings and reports, with a few popular campaigns and a long tail. '
+        'Adds to what is there; a given --seed always generates the same rows, dated back from now.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--projects', type=int, default=2000)
+        parser.add_argument('--donations', type=int, default=100000)
+        parser.add_argument('--comments', type=int, default=20000, help='Top-level comments and replies together.')
+        parser.add_argument('--ratings', type=int, default=20000, help='At most one per user and project.')
+        parser.add_argument('--reports', type=int, default=500)
+        parser.add_argument('--images', type=int, default=3, help='Most images per project, 0 for none.')
+        parser.add_argument('--days', type=int, default=365, help='History the data is spread over, up to now.')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=10000, help='Rows inserted per transaction.')
+        parser.add_argument('--password', help='Password of every seeded user; without one they cannot log in.')
+        parser.add_argument('--skip-recommendations', action='store_true', help='Do not rebuild similar projects.')
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['projects'] < 1:
+            raise CommandError('Seeding needs at least one user and one project.')
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = time.time()
+        self.start = self.now - options['days'] * 86400
+
+        started = time.perf_counter()
+        self.step('users', self.create_users, options['users'], options['password'])
+        self.step('projects', self.create_projects, options['projects'])
+        self.step('images', self.create_images, options['images'])
+        self.step('donations', self.create_donations, options['donations'])
+        self.step('rollups', self.create_rollups)
+        self.step('comments', self.create_comments, options['comments'])
+        self.step('ratings', self.create_ratings, options['ratings'])
+        self.step('reports', self.create_reports, options['reports'])
+        self.step('counters', self.update_counters)
+
+        self.step('tag counts', rebuild_tag_counts)
+        self.step('leaderboard', rebuild_leaderboard)
+        if fts_enabled():
+            self.step('search index', rebuild_index)
+        if recommendations_enabled() and not options['skip_recommendations']:
+            self.step('similar projects', lambda: rebuild_similar_projects()[1])
+        invalidate('projects')
+        invalidate('categories')
+        self.stdout.write(self.style.SUCCESS(f'Seeded the platform in {time.perf_counter() - started:.1f}s.'))
+
+    def step(self, label, function, *args):
+        start = time.perf_counter()
+        count = function(*args)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f'{label}: {count} in {elapsed:.1f}s ({count / elapsed if elapsed else 0:.0f}/s)')
+
+    def create_users(self, count, password):
+        first_id = next_id(CustomUser)
+        password = make_password(password)
+        joined = list(arrivals(self.rng, count, self.start, self.now))
+        # Some users give a lot, most only once or twice
+        self.users = Population(joined, zipf_weights(count, 0.7, self.rng))
+        self.user_ids = range(first_id, first_id + count)
+
+        users = Inserter(CustomUser, [
+            'id', 'username', 'email', 'password', 'first_name', 'last_name', 'mobile_phone', 'is_active', 'date_joined'
+        ], self.batch_size)
+        for pk, moment in zip(self.user_ids, joined):
+            email = f'seed{pk}@example.com'
+            users.add((
+                pk, email, email, password, self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES),
+                f'01{"0125"[pk % 4]}{pk % 10 ** 8:08d}', True, db_time(moment),
+            ))
+        users.flush()
+        return users.count
+
+    def create_projects(self, count):
+        Category.objects.bulk_create([Category(name=name) for name in CATEGORIES], ignore_conflicts=True)
+        category_ids = list(Category.objects.order_by('pk').values_list('pk', flat=True))
+        category_weights = zipf_weights(len(category_ids), 1.0, self.rng)
+        Tag.objects.bulk_create([Tag(name=name) for name in TAGS], ignore_conflicts=True)
+        tag_ids = dict(Tag.objects.filter(name__in=TAGS).values_list('name', 'pk'))
+        tag_weights = zipf_weights(len(TAGS), 1.1, self.rng)
+
+        first_id = next_id(Project)
+        created = list(arrivals(self.rng, count, self.start, self.now))
+        # A handful of campaigns draw most of the money and attention
+        weights = zipf_weights(count, 0.8, self.rng)
+        self.project_ids = range(first_id, first_id + count)
+        self.project_created, self.project_ends, self.project_weights = created, [], weights
+        self.project_categories = {}
+        featured = set(sorted(range(count), key=weights.__getitem__)[-max(1, count // 100):])
+
+        projects = Inserter(Project, [
+            'id', 'creator', 'title', 'details', 'category', 'total_target', 'tags', 'start_date', 'end_date',
+            'is_featured', 'is_active', 'created_at', 'updated_at',
+        ], self.batch_size)
+        tag_links = Inserter(Project.tag_objects.through, ['project', 'tag'], self.batch_size, after=[projects])
+        for index, (pk, moment) in enumerate(zip(self.project_ids, created)):
+            rng = self.rng
+            title = f'{rng.choice(ADJECTIVES).capitalize()} {rng.choice(NOUNS)} in {rng.choice(PLACES)}'
+            details = ' '.join(sentence(rng, rng.randint(8, 20)) for _ in range(rng.randint(2, 6)))
+            tags = sorted(set(rng.choices(TAGS, tag_weights, k=rng.randint(0, 5))))
+            is_active = rng.random() > 0.05
+            target = round(rng.lognormvariate(math.log(50000), 1.0), -2) or 1000
+            creator = self.user_ids[self.users.pick(rng, moment)]
+            end = moment + rng.randint(30, 120) * 86400
+            self.project_ends.append(end)
+            category = self.project_categories[pk] = rng.choices(category_ids, category_weights)[0]
+            projects.add((
+                pk, creator, title, details, category, target, ', '.join(tags),
+                db_time(moment), db_time(end), is_active and index in featured, is_active, db_time(moment), db_time(moment),
+            ))
+            if is_active:  # Inactive projects carry no tag links, see sync_project_tags
+                for name in tags:
+                    tag_links.add((pk, tag_ids[name]))
+        projects.flush()
+        tag_links.flush()
+
+        self.amounts = [0] * count
+        self.donation_counts = [0] * count
+        self.comment_counts = [0] * count
+        self.rating_counts = [0] * count
+        self.rating_sums = [0] * count
+        return projects.count
+
+    def project_events(self, count, during_campaign=False):
+        """
+        ``count`` ``(timestamp, project index)`` pairs, oldest first, each at
+        a random moment of the project's life so far (or of its campaign).
+        A project's share is its popularity times that span, so its rate
+        over time follows its popularity, whenever it was created.
+        """
+        rng, created = self.rng, self.project_created
+        ends = [min(end, self.now) for end in self.project_ends] if during_campaign else [self.now] * len(created)
+        cumulative = list(itertools.accumulate(
+            weight * max(end - start, 1) for weight, start, end in zip(self.project_weights, created, ends)
+        ))
+        events = [
+            (created[project] + rng.random() * (ends[project] - created[project]), project)
+            for project in rng.choices(range(len(created)), cum_weights=cumulative, k=count)
+        ]
+        events.sort()
+        return events
+
+    def create_images(self, most):
+        if most <= 0 or not self.project_ids:
+            return 0
+        # Popular projects have more images; all of them share a small pool
+        # of files, stored once thanks to the content-addressed storage
+        pool = [None] * 12
+        uses = [0] * len(pool)
+        images = Inserter(ProjectImage, ['id', 'project', 'image', 'uploaded_at', 'has_renditions'], self.batch_size)
+        pk = next_id(ProjectImage)
+        rows = []
+        for index, project_id in enumerate(self.project_ids):
+            for _ in range(self.rng.randint(1 if index % 3 else 0, most)):
+                choice = self.rng.randrange(len(pool))
+                uses[choice] += 1
+                rows.append((pk, project_id, choice, db_time(self.project_created[index])))
+                pk += 1
+
+        storage = ProjectImage._meta.get_field('image').storage
+        for choice, count in enumerate(uses):
+            if count:
+                name = storage.save(f'project_images/seed-{choice}.jpg', ContentFile(placeholder_image(self.rng, choice)))
+                save_renditions(render_renditions(*rendition_job(name, PROJECT_IMAGE_RENDITIONS, False)))
+                # save() counted one reference; the rows below hold the rest
+                StoredFile.objects.filter(name=name).update(references=F('references') + count - 1)
+                pool[choice] = name
+        for pk, project_id, choice, uploaded_at in rows:
+            images.add((pk, project_id, pool[choice], uploaded_at, True))
+        images.flush()
+        return images.count
+
+    def create_donations(self, count):
+        rng, users = self.rng, self.users
+        donations = Inserter(Donation, ['id', 'project', 'donor', 'amount', 'message', 'created_at'], self.batch_size)
+        pk = next_id(Donation)
+        # DonorSummary columns, per user index
+        given, gifts, backed, last_gift = [0] * len(self.user_ids), [0] * len(self.user_ids), set(), {}
+        with deferred_indexes(Donation):
+            for moment, project in self.project_events(count, during_campaign=True):
+                amount = min(50000, max(5, round(rng.lognormvariate(math.log(100), 1.1))))
+                message = rng.choice(DONATION_MESSAGES) if rng.random() < 0.2 else ''
+                donor = users.pick(rng, moment)
+                donations.add((
+                    pk, self.project_ids[project], self.user_ids[donor], amount, message, db_time(moment),
+                ))
+                self.amounts[project] += amount
+                self.donation_counts[project] += 1
+                given[donor] += amount
+                gifts[donor] += 1
+                backed.add((donor, project))
+                last_gift[donor] = moment
+                pk += 1
+            donations.flush()
+
+        projects_backed = [0] * len(self.user_ids)
+        for donor, _ in backed:
+            projects_backed[donor] += 1
+        summaries = Inserter(DonorSummary, [
+            'user', 'total_donated', 'donation_count', 'projects_backed', 'last_donation_at'
+        ], self.batch_size)
+        for donor, moment in sorted(last_gift.items()):
+            summaries.add((self.user_ids[donor], given[donor], gifts[donor], projects_backed[donor], db_time(moment)))
+        summaries.flush()
+        return donations.count
+
+    def create_rollups(self):
+        alias = router.db_for_write(DonationRollup)
+        connection = connections[alias]
+        if connection.vendor != 'sqlite' or DonationRollup.objects.using(alias).exists():
+            # Seeding on top of earlier rows: categories already have buckets to add to
+            return rebuild_rollups()
+        # Summed by SQLite from the loaded donations with INSERT ... SELECT ...
+        # GROUP BY, whose groups come out in the unique index's order.
+        # Projects may be in the other database, so their categories come
+        # along in a temporary table.
+        rollups = connection.ops.quote_name(DonationRollup._meta.db_table)
+        donations = connection.ops.quote_name(Donation._meta.db_table)
+        insert = f'INSERT INTO {rollups} (scope, scope_id, period, bucket, amount, donation_count) '
+        categories = Project.objects.using(router.db_for_read(Project)).exclude(category=None).values_list('pk', 'category')
+        with transaction.atomic(using=alias), connection.cursor() as cursor:
+            cursor.execute('CREATE TEMP TABLE seed_project_category (project_id integer PRIMARY KEY, category_id integer)')
+            cursor.executemany('INSERT INTO seed_project_category VALUES (%s, %s)', categories.iterator())
+            cursor.execute(
+                insert + "SELECT 'project', project_id, 'hour', strftime('%Y-%m-%d %H:00:00', created_at), "
+                f'SUM(amount), COUNT(*) FROM {donations} GROUP BY 2, 4'
+            )
+            # The other buckets are sums of project hours, as in rollup_totals
+            cursor.execute(
+                insert + "SELECT 'category', c.category_id, 'hour', r.bucket, SUM(r.amount), SUM(r.donation_count) "
+                f"FROM {rollups} r JOIN seed_project_category c ON c.project_id = r.scope_id "
+                "WHERE r.scope = 'project' AND r.period = 'hour' GROUP BY 2, 4"
+            )
+            cursor.execute(
+                insert + "SELECT scope, scope_id, 'day', substr(bucket, 1, 10) || ' 00:00:00', SUM(amount), "
+                f"SUM(donation_count) FROM {rollups} WHERE period = 'hour' GROUP BY 1, 2, 4"
+            )
+            cursor.execute('DROP TABLE seed_project_category')
+        return DonationRollup.objects.using(alias).count()
+
+    def create_comments(self, count):
+        rng, users = self.rng, self.users
+        comments = Inserter(Comment, ['id', 'project', 'user', 'content', 'parent_comment', 'created_at'], self.batch_size)
+        self.comment_ids, self.comment_times = [], []
+        threads = {}  # Project index: ids of its top-level comments
+        pk = next_id(Comment)
+        with deferred_indexes(Comment):
+            for moment, project in self.project_events(count):
+                parent = None
+                if threads.get(project) and rng.random() < 0.35:
+                    # Replies gather under the latest threads
+                    parent = rng.choice(threads[project][-5:])
+                else:
+                    threads.setdefault(project, []).append(pk)
+                comments.add((
+                    pk, self.project_ids[project], self.user_ids[users.pick(rng, moment)],
+                    sentence(rng, rng.randint(4, 25)), parent, db_time(moment),
+                ))
+                self.comment_ids.append(pk)
+                self.comment_times.append(moment)
+                self.comment_counts[project] += 1
+                pk += 1
+            comments.flush()
+        return comments.count
+
+    def create_ratings(self, count):
+        rng, users = self.rng, self.users
+        ratings = Inserter(Rating, ['id', 'project', 'user', 'rating', 'created_at'], self.batch_size)
+        rated = set()
+        pk = next_id(Rating)
+        with deferred_indexes(Rating):
+            for moment, project in self.project_events(count):
+                # One rating per user and project: try a few raters, then give up on this one
+                for _ in range(5):
+                    user = users.pick(rng, moment)
+                    if (project, user) not in rated:
+                        break
+                else:
+                    continue
+                rated.add((project, user))
+                stars = rng.choices(range(1, 6), RATING_WEIGHTS)[0]
+                ratings.add((pk, self.project_ids[project], self.user_ids[user], stars, db_time(moment)))
+                self.rating_counts[project] += 1
+                self.rating_sums[project] += stars
+                pk += 1
+            ratings.flush()
+        return ratings.count
+
+    def create_reports(self, count):
+        rng, users = self.rng, self.users
+        reports = Inserter(Report, [
+            'id', 'reporter', 'report_type', 'project', 'comment', 'reason', 'created_at', 'is_resolved'
+        ], self.batch_size)
+        pk = next_id(Report)
+        with deferred_indexes(Report):
+            for moment, project in self.project_events(count):
+                comment = None
+                written = bisect.bisect_right(self.comment_times, moment)
+                if written and rng.random() < 0.4:
+                    comment = self.comment_ids[rng.randrange(written)]
+                # Older reports have mostly been dealt with
+                resolved = rng.random() < (self.now - moment) / (self.now - self.start)
+                reports.add((
+                    pk, self.user_ids[users.pick(rng, moment)], 'comment' if comment else 'project',
+                    None if comment else self.project_ids[project], comment, rng.choice(REPORT_REASONS),
+                    db_time(moment), resolved,
+                ))
+                pk += 1
+            reports.flush()
+        return reports.count
+
+    def update_counters(self):
+        connection = connections[router.db_for_write(Project)]
+        table = connection.ops.quote_name(Project._meta.db_table)
+        with transaction.atomic(using=router.db_for_write(Project)), connection.cursor() as cursor:
+            cursor.executemany(
+                f'UPDATE {table} SET current_amount = %s, donation_count = %s, comment_count = %s, '
+                'rating_count = %s, rating_sum = %s WHERE id = %s',
+                zip(self.amounts, self.donation_counts, self.comment_counts, self.rating_counts, self.rating_sums,
+                    self.project_ids)
+            )
+        return len(self.project_ids)
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from pages.outbox_utils import BATCH_SIZE, MAX_ATTEMPTS, drain_outbox
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued emails from the outbox with a pool of SMTP connections.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Threads, each with its own SMTP connection.')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Messages claimed per round trip.')
+        parser.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS, help='Attempts before giving up.')
+        parser.add_argument('--loop', action='store_true', help='Keep polling instead of exiting once drained.')
+        parser.add_argument('--poll-interval', type=float, default=5.0, help='Seconds between polls with --loop.')
+
+    def handle(self, *args, **options):
+        while True:
+            stats = drain_outbox(
+                workers=options['workers'],
+                batch_size=options['batch_size'],
+                max_attempts=options['max_attempts'],
+            )
+            if stats.sent or stats.retried or stats.failed or not options['loop']:
+                style = self.style.SUCCESS if not stats.failed else self.style.WARNING
+                self.stdout.write(style(stats.summary()))
+            if not options['loop']:
+                return
+            try:
+                time.sleep(options['poll_interval'])
+            except KeyboardInterrupt:
+                return
@@ -0,0 +1,97 @@
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from pages.db_utils import ENGAGEMENT_DATABASE, engagement_models
+from pages.donation_utils import rebuild_donor_summaries
+from pages.rollup_utils import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Move Donation, Rating, Comment and Report rows from the default database into the 'engagement' one, "
+        "keeping their ids, and rebuild the donor summaries and donation rollups there. Resumable: rows already copied are skipped, "
+        "so run it again right before turning PAGES_SPLIT_ENGAGEMENT on to pick up what was written meanwhile."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows copied per transaction.')
+        parser.add_argument(
+            '--delete-source', action='store_true',
+            help='Once every table checks out, empty the copies left in the default database.'
+        )
+
+    def handle(self, *args, **options):
+        # Creates the engagement tables (the router keeps everything else out)
+        call_command('migrate', database=ENGAGEMENT_DATABASE, interactive=False, verbosity=0)
+        source, target = connections[DEFAULT_DB_ALIAS], connections[ENGAGEMENT_DATABASE]
+
+        start = time.perf_counter()
+        copied = 0
+        for model in engagement_models(derived=False):
+            count = self.copy(model, source, target, options['batch_size'])
+            copied += count
+            self.stdout.write(f'{model._meta.db_table}: copied {count} rows.')
+
+        mismatched = [
+            model._meta.db_table for model in engagement_models(derived=False)
+            if self.summary(model, source) != self.summary(model, target)
+        ]
+        if mismatched:
+            raise CommandError(
+                f'Row counts or ids differ for {", ".join(mismatched)}; are there writes to the engagement database '
+                'already? Nothing was deleted.'
+            )
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Copied {copied} rows in {elapsed:.1f}s ({copied / elapsed if elapsed else 0:.0f} rows/s); '
+            'both databases match.'
+        ))
+        donors = rebuild_donor_summaries(using=ENGAGEMENT_DATABASE)
+        self.stdout.write(f'Rebuilt donation summaries for {donors} donors.')
+        buckets = rebuild_rollups(using=ENGAGEMENT_DATABASE)
+        self.stdout.write(f'Rebuilt {buckets} donation rollups.')
+
+        if options['delete_source']:
+            with transaction.atomic(using=DEFAULT_DB_ALIAS), source.cursor() as cursor:
+                # Raw deletes: the rows live on in the other file, so no cascades or signals
+                for model in reversed(engagement_models()):
+                    cursor.execute(f'DELETE FROM {source.ops.quote_name(model._meta.db_table)}')
+            self.stdout.write(self.style.SUCCESS('Emptied the engagement tables of the default database.'))
+        self.stdout.write('Set PAGES_SPLIT_ENGAGEMENT=True and restart to use the engagement database.')
+
+    def copy(self, model, source, target, batch_size):
+        """Copy the rows of ``model`` past the highest id ``target`` has, oldest first; return how many."""
+        table = source.ops.quote_name(model._meta.db_table)
+        pk = source.ops.quote_name(model._meta.pk.column)
+        columns = ', '.join(source.ops.quote_name(field.column) for field in model._meta.concrete_fields)
+        placeholders = ', '.join(['%s'] * len(model._meta.concrete_fields))
+        pk_index = model._meta.concrete_fields.index(model._meta.pk)
+        with target.cursor() as cursor:
+            cursor.execute(f'SELECT MAX({pk}) FROM {table}')
+            last = cursor.fetchone()[0] or 0
+
+        # Column values go across as stored, which keeps timestamps that
+        # the ORM's auto_now_add would overwrite
+        copied = 0
+        while True:
+            with source.cursor() as cursor:
+                cursor.execute(
+                    f'SELECT {columns} FROM {table} WHERE {pk} > %s ORDER BY {pk} LIMIT %s', [last, batch_size]
+                )
+                rows = cursor.fetchall()
+            if not rows:
+                return copied
+            with transaction.atomic(using=ENGAGEMENT_DATABASE), target.cursor() as cursor:
+                cursor.executemany(f'INSERT INTO {table} ({columns}) VALUES ({placeholders})', rows)
+            last = rows[-1][pk_index]
+            copied += len(rows)
+
+    def summary(self, model, connection):
+        table = connection.ops.quote_name(model._meta.db_table)
+        pk = connection.ops.quote_name(model._meta.pk.column)
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*), MAX({pk}) FROM {table}')
+            return cursor.fetchone()
@@ -0,0 +1,49 @@
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from .instrumentation_utils import (
+    BudgetExceeded, install_template_timer, instrumentation_enabled, over_budget, record_request, write_record,
+)
+
+
+class RequestInstrumentationMiddleware:
+    """
+    Opt-in (PAGES_INSTRUMENTATION): records query count, SQL time, template
+    render time (including the queries run while rendering) and wall time
+    of every request under its URL name, with the query shapes repeated
+    within it (likely N+1) and where they came from. One JSON line per
+    request goes to the 'pages.instrumentation' logger, a rotating file in
+    settings.LOGGING. Requests over their PAGES_REQUEST_BUDGETS entry are
+    flagged, or raise BudgetExceeded with PAGES_BUDGET_ACTION = 'raise'.
+    """
+
+    def __init__(self, get_response):
+        if not instrumentation_enabled():
+            raise MiddlewareNotUsed
+        install_template_timer()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with record_request() as recorder:
+            response = self.get_response(request)
+        wall_ms = (time.perf_counter() - start) * 1000
+
+        match = getattr(request, 'resolver_match', None)
+        url_name = (match.view_name if match else None) or request.path
+        record = recorder.summary(url_name, request.method, response.status_code, wall_ms)
+        exceeded = over_budget(record)
+        if exceeded:
+            record['over_budget'] = {measure: {'value': value, 'limit': limit} for measure, (value, limit) in exceeded.items()}
+        write_record(record)
+
+        if exceeded and getattr(settings, 'PAGES_BUDGET_ACTION', 'log') == 'raise':
+            details = ', '.join(f'{measure} {value} > {limit}' for measure, (value, limit) in exceeded.items())
+            repeated = '\n'.join(
+                f"  {group['count']}x from {', '.join(group['origins'])}: {group['sql']}"
+                for group in record['repeated_queries']
+            )
+            raise BudgetExceeded(f'{url_name} over budget: {details}' + (f'\nRepeated queries:\n{repeated}' if repeated else ''))
+        return response
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:59
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Project = apps.get_model('pages', 'Project')
+    Donation = apps.get_model('pages', 'Donation')
+    Comment = apps.get_model('pages', 'Comment')
+    Rating = apps.get_model('pages', 'Rating')
+
+    def per_project(model, aggregate):
+        return Coalesce(
+            Subquery(
+                model.objects.filter(project=OuterRef('pk'))
+                .order_by()
+                .values('project')
+                .annotate(value=aggregate)
+                .values('value'),
+                output_field=IntegerField(),
+            ),
+            Value(0),
+        )
+
+    Project.objects.update(
+        donation_count=per_project(Donation, Count('id')),
+        comment_count=per_project(Comment, Count('id')),
+        rating_count=per_project(Rating, Count('id')),
+        rating_sum=per_project(Rating, Sum('rating')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0005_passwordresettoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='donation_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
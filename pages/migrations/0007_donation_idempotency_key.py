@@ -0,0 +1,22 @@
+# Generated by Django 5.2.5 on 2026-10-18 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0006_project_engagement_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='donation',
+            name='idempotency_key',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='donation',
+            constraint=models.UniqueConstraint(fields=('donor', 'idempotency_key'), name='unique_donation_idempotency_key'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.5 on 2026-10-18 18:03
+
+import django.db.models.deletion
+import pages.models
+from django.db import migrations, models
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS pages_project_fts "
+        "USING fts5(title, tags, details, tokenize='unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        "INSERT INTO pages_project_fts(pages_project_fts, rank) VALUES ('rank', 'bm25(10.0, 5.0, 1.0)')"
+    )
+    schema_editor.execute(
+        "INSERT INTO pages_project_fts(rowid, title, tags, details) "
+        "SELECT id, title, tags, details FROM pages_project WHERE is_active"
+    )
+    schema_editor.execute("ANALYZE pages_project")
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS pages_project_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0007_donation_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectSearchIndex',
+            fields=[
+                ('project', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='pages.project')),
+                ('title', models.TextField()),
+                ('tags', models.TextField()),
+                ('details', models.TextField()),
+                ('document', pages.models.FullTextField(db_column='pages_project_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'pages_project_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.5 on 2026-10-18 18:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0008_project_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('usage_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-usage_count'], name='tag_usage_count_idx')],
+            },
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='tag_objects',
+            field=models.ManyToManyField(blank=True, related_name='projects', to='pages.tag'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+import re
+
+from django.db import migrations
+
+
+def populate_tags(apps, schema_editor):
+    Project = apps.get_model('pages', 'Project')
+    Tag = apps.get_model('pages', 'Tag')
+    ProjectTag = Project.tag_objects.through
+
+    names_by_project = {}
+    for project_id, raw_tags in Project.objects.filter(is_active=True).values_list('id', 'tags').iterator():
+        names = []
+        for part in (raw_tags or '').split(','):
+            name = re.sub(r'\s+', ' ', part).strip().lower()[:50]
+            if name and name not in names:
+                names.append(name)
+        names_by_project[project_id] = names
+
+    usage = {}
+    for names in names_by_project.values():
+        for name in names:
+            usage[name] = usage.get(name, 0) + 1
+
+    Tag.objects.bulk_create(
+        [Tag(name=name, usage_count=count) for name, count in usage.items()],
+        batch_size=500,
+    )
+    tag_ids = dict(Tag.objects.values_list('name', 'id'))
+    ProjectTag.objects.bulk_create(
+        [
+            ProjectTag(project_id=project_id, tag_id=tag_ids[name])
+            for project_id, names in names_by_project.items()
+            for name in names
+        ],
+        batch_size=500,
+    )
+
+
+def clear_tags(apps, schema_editor):
+    apps.get_model('pages', 'Tag').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0009_tag'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_tags, clear_tags),
+    ]
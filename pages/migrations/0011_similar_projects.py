@@ -0,0 +1,40 @@
+# Generated by Django 5.2.5 on 2026-10-18 18:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0010_populate_tags'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommendationFeature',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('term', 'Term'), ('tag', 'Tag'), ('category', 'Category')], max_length=10)),
+                ('key', models.CharField(max_length=100)),
+                ('column', models.PositiveIntegerField()),
+                ('weight', models.FloatField(default=1.0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'key'), name='unique_recommendation_feature')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SimilarProject',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_links', to='pages.project')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pages.project')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['project', '-score'], name='similar_project_score_idx'), models.Index(fields=['similar'], name='similar_project_similar_idx')],
+                'constraints': [models.UniqueConstraint(fields=('project', 'similar'), name='unique_similar_project')],
+            },
+        ),
+    ]
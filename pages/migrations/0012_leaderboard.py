@@ -0,0 +1,50 @@
+# Generated by Django 5.2.5 on 2026-10-18 18:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_leaderboard(apps, schema_editor):
+    Project = apps.get_model('pages', 'Project')
+    LeaderboardEntry = apps.get_model('pages', 'LeaderboardEntry')
+    prior_mean = getattr(settings, 'LEADERBOARD_PRIOR_MEAN', 3.0)
+    prior_votes = getattr(settings, 'LEADERBOARD_PRIOR_VOTES', 5)
+
+    rated = Project.objects.filter(is_active=True, rating_count__gt=0).values_list('pk', 'rating_sum', 'rating_count')
+    LeaderboardEntry.objects.bulk_create(
+        (
+            LeaderboardEntry(
+                project_id=pk,
+                score=(prior_mean * prior_votes + rating_sum) / (prior_votes + rating_count),
+                average=rating_sum / rating_count,
+                rating_count=rating_count,
+            )
+            for pk, rating_sum, rating_count in rated.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0011_similar_projects'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('project', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='leaderboard_entry', serialize=False, to='pages.project')),
+                ('score', models.FloatField()),
+                ('average', models.FloatField()),
+                ('rating_count', models.PositiveIntegerField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-score', '-project'], name='leaderboard_score_idx')],
+            },
+        ),
+        migrations.RunPython(populate_leaderboard, migrations.RunPython.noop),
+    ]
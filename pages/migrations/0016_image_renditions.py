@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 18:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0015_email_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='profile_picture_renditions',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='projectimage',
+            name='has_renditions',
+            field=models.BooleanField(default=False),
+        ),
+    ]
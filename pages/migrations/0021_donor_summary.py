@@ -0,0 +1,57 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Sum
+
+
+def populate_donor_summaries(apps, schema_editor):
+    # Runs in whichever database holds the donations (see the router hints below)
+    using = schema_editor.connection.alias
+    Donation = apps.get_model('pages', 'Donation')
+    DonorSummary = apps.get_model('pages', 'DonorSummary')
+    totals = (
+        Donation.objects.using(using).order_by().values('donor')
+        .annotate(total=Sum('amount'), count=Count('id'), projects=Count('project', distinct=True), last=Max('created_at'))
+    )
+    DonorSummary.objects.using(using).bulk_create(
+        (
+            DonorSummary(
+                user_id=row['donor'], total_donated=row['total'], donation_count=row['count'],
+                projects_backed=row['projects'], last_donation_at=row['last'],
+            )
+            for row in totals.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0020_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DonorSummary',
+            fields=[
+                ('user', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='donor_summary', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('total_donated', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('donation_count', models.PositiveIntegerField(default=0)),
+                ('projects_backed', models.PositiveIntegerField(default=0)),
+                ('last_donation_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='donation',
+            name='donor',
+            field=models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='donations', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='donation',
+            index=models.Index(fields=['donor', 'project'], name='donation_donor_project_idx'),
+        ),
+        migrations.RunPython(populate_donor_summaries, migrations.RunPython.noop, hints={'model_name': 'donorsummary'}),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:13
+
+from datetime import timezone as dt_timezone
+
+from django.db import DEFAULT_DB_ALIAS, migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncHour
+
+from pages.rollup_utils import rollup_totals
+
+
+def populate_donation_rollups(apps, schema_editor):
+    # Runs in whichever database holds the donations (see the router hints below)
+    using = schema_editor.connection.alias
+    Donation = apps.get_model('pages', 'Donation')
+    DonationRollup = apps.get_model('pages', 'DonationRollup')
+    Project = apps.get_model('pages', 'Project')
+    hourly = {
+        (row['project'], row['hour']): (row['amount'], row['count'])
+        for row in (
+            Donation.objects.using(using).order_by()
+            .annotate(hour=TruncHour('created_at', tzinfo=dt_timezone.utc))
+            .values('project', 'hour')
+            .annotate(amount=Sum('amount'), count=Count('id'))
+            .iterator()
+        )
+    }
+    categories = dict(Project.objects.using(DEFAULT_DB_ALIAS).values_list('pk', 'category_id').iterator())
+    DonationRollup.objects.using(using).bulk_create(
+        (
+            DonationRollup(
+                scope=scope, scope_id=scope_id, period=period, bucket=bucket, amount=amount, donation_count=count
+            )
+            for (scope, scope_id, period, bucket), (amount, count) in rollup_totals(hourly, categories).items()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0021_donor_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DonationRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('project', 'Project'), ('category', 'Category')], max_length=10)),
+                ('scope_id', models.PositiveBigIntegerField()),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('bucket', models.DateTimeField()),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('donation_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('scope', 'scope_id', 'period', 'bucket'), name='unique_donation_rollup')],
+            },
+        ),
+        migrations.RunPython(populate_donation_rollups, migrations.RunPython.noop, hints={'model_name': 'donationrollup'}),
+    ]
@@ -1,6 +1,10 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import RegexValidator
+from django.db.models.functions import Least
+
+from .image_utils import AVATAR_RENDITIONS, PROJECT_IMAGE_RENDITIONS, rendition_url, srcset
+from .storage_utils import content_storage
 from django.utils import timezone
 from datetime import timedelta
 
@@ -17,14 +21,35 @@ class CustomUser(AbstractUser):
         )],
         unique=True
     )
-    profile_picture = models.ImageField(upload_to='profile_pics/', blank=True, null=True)
+    profile_picture = models.ImageField(upload_to='profile_pics/', storage=content_storage, blank=True, null=True)
     birthdate = models.DateField(blank=True, null=True)
     facebook_profile = models.URLField(blank=True, null=True)
     country = models.CharField(max_length=100, blank=True, null=True)
+    # Name of the picture the avatar renditions were generated from
+    profile_picture_renditions = models.CharField(max_length=100, blank=True)
+    # Set when the account goes from active to inactive, which voids the
+    # activation links issued before (pages.token_utils)
+    deactivated_at = models.DateTimeField(blank=True, null=True, editable=False)
 
     REQUIRED_FIELDS = ['email', 'first_name', 'last_name', 'mobile_phone']
     USERNAME_FIELD = 'username'
 
+    def has_avatar_renditions(self):
+        return bool(self.profile_picture) and self.profile_picture_renditions == self.profile_picture.name
+
+    def avatar_url(self, width=128):
+        if not self.profile_picture:
+            return ''
+        if self.has_avatar_renditions():
+            return rendition_url(self.profile_picture.name, 'avatar', width)
+        return self.profile_picture.url
+
+    @property
+    def avatar_srcset(self):
+        if not self.has_avatar_renditions():
+            return ''
+        return srcset(self.profile_picture.name, 'avatar', AVATAR_RENDITIONS)
+
 class ActivationToken(models.Model):
     user = models.OneToOneField(CustomUser, on_delete=models.CASCADE)
     token = models.CharField(max_length=64, unique=True)
@@ -49,6 +74,41 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
+class Tag(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+    # Number of active projects carrying this tag, maintained by
+    # pages.tag_utils so tag clouds are a single indexed read
+    usage_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-usage_count'], name='tag_usage_count_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+class ProjectQuerySet(models.QuerySet):
+    def for_cards(self):
+        """
+        Everything a project card renders in this one query: creator and
+        category joined, the first image's file name as ``cover_image_name``
+        and the funded percentage as ``progress_percentage``.
+        """
+        cover = ProjectImage.objects.filter(project=models.OuterRef('pk')).order_by('pk')[:1]
+        progress = models.ExpressionWrapper(
+            models.F('current_amount') * 100.0 / models.F('total_target'), output_field=models.FloatField()
+        )
+        return self.select_related('creator', 'category').annotate(
+            cover_image_name=models.Subquery(cover.values('image')),
+            cover_image_ready=models.Subquery(cover.values('has_renditions')),
+            progress_percentage=models.Case(
+                models.When(total_target__gt=0, then=Least(progress, models.Value(100.0))),
+                default=models.Value(0.0),
+                output_field=models.FloatField(),
+            ),
+        )
+
 class Project(models.Model):
     creator = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='created_projects')
     title = models.CharField(max_length=200)
@@ -57,17 +117,58 @@ class Project(models.Model):
     total_target = models.DecimalField(max_digits=10, decimal_places=2)
     current_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     tags = models.CharField(max_length=500, blank=True)  # Comma-separated tags
+    # Normalized copy of `tags`, synced from the raw string by pages.tag_utils
+    tag_objects = models.ManyToManyField(Tag, related_name='projects', blank=True)
     start_date = models.DateTimeField()
     end_date = models.DateTimeField()
     is_featured = models.BooleanField(default=False)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Denormalized engagement counters, kept in sync by the write views and
+    # post_delete signals, and rebuilt in bulk by `manage.py rebuild_counters`
+    # (after raw SQL or queryset.update() changes, which bypass both)
+    donation_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+
+    objects = ProjectQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Newest-first listings and their (created_at, id) cursors. Partial,
+            # because Django filters on a bare "is_active" term that SQLite
+            # can match against an index condition but not a key column.
+            models.Index(
+                fields=['-created_at', '-id'], condition=models.Q(is_active=True), name='project_active_recent_idx'
+            ),
+            models.Index(
+                fields=['category', '-created_at', '-id'], condition=models.Q(is_active=True),
+                name='project_category_recent_idx'
+            ),
+            # Featured section of the home page and a creator's own projects
+            models.Index(
+                fields=['-created_at', '-id'], condition=models.Q(is_active=True, is_featured=True),
+                name='project_featured_recent_idx'
+            ),
+            models.Index(
+                fields=['creator', '-created_at', '-id'], condition=models.Q(is_active=True),
+                name='project_creator_recent_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.title
 
+    def get_average_rating(self):
+        if self.rating_count > 0:
+            return self.rating_sum / self.rating_count
+        return 0
+
     def get_progress_percentage(self):
+        if hasattr(self, 'progress_percentage'):  # Annotated by for_cards()
+            return self.progress_percentage
         if self.total_target > 0:
             return min((self.current_amount / self.total_target) * 100, 100)
         return 0
@@ -75,37 +176,228 @@ class Project(models.Model):
     def can_be_cancelled(self):
         return self.get_progress_percentage() < 25
 
+    def _cover_image(self):
+        """``(file name, renditions ready)`` of the first image, or ``(None, False)``."""
+        if hasattr(self, 'cover_image_name'):  # Annotated by for_cards()
+            return self.cover_image_name, bool(self.cover_image_ready)
+        image = self.images.first()
+        return (image.image.name, image.has_renditions) if image else (None, False)
+
+    @property
+    def cover_image_url(self):
+        name, ready = self._cover_image()
+        if not name:
+            return ''
+        if ready:
+            return rendition_url(name, 'card', PROJECT_IMAGE_RENDITIONS['card'][0])
+        return ProjectImage._meta.get_field('image').storage.url(name)
+
+    @property
+    def cover_srcset(self):
+        name, ready = self._cover_image()
+        return srcset(name, 'card', PROJECT_IMAGE_RENDITIONS) if ready else ''
+
+class FullTextField(models.TextField):
+    """Hidden FTS5 column named after its table; target of ``__match`` lookups."""
+
+
+@FullTextField.register_lookup
+class FullTextMatch(models.Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
+
+
+class ProjectSearchIndex(models.Model):
+    """
+    Read-only view of the ``pages_project_fts`` FTS5 table (SQLite only).
+
+    Rows are written with raw SQL by ``pages.search_utils``; only active
+    projects are indexed. ``rank`` is the bm25 score of the current MATCH.
+    """
+    project = models.OneToOneField(Project, on_delete=models.DO_NOTHING, primary_key=True,
+                                   db_column='rowid', related_name='search_index')
+    title = models.TextField()
+    tags = models.TextField()
+    details = models.TextField()
+    document = FullTextField(db_column='pages_project_fts')
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'pages_project_fts'
+
 class ProjectImage(models.Model):
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='images')
-    image = models.ImageField(upload_to='project_images/')
+    image = models.ImageField(upload_to='project_images/', storage=content_storage)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # Set once the card and carousel renditions exist (pages.image_utils)
+    has_renditions = models.BooleanField(default=False)
 
     def __str__(self):
         return f"Image for {self.project.title}"
 
+    @property
+    def carousel_url(self):
+        if self.has_renditions:
+            return rendition_url(self.image.name, 'carousel', PROJECT_IMAGE_RENDITIONS['carousel'][1])
+        return self.image.url
+
+    @property
+    def carousel_srcset(self):
+        return srcset(self.image.name, 'carousel', PROJECT_IMAGE_RENDITIONS) if self.has_renditions else ''
+
+class SimilarProject(models.Model):
+    """Precomputed nearest neighbours of a project, see pages.recommendation_utils."""
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='similar_links')
+    similar = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['project', 'similar'], name='unique_similar_project'),
+        ]
+        indexes = [
+            models.Index(fields=['project', '-score'], name='similar_project_score_idx'),
+            models.Index(fields=['similar'], name='similar_project_similar_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.similar_id} similar to {self.project_id} ({self.score:.3f})"
+
+class LeaderboardEntry(models.Model):
+    """Bayesian-average rating rank of an active, rated project; see pages.leaderboard_utils."""
+    project = models.OneToOneField(Project, on_delete=models.CASCADE, primary_key=True, related_name='leaderboard_entry')
+    score = models.FloatField()
+    average = models.FloatField()
+    rating_count = models.PositiveIntegerField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-score', '-project'], name='leaderboard_score_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.project_id}: {self.score:.3f}"
+
+class RecommendationFeature(models.Model):
+    """Column layout and IDF weights of the similarity vectors from the last full rebuild."""
+    KIND_CHOICES = [
+        ('term', 'Term'),
+        ('tag', 'Tag'),
+        ('category', 'Category'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    key = models.CharField(max_length=100)
+    column = models.PositiveIntegerField()
+    weight = models.FloatField(default=1.0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'key'], name='unique_recommendation_feature'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}:{self.key}"
+
+# Donation, Rating, Comment, Report, DonorSummary and DonationRollup can live
+# in another database (see pages.db_utils), so their keys to Project and
+# CustomUser carry no database constraint; deleting a project or user still
+# removes them.
+
 class Comment(models.Model):
-    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='comments')
-    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='comments', db_constraint=False)
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, db_constraint=False)
     content = models.TextField()
     parent_comment = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Pages of a project's top-level comments (pages.comment_utils)
+            models.Index(
+                fields=['project', '-created_at', '-id'], condition=models.Q(parent_comment=None),
+                name='comment_thread_idx'
+            ),
+        ]
+
     def __str__(self):
         return f"Comment by {self.user.username} on {self.project.title}"
 
 class Donation(models.Model):
-    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='donations')
-    donor = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='donations')
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='donations', db_constraint=False)
+    # Indexed by donation_donor_project_idx and donation_donor_recent_idx
+    donor = models.ForeignKey(
+        CustomUser, on_delete=models.CASCADE, related_name='donations', db_constraint=False, db_index=False
+    )
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     message = models.TextField(blank=True)
+    # Client-supplied key so a double-submitted form is only charged once
+    idempotency_key = models.CharField(max_length=64, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['donor', 'idempotency_key'], name='unique_donation_idempotency_key'),
+        ]
+        indexes = [
+            models.Index(fields=['donor', '-created_at', '-id'], name='donation_donor_recent_idx'),
+            # "First donation to this project?" when updating the DonorSummary
+            models.Index(fields=['donor', 'project'], name='donation_donor_project_idx'),
+        ]
+
     def __str__(self):
         return f"${self.amount} donation to {self.project.title}"
 
+class DonorSummary(models.Model):
+    """A user's running donation totals for the profile page, kept by pages.donation_utils.record_donation."""
+    user = models.OneToOneField(
+        CustomUser, on_delete=models.CASCADE, primary_key=True, related_name='donor_summary', db_constraint=False
+    )
+    total_donated = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    donation_count = models.PositiveIntegerField(default=0)
+    projects_backed = models.PositiveIntegerField(default=0)
+    last_donation_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Donation summary of {self.user_id}"
+
+class DonationRollup(models.Model):
+    """Donations per hour or day to one project or category, kept by pages.rollup_utils."""
+    SCOPE_CHOICES = [
+        ('project', 'Project'),
+        ('category', 'Category'),
+    ]
+    PERIOD_CHOICES = [
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+    ]
+
+    scope = models.CharField(max_length=10, choices=SCOPE_CHOICES)
+    # The project or category id; no foreign key, the buckets outlive a deleted project
+    scope_id = models.PositiveBigIntegerField()
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    bucket = models.DateTimeField()  # Start of the hour or (UTC) day
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    donation_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # Also the index a series is read from: one range scan over bucket
+            models.UniqueConstraint(fields=['scope', 'scope_id', 'period', 'bucket'], name='unique_donation_rollup'),
+        ]
+
+    def __str__(self):
+        return f"{self.scope} {self.scope_id} {self.period} {self.bucket:%Y-%m-%d %H:%M}"
+
 class Rating(models.Model):
-    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='ratings')
-    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='ratings', db_constraint=False)
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, db_constraint=False)
     rating = models.IntegerField(choices=[(i, i) for i in range(1, 6)])  # 1-5 stars
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -121,13 +413,95 @@ class Report(models.Model):
         ('comment', 'Comment'),
     ]
     
-    reporter = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    reporter = models.ForeignKey(CustomUser, on_delete=models.CASCADE, db_constraint=False)
     report_type = models.CharField(max_length=10, choices=REPORT_TYPES)
-    project = models.ForeignKey(Project, on_delete=models.CASCADE, null=True, blank=True)
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, null=True, blank=True, db_constraint=False)
     comment = models.ForeignKey(Comment, on_delete=models.CASCADE, null=True, blank=True)
     reason = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     is_resolved = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # The moderation queue: unresolved reports, newest first
+            models.Index(
+                fields=['-created_at', '-id'], condition=models.Q(is_resolved=False), name='report_unresolved_idx'
+            ),
+        ]
+
     def __str__(self):
         return f"Report by {self.reporter.username} on {self.get_report_type_display()}"
+
+class OutboxEmail(models.Model):
+    """An email queued by a view and delivered by `manage.py send_queued_email`."""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    from_email = models.CharField(max_length=254)
+    to = models.EmailField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    # Set while a worker holds the message; expired claims are picked up again
+    claimed_by = models.CharField(max_length=32, blank=True)
+    claimed_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {self.to} ({self.status})"
+
+class StagedImage(models.Model):
+    """An upload waiting for pages.ingest_utils to validate, shrink and attach it."""
+    TARGET_CHOICES = [
+        ('project_image', 'Project image'),
+        ('profile_picture', 'Profile picture'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('failed', 'Failed'),
+    ]
+
+    file = models.FileField(upload_to='staging/')
+    target = models.CharField(max_length=20, choices=TARGET_CHOICES)
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='staged_images')
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, null=True, blank=True, related_name='staged_images')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    # Set while a worker holds the upload; expired claims are picked up again
+    claimed_by = models.CharField(max_length=32, blank=True)
+    claimed_until = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='staged_image_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_target_display()} from {self.user_id} ({self.status})"
+
+
+class StoredFile(models.Model):
+    """A file kept once by pages.storage_utils.ContentAddressedStorage, with its reference count."""
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField()
+    references = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.references} references)"
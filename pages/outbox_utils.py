@@ -0,0 +1,180 @@
+import random
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from smtplib import SMTPServerDisconnected
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 30  # Seconds before the first retry, doubled on every attempt
+BACKOFF_MAX = 60 * 60
+CLAIM_LEASE = timedelta(minutes=5)
+BATCH_SIZE = 20
+
+
+def enqueue_email(subject, to, body, html_body='', from_email=None):
+    """Queue one message; it is only visible to workers once the caller's transaction commits."""
+    return OutboxEmail.objects.create(
+        subject=subject,
+        body=body,
+        html_body=html_body,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to=to,
+    )
+
+
+def enqueue_emails(messages, from_email=None):
+    """Queue ``(subject, to, body, html_body)`` messages with one bulk insert."""
+    from_email = from_email or settings.DEFAULT_FROM_EMAIL
+    return OutboxEmail.objects.bulk_create([
+        OutboxEmail(subject=subject, body=body, html_body=html_body, from_email=from_email, to=to)
+        for subject, to, body, html_body in messages
+    ])
+
+
+def backoff_delay(attempts):
+    """Exponential backoff in seconds, half of it jittered so retries spread out."""
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def claim_batch(worker_id, limit=BATCH_SIZE):
+    """
+    Mark up to ``limit`` due messages as held by ``worker_id`` and return
+    them. The claim is a single UPDATE, so concurrent workers never share a
+    message; a worker that dies leaves its claims to expire after CLAIM_LEASE.
+    """
+    now = timezone.now()
+    due = OutboxEmail.objects.filter(
+        Q(status='pending', next_attempt_at__lte=now) | Q(status='sending', claimed_until__lt=now)
+    ).order_by('next_attempt_at').values('pk')[:limit]
+    claimed = OutboxEmail.objects.filter(pk__in=due).update(
+        status='sending', claimed_by=worker_id, claimed_until=now + CLAIM_LEASE
+    )
+    if not claimed:
+        return []
+    return list(OutboxEmail.objects.filter(status='sending', claimed_by=worker_id).order_by('pk'))
+
+
+class DeliveryStats:
+    """Thread-safe counters and send latencies for one drain."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.connections = 0
+        self.latencies = []
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def record(self, outcome, latency=None):
+        with self.lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+            if latency is not None:
+                self.latencies.append(latency)
+
+    def summary(self):
+        lines = [
+            f"sent {self.sent}, retrying {self.retried}, failed {self.failed} "
+            f"in {self.elapsed:.2f}s over {self.connections} connection(s)",
+        ]
+        if self.latencies:
+            latencies = sorted(self.latencies)
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            lines.append(
+                f"{self.sent / self.elapsed if self.elapsed else 0:.1f} msg/s, "
+                f"send latency p50 {statistics.median(latencies) * 1000:.1f} ms, p95 {p95 * 1000:.1f} ms"
+            )
+        return '\n'.join(lines)
+
+
+def _send(message, mail_connection):
+    email = EmailMultiAlternatives(
+        subject=message.subject,
+        body=message.body,
+        from_email=message.from_email,
+        to=[message.to],
+        connection=mail_connection,
+    )
+    if message.html_body:
+        email.attach_alternative(message.html_body, 'text/html')
+    email.send()
+
+
+def _mark_sent(message):
+    OutboxEmail.objects.filter(pk=message.pk).update(
+        status='sent', sent_at=timezone.now(), attempts=message.attempts + 1,
+        claimed_by='', claimed_until=None, last_error=''
+    )
+
+
+def _mark_failed(message, error, max_attempts):
+    """Schedule a retry, or give up after ``max_attempts``. Returns the stats outcome."""
+    attempts = message.attempts + 1
+    retry = attempts < max_attempts
+    OutboxEmail.objects.filter(pk=message.pk).update(
+        status='pending' if retry else 'failed',
+        attempts=attempts,
+        next_attempt_at=timezone.now() + timedelta(seconds=backoff_delay(attempts)),
+        claimed_by='', claimed_until=None, last_error=f'{type(error).__name__}: {error}'[:2000]
+    )
+    return 'retried' if retry else 'failed'
+
+
+def _work(stats, batch_size, max_attempts, stop):
+    """One pool thread: claim batches and send them over a single reused connection."""
+    worker_id = uuid.uuid4().hex
+    mail_connection = get_connection()
+    try:
+        while not stop.is_set():
+            batch = claim_batch(worker_id, batch_size)
+            if not batch:
+                return
+            if mail_connection.open():
+                stats.record('connections')
+            for message in batch:
+                start = time.perf_counter()
+                try:
+                    try:
+                        _send(message, mail_connection)
+                    except SMTPServerDisconnected:
+                        # The server dropped an idle connection; reconnect once
+                        mail_connection.close()
+                        mail_connection.open()
+                        stats.record('connections')
+                        _send(message, mail_connection)
+                except Exception as e:
+                    stats.record(_mark_failed(message, e, max_attempts))
+                else:
+                    _mark_sent(message)
+                    stats.record('sent', time.perf_counter() - start)
+    finally:
+        mail_connection.close()
+        connection.close()  # The thread's own database connection
+
+
+def drain_outbox(workers=4, batch_size=BATCH_SIZE, max_attempts=MAX_ATTEMPTS, stop=None):
+    """
+    Deliver every due message with a pool of ``workers`` threads, each
+    reusing one mail connection, and return the DeliveryStats.
+    """
+    stats = DeliveryStats()
+    stop = stop or threading.Event()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='outbox') as pool:
+        futures = [pool.submit(_work, stats, batch_size, max_attempts, stop) for _ in range(workers)]
+        for future in futures:
+            future.result()
+    stats.elapsed = time.perf_counter() - stats.started
+    return stats
@@ -0,0 +1,125 @@
+import hashlib
+
+from django.conf import settings
+from django.core import signing
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+from .cache_utils import get_or_build
+
+CURSOR_SALT = 'pages.pagination.cursor'
+
+
+def keyset_enabled(request):
+    """Cursor mode is opt-in: site-wide via settings or per request with ``?cursor=``."""
+    return getattr(settings, 'PAGES_KEYSET_PAGINATION', False) or 'cursor' in request.GET
+
+
+def cached_count(queryset, group='projects'):
+    """
+    ``queryset.count()`` cached in ``group`` (see pages.cache_utils), so it is
+    only recounted after a write that invalidates the group.
+    """
+    queryset = queryset.order_by()
+    digest = hashlib.md5(str(queryset.query).encode()).hexdigest()
+    return get_or_build(f'count:{queryset.model._meta.label_lower}:{digest}', group, queryset.count)
+
+
+class CachedCountPaginator(Paginator):
+    """Offset paginator whose total comes from ``cached_count`` instead of a COUNT per request."""
+
+    def __init__(self, *args, count_group='projects', **kwargs):
+        self.count_group = count_group
+        super().__init__(*args, **kwargs)
+
+    @cached_property
+    def count(self):
+        return cached_count(self.object_list, self.count_group)
+
+
+def encode_cursor(instance, direction):
+    return signing.dumps([instance.created_at.isoformat(), instance.pk, direction], salt=CURSOR_SALT)
+
+
+def decode_cursor(cursor):
+    """Return ``(created_at, pk, direction)``, or None for a missing or tampered cursor."""
+    try:
+        created_at, pk, direction = signing.loads(cursor, salt=CURSOR_SALT)
+    except (signing.BadSignature, TypeError, ValueError):
+        return None
+    created_at = parse_datetime(created_at)
+    if created_at is None or direction not in ('next', 'prev') or not isinstance(pk, int):
+        return None
+    return created_at, pk, direction
+
+
+class KeysetPage:
+    """
+    One page of a newest-first listing, keyed on ``(created_at, id)``.
+    Iterates like a Paginator page; links use ``next_cursor``/``previous_cursor``.
+    """
+
+    def __init__(self, object_list, has_next, has_previous, count):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.count = count
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    @property
+    def next_cursor(self):
+        return encode_cursor(self.object_list[-1], 'next') if self.has_next else ''
+
+    @property
+    def previous_cursor(self):
+        return encode_cursor(self.object_list[0], 'prev') if self.has_previous else ''
+
+
+def keyset_paginate(queryset, cursor, per_page, count_group='projects'):
+    """
+    Return the ``KeysetPage`` after or before ``cursor``. Each page is a single
+    ``LIMIT per_page + 1`` range scan over a ``(..., created_at, id)`` index,
+    however deep it is. ``queryset``'s own ordering is replaced. With
+    ``count_group=None`` no total is counted and ``count`` is None.
+
+    ``(created_at, id) < (c, pk)`` is spelled as ``created_at <= c AND
+    (created_at < c OR id < pk)``: the plain range term lets SQLite walk the
+    index in order, where an OR of the two cases makes it sort.
+    """
+    count = cached_count(queryset, count_group) if count_group else None
+    position = decode_cursor(cursor) if cursor else None
+
+    if position is None:
+        rows = list(queryset.order_by('-created_at', '-id')[:per_page + 1])
+        return KeysetPage(rows[:per_page], len(rows) > per_page, False, count)
+
+    created_at, pk, direction = position
+    if direction == 'next':
+        rows = list(queryset.filter(
+            Q(created_at__lt=created_at) | Q(id__lt=pk),
+            created_at__lte=created_at
+        ).order_by('-created_at', '-id')[:per_page + 1])
+        return KeysetPage(rows[:per_page], len(rows) > per_page, True, count)
+
+    # Walk backwards in ascending order, then restore newest-first
+    rows = list(queryset.filter(
+        Q(created_at__gt=created_at) | Q(id__gt=pk),
+        created_at__gte=created_at
+    ).order_by('created_at', 'id')[:per_page + 1])
+    has_previous = len(rows) > per_page
+    rows = rows[:per_page]
+    rows.reverse()
+    return KeysetPage(rows, True, has_previous, count)
@@ -0,0 +1,323 @@
+import logging
+import math
+import re
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Min, Q
+
+from .models import Project, RecommendationFeature, SimilarProject
+
+try:
+    import numpy as np
+except ImportError:  # Recommendations are disabled without NumPy
+    np = None
+
+TOP_K = 8
+MAX_TERMS = 512
+MAX_TAGS = 256
+# Upper bound on the projects sharing a tag or category that an incremental
+# update scores against
+MAX_CANDIDATES = 2000
+BATCH_SIZE = 256
+MIN_SCORE = 0.01
+
+logger = logging.getLogger(__name__)
+# One thread per web process rescores saved projects, so saves never wait on it
+_dispatcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix='recommendations')
+
+# Each block of a vector is L2-normalized on its own and scaled so that the
+# dot product of two vectors is this weighted sum of per-block cosines
+BLOCK_WEIGHTS = {'term': 0.35, 'tag': 0.5, 'category': 0.15}
+
+STOP_WORDS = frozenset(
+    'the and for with this that from are was were will have has our your their '
+    'you they into about over more than its can all also been which who project projects'.split()
+)
+
+_WORD_RE = re.compile(r'[^\W\d_]{3,}', re.UNICODE)
+
+
+def recommendations_enabled():
+    return np is not None
+
+
+def _terms(title, details):
+    return [word for word in _WORD_RE.findall(f'{title} {details}'.lower()) if word not in STOP_WORDS]
+
+
+class FeatureSpace:
+    """
+    Column layout of the project vectors: TF-IDF terms, tags and categories,
+    each block stored contiguously. Persisted as RecommendationFeature rows so
+    incremental updates vectorize against the same columns as the last rebuild.
+    """
+
+    def __init__(self, features):
+        self.columns = {kind: {} for kind in BLOCK_WEIGHTS}
+        self.size = len(features)
+        self.weights = np.ones(self.size, dtype=np.float32)
+        self.blocks = {}
+        for kind, key, column, weight in features:
+            self.columns[kind][key] = column
+            self.weights[column] = weight
+            start, stop = self.blocks.get(kind, (column, column + 1))
+            self.blocks[kind] = (min(start, column), max(stop, column + 1))
+
+    @classmethod
+    def build(cls, documents):
+        total = len(documents)
+        term_df, tag_df, categories = Counter(), Counter(), set()
+        for title, details, tag_names, category_id in documents:
+            term_df.update(set(_terms(title, details)))
+            tag_df.update(set(tag_names))
+            categories.add(category_id)
+
+        # Terms in more than half of the projects carry no signal; terms and
+        # tags used only once can never make two projects similar
+        terms = [term for term, df in term_df.most_common() if 2 <= df <= total / 2][:MAX_TERMS]
+        tags = [tag for tag, df in tag_df.most_common() if df >= 2][:MAX_TAGS]
+
+        features = []
+        for term in terms:
+            features.append(('term', term, len(features), math.log((1 + total) / (1 + term_df[term])) + 1))
+        for tag in tags:
+            features.append(('tag', tag, len(features), math.log((1 + total) / (1 + tag_df[tag])) + 1))
+        for category_id in sorted(categories):
+            features.append(('category', str(category_id), len(features), 1.0))
+        return cls(features)
+
+    @classmethod
+    def load(cls):
+        features = list(RecommendationFeature.objects.values_list('kind', 'key', 'column', 'weight'))
+        return cls(features) if features else None
+
+    def save(self):
+        RecommendationFeature.objects.all().delete()
+        RecommendationFeature.objects.bulk_create([
+            RecommendationFeature(kind=kind, key=key, column=column, weight=float(self.weights[column]))
+            for kind, keys in self.columns.items()
+            for key, column in keys.items()
+        ], batch_size=1000)
+
+    def vectorize(self, documents):
+        """Return a float32 matrix with one weighted, normalized row per document."""
+        rows, columns, values = [], [], []
+        term_columns = self.columns['term']
+        tag_columns = self.columns['tag']
+        category_columns = self.columns['category']
+        for row, (title, details, tag_names, category_id) in enumerate(documents):
+            for term, count in Counter(_terms(title, details)).items():
+                column = term_columns.get(term)
+                if column is not None:
+                    rows.append(row)
+                    columns.append(column)
+                    values.append(1 + math.log(count))
+            for tag in tag_names:
+                column = tag_columns.get(tag)
+                if column is not None:
+                    rows.append(row)
+                    columns.append(column)
+                    values.append(1.0)
+            column = category_columns.get(str(category_id))
+            if column is not None:
+                rows.append(row)
+                columns.append(column)
+                values.append(1.0)
+
+        matrix = np.zeros((len(documents), self.size), dtype=np.float32)
+        if rows:
+            matrix[rows, columns] = values
+        matrix *= self.weights
+        for kind, (start, stop) in self.blocks.items():
+            block = matrix[:, start:stop]
+            norms = np.linalg.norm(block, axis=1, keepdims=True)
+            block /= np.where(norms > 0, norms, 1)
+            block *= math.sqrt(BLOCK_WEIGHTS[kind])
+        return matrix
+
+
+def _load_documents(queryset):
+    """Return ``(ids, documents)`` for the projects in ``queryset``."""
+    rows = list(queryset.values_list('id', 'title', 'details', 'category_id'))
+    tag_names = defaultdict(list)
+    links = Project.tag_objects.through.objects.filter(project__in=queryset.values('pk'))
+    for project_id, name in links.values_list('project_id', 'tag__name').iterator():
+        tag_names[project_id].append(name)
+    ids = [row[0] for row in rows]
+    documents = [(title, details, tag_names[pk], category_id) for pk, title, details, category_id in rows]
+    return ids, documents
+
+
+def _top_links(query_ids, corpus_ids, scores, top_k):
+    """Yield SimilarProject rows for the ``top_k`` best scores of every query row."""
+    top_k = min(top_k, scores.shape[1])
+    if top_k <= 0:
+        return
+    best = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+    best_scores = np.take_along_axis(scores, best, axis=1)
+    for row, project_id in enumerate(query_ids):
+        for column, score in zip(best[row], best_scores[row]):
+            if score > MIN_SCORE:
+                yield SimilarProject(project_id=project_id, similar_id=corpus_ids[column], score=float(score))
+
+
+def rebuild_similar_projects(top_k=TOP_K, batch_size=BATCH_SIZE):
+    """
+    Recompute the neighbours of every active project from scratch, scoring a
+    batch of projects against the whole corpus per matrix product.
+    Returns ``(projects, links)``.
+    """
+    ids, documents = _load_documents(Project.objects.filter(is_active=True))
+    space = FeatureSpace.build(documents)
+    matrix = space.vectorize(documents)
+
+    links = 0
+    with transaction.atomic():
+        space.save()
+        SimilarProject.objects.all().delete()
+        for start in range(0, len(ids), batch_size):
+            scores = matrix[start:start + batch_size] @ matrix.T
+            rows = np.arange(scores.shape[0])
+            scores[rows, rows + start] = -1  # A project is not similar to itself
+            batch = list(_top_links(ids[start:start + batch_size], ids, scores, top_k))
+            SimilarProject.objects.bulk_create(batch, batch_size=1000)
+            links += len(batch)
+    return len(ids), links
+
+
+def _replace_links(project_ids, space, top_k):
+    """
+    Recompute the lists of the active projects among ``project_ids`` against
+    the most recent active projects sharing a category or a tag with any of
+    them; the lists of the others are dropped. Returns ``(ids, candidate_ids,
+    scores)``, one row of scores per active project in ``ids``.
+    """
+    SimilarProject.objects.filter(project__in=project_ids).delete()
+    projects = Project.objects.filter(pk__in=project_ids, is_active=True)
+    ids, documents = _load_documents(projects)
+    if not ids:
+        return ids, [], None
+    candidates = Project.objects.filter(
+        Q(category_id__in=projects.values('category_id'))
+        | Q(tag_objects__in=Project.tag_objects.through.objects.filter(project__in=ids).values('tag')),
+        is_active=True
+    ).distinct().order_by('-created_at')[:MAX_CANDIDATES]
+    candidate_ids, candidate_documents = _load_documents(candidates)
+    if not candidate_ids:
+        return ids, [], None
+
+    vectors = space.vectorize(documents + candidate_documents)
+    scores = vectors[:len(ids)] @ vectors[len(ids):].T
+    columns = {pk: column for column, pk in enumerate(candidate_ids)}
+    for row, pk in enumerate(ids):
+        if pk in columns:
+            scores[row, columns[pk]] = -1  # A project is not similar to itself
+    SimilarProject.objects.bulk_create(_top_links(ids, candidate_ids, scores, top_k))
+    return ids, candidate_ids, scores
+
+
+def refill_similar_projects(project_ids, top_k=TOP_K):
+    """Rescore the lists of ``project_ids`` in full, e.g. after a project they listed was deleted."""
+    if np is None or not project_ids:
+        return
+    space = FeatureSpace.load()
+    if space is None:
+        return
+    with transaction.atomic():
+        _replace_links(list(project_ids), space, top_k)
+
+
+def update_similar_projects(project_id, top_k=TOP_K):
+    """
+    Refresh the links from and to one created, edited or cancelled project.
+    Its own list and the lists holding it are rescored in full, so none of
+    them shrinks when it changes or drops out, and it joins the lists of the
+    other projects it was scored against where it beats their weakest link.
+    """
+    if np is None:
+        return
+    space = FeatureSpace.load()
+    if space is None:
+        return  # Nothing to update until the first full rebuild
+
+    with transaction.atomic():
+        listed_by = set(SimilarProject.objects.filter(similar_id=project_id).values_list('project_id', flat=True))
+        ids, candidate_ids, scores = _replace_links([project_id, *listed_by], space, top_k)
+        if project_id not in ids or scores is None:
+            return  # Cancelled or deleted: its links are gone and the lists holding it refilled
+        own_scores = scores[ids.index(project_id)].tolist()
+
+        # Add the project to candidates' lists where it beats their weakest link
+        others = [pk for pk in candidate_ids if pk not in listed_by and pk != project_id]
+        existing = {
+            pk: (count, weakest)
+            for pk, count, weakest in SimilarProject.objects.filter(
+                project__in=others
+            ).values('project').annotate(
+                count=Count('id'), weakest=Min('score')
+            ).values_list('project', 'count', 'weakest')
+        }
+        new_links, full = [], []
+        for candidate_id, score in zip(candidate_ids, own_scores):
+            if candidate_id in listed_by or candidate_id == project_id or score <= MIN_SCORE:
+                continue
+            count, weakest = existing.get(candidate_id, (0, 0.0))
+            if count >= top_k:
+                if score <= weakest:
+                    continue
+                full.append(candidate_id)
+            new_links.append(SimilarProject(project_id=candidate_id, similar_id=project_id, score=score))
+
+        if full:
+            weakest_links = {}
+            for link_id, pk in SimilarProject.objects.filter(
+                project__in=full
+            ).order_by('project', '-score').values_list('id', 'project'):
+                weakest_links[pk] = link_id
+            SimilarProject.objects.filter(pk__in=weakest_links.values()).delete()
+        SimilarProject.objects.bulk_create(new_links)
+
+
+def update_mode():
+    """
+    PAGES_RECOMMENDATION_UPDATES: 'background' (default) rescores saved
+    projects in a thread of the web process once the save commits, 'inline'
+    right after the commit, before the response, and 'off' leaves it to
+    ``manage.py rebuild_recommendations``.
+    """
+    return getattr(settings, 'PAGES_RECOMMENDATION_UPDATES', 'background')
+
+
+def updates_enabled():
+    return np is not None and update_mode() != 'off'
+
+
+def schedule_update(function, *args):
+    """Run ``function(*args)`` (update or refill) after the current transaction commits, as ``update_mode()`` says."""
+    if not updates_enabled():
+        return
+    if update_mode() == 'inline':
+        transaction.on_commit(lambda: function(*args))
+    else:
+        transaction.on_commit(lambda: _dispatcher.submit(_update_in_background, function, *args))
+
+
+def _update_in_background(function, *args):
+    try:
+        function(*args)
+    except Exception:
+        logger.exception('Error updating similar projects')
+    finally:
+        connection.close()
+
+
+def similar_projects_for(project, limit=4):
+    """The precomputed neighbours of ``project`` as card-ready projects, best first."""
+    similar_ids = list(SimilarProject.objects.filter(
+        project=project, similar__is_active=True
+    ).order_by('-score').values_list('similar_id', flat=True)[:limit])
+    cards = Project.objects.for_cards().in_bulk(similar_ids)
+    return [cards[pk] for pk in similar_ids if pk in cards]
@@ -0,0 +1,127 @@
+from collections import defaultdict
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncHour
+
+from .db_utils import engagement_db
+from .models import Donation, DonationRollup, Project
+
+PERIODS = ('hour', 'day')
+# Series longer than this are cut to their newest buckets
+MAX_BUCKETS = {'hour': 24 * 31, 'day': 366 * 2}
+
+
+def bucket_start(moment, period):
+    """Start of the UTC hour or day ``moment`` falls in."""
+    moment = moment.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0) if period == 'day' else moment
+
+
+def add_to_rollups(donation, category_id):
+    """
+    Add ``donation`` to the hour and day buckets of its project and of
+    ``category_id`` (None for an uncategorized project), creating the buckets
+    it opens. Run inside the donation's transaction.
+    """
+    scopes = [('project', donation.project_id)]
+    if category_id is not None:
+        scopes.append(('category', category_id))
+    for scope, scope_id in scopes:
+        for period in PERIODS:
+            _add(scope, scope_id, period, bucket_start(donation.created_at, period), donation.amount)
+
+
+def _add(scope, scope_id, period, bucket, amount):
+    # Incremented in the database like the project counters; a single UPDATE
+    # on the unique index once the bucket exists
+    rows = DonationRollup.objects.filter(scope=scope, scope_id=scope_id, period=period, bucket=bucket)
+    changes = {'amount': F('amount') + amount, 'donation_count': F('donation_count') + 1}
+    if rows.update(**changes):
+        return
+    try:
+        with transaction.atomic(using=engagement_db()):
+            DonationRollup.objects.create(
+                scope=scope, scope_id=scope_id, period=period, bucket=bucket, amount=amount, donation_count=1
+            )
+    except IntegrityError:  # A concurrent donation opened it meanwhile
+        rows.update(**changes)
+
+
+def rollup_totals(hourly, project_categories):
+    """
+    Every bucket implied by ``hourly``, ``{(project id, hour start): (amount,
+    count)}``, as ``{(scope, scope id, period, bucket): [amount, count]}``:
+    the day buckets and the category ones are sums of the project hours.
+    """
+    totals = defaultdict(lambda: [0, 0])
+    for (project_id, hour), (amount, count) in hourly.items():
+        scopes = [('project', project_id)]
+        category_id = project_categories.get(project_id)
+        if category_id is not None:
+            scopes.append(('category', category_id))
+        for scope, scope_id in scopes:
+            for period in PERIODS:
+                total = totals[(scope, scope_id, period, bucket_start(hour, period))]
+                total[0] += amount
+                total[1] += count
+    return totals
+
+
+def rebuild_rollups(using=None, batch_size=1000):
+    """Recompute every DonationRollup from the donations in ``using`` (their database by default). Returns the count."""
+    using = using or engagement_db()
+    hourly = {
+        (row['project'], row['hour']): (row['amount'], row['count'])
+        for row in (
+            Donation.objects.using(using).order_by()
+            .annotate(hour=TruncHour('created_at', tzinfo=dt_timezone.utc))
+            .values('project', 'hour')
+            .annotate(amount=Sum('amount'), count=Count('id'))
+            .iterator()
+        )
+    }
+    # Projects stay in the default database when the engagement tables are split out
+    categories = dict(Project.objects.using(DEFAULT_DB_ALIAS).values_list('pk', 'category_id').iterator())
+    totals = rollup_totals(hourly, categories)
+    with transaction.atomic(using=using):
+        DonationRollup.objects.using(using).all().delete()
+        DonationRollup.objects.using(using).bulk_create(
+            (
+                DonationRollup(
+                    scope=scope, scope_id=scope_id, period=period, bucket=bucket, amount=amount, donation_count=count
+                )
+                for (scope, scope_id, period, bucket), (amount, count) in totals.items()
+            ),
+            batch_size=batch_size,
+        )
+    return len(totals)
+
+
+def donation_series(scope, scope_id, period, start=None, end=None):
+    """
+    ``([(bucket, amount, donation count)], truncated)`` of one project or
+    category, oldest first, for buckets in ``[start, end)``; empty buckets
+    are left out. One range scan of the unique index: at most
+    MAX_BUCKETS[period] newest rows, ``truncated`` when older ones were cut.
+    """
+    rows = DonationRollup.objects.filter(scope=scope, scope_id=scope_id, period=period)
+    if start is not None:
+        rows = rows.filter(bucket__gte=bucket_start(start, period))
+    if end is not None:
+        rows = rows.filter(bucket__lt=end)
+    limit = MAX_BUCKETS[period]
+    newest = list(rows.order_by('-bucket').values_list('bucket', 'amount', 'donation_count')[:limit + 1])
+    return list(reversed(newest[:limit])), len(newest) > limit
+
+
+def totals_before(scope, scope_id, period, bucket=None):
+    """``(amount, donation count)`` of the buckets before ``bucket`` (all of them for None), in one aggregate."""
+    rows = DonationRollup.objects.filter(scope=scope, scope_id=scope_id, period=period)
+    if bucket is not None:
+        rows = rows.filter(bucket__lt=bucket)
+    totals = rows.aggregate(amount=Sum('amount'), donations=Sum('donation_count'))
+    # SQLite sums drop the column's scale
+    return (totals['amount'] or Decimal('0')).quantize(Decimal('0.01')), totals['donations'] or 0
@@ -0,0 +1,75 @@
+import re
+
+from django.db import connection
+from django.db.models import F, Q
+
+# Created by migration 0008; ranked with bm25 weights 10/5/1 for
+# title, tags and details
+FTS_TABLE = 'pages_project_fts'
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def fts_enabled():
+    return connection.vendor == 'sqlite'
+
+
+def index_project(project):
+    """Add or refresh one project; inactive projects are dropped from the index."""
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [project.pk])
+        if project.is_active:
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE}(rowid, title, tags, details) VALUES (%s, %s, %s, %s)",
+                [project.pk, project.title, project.tags, project.details]
+            )
+
+
+def remove_project(project_id):
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [project_id])
+
+
+def rebuild_index():
+    """Repopulate the index from all active projects. Returns the row count."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}(rowid, title, tags, details) "
+            f"SELECT id, title, tags, details FROM pages_project WHERE is_active"
+        )
+        count = cursor.rowcount
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+        # Without table statistics the planner may drive filtered searches
+        # from the category index and re-run the MATCH for every row
+        cursor.execute("ANALYZE pages_project")
+    return count
+
+
+def build_match_expression(search_query):
+    """
+    Turn free text into an FTS5 query: every word must match, and the words
+    are prefix matches so keystroke-driven searches find partial words.
+    """
+    words = _WORD_RE.findall(search_query)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search_projects(projects, search_query):
+    """Filter ``projects`` by ``search_query``, best matches first."""
+    match = build_match_expression(search_query)
+    if not fts_enabled() or not match:
+        return projects.filter(
+            Q(title__icontains=search_query) |
+            Q(tags__icontains=search_query) |
+            Q(details__icontains=search_query)
+        )
+    return projects.filter(
+        search_index__document__match=match
+    ).annotate(
+        search_rank=F('search_index__rank')
+    ).order_by('search_rank', '-created_at')
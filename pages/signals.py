@@ -0,0 +1,231 @@
+import logging
+
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .cache_utils import invalidate
+from .db_utils import delete_engagement
+from .image_utils import generate_avatar_renditions, generate_project_image_renditions
+from .ingest_utils import schedule_renditions
+from .leaderboard_utils import update_project_rank
+from .models import Category, Comment, CustomUser, Donation, Project, ProjectImage, Rating, SimilarProject
+from .recommendation_utils import refill_similar_projects, schedule_update, update_similar_projects, updates_enabled
+from .search_utils import index_project, remove_project
+from .tag_utils import release_project_tags, sync_project_tags
+
+logger = logging.getLogger(__name__)
+
+
+SEARCHED_FIELDS = {'title', 'details', 'tags', 'is_active'}
+# What the similar-projects vectors are built from
+SCORED_FIELDS = {'title', 'details', 'tags', 'category', 'is_active'}
+
+
+def saves_any(update_fields, fields):
+    """Whether a save with ``update_fields`` (None for every field) may have changed any of ``fields``."""
+    return update_fields is None or not fields.isdisjoint(update_fields)
+
+
+@receiver(post_save, sender=Project)
+def update_project_search_index(sender, instance, update_fields=None, **kwargs):
+    if saves_any(update_fields, SEARCHED_FIELDS):
+        index_project(instance)
+
+
+@receiver(post_delete, sender=Project)
+def remove_project_from_search_index(sender, instance, **kwargs):
+    remove_project(instance.pk)
+
+
+@receiver(post_save, sender=Project)
+def update_project_tags(sender, instance, update_fields=None, **kwargs):
+    if saves_any(update_fields, {'tags', 'is_active'}):
+        sync_project_tags(instance)
+
+
+@receiver(pre_delete, sender=Project)
+def release_tags_of_deleted_project(sender, instance, **kwargs):
+    release_project_tags(instance)
+
+
+@receiver(pre_delete, sender=Project)
+@receiver(pre_delete, sender=CustomUser)
+def delete_engagement_in_other_database(sender, instance, **kwargs):
+    # CASCADE stops at the database boundary once the engagement tables are split out
+    delete_engagement(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_deleted_comment(sender, instance, **kwargs):
+    # Deletes from the admin, the ORM or a cascade; the write paths in views
+    # count new rows. The guard keeps a drifted counter from going negative
+    # (rebuild_counters puts it right). current_amount, the money raised,
+    # is left as it is.
+    Project.objects.filter(pk=instance.project_id, comment_count__gt=0).update(comment_count=F('comment_count') - 1)
+
+
+@receiver(post_delete, sender=Donation)
+def uncount_deleted_donation(sender, instance, **kwargs):
+    Project.objects.filter(pk=instance.project_id, donation_count__gt=0).update(donation_count=F('donation_count') - 1)
+
+
+@receiver(post_delete, sender=Rating)
+def uncount_deleted_rating(sender, instance, **kwargs):
+    Project.objects.filter(pk=instance.project_id, rating_count__gt=0, rating_sum__gte=instance.rating).update(
+        rating_count=F('rating_count') - 1, rating_sum=F('rating_sum') - instance.rating
+    )
+    update_project_rank(instance.project_id)
+
+
+@receiver(pre_save, sender=Project)
+def note_scored_field_changes(sender, instance, update_fields=None, **kwargs):
+    # Saves of other fields (counters, featuring, dates) leave the neighbours as they are
+    if not updates_enabled():
+        return
+    if instance._state.adding:
+        instance._rescore_similar = True
+        return
+    fields = [name for name in SCORED_FIELDS if update_fields is None or name in update_fields]
+    if update_fields is not None and 'category_id' in update_fields:
+        fields.append('category')
+    stored = Project.objects.filter(pk=instance.pk).values(*fields).first() if fields else {}
+    instance._rescore_similar = stored is None or any(
+        stored[name] != getattr(instance, 'category_id' if name == 'category' else name) for name in stored
+    )
+
+
+@receiver(post_save, sender=Project)
+def update_project_recommendations(sender, instance, **kwargs):
+    # Registered after update_project_tags so the new tags are scored
+    if getattr(instance, '_rescore_similar', False):
+        instance._rescore_similar = False
+        schedule_update(update_similar_projects, instance.pk)
+
+
+@receiver(pre_delete, sender=Project)
+def refill_lists_holding_deleted_project(sender, instance, **kwargs):
+    # The cascade takes the deleted project out of other projects' lists
+    if updates_enabled():
+        listed_by = list(SimilarProject.objects.filter(similar=instance).values_list('project_id', flat=True))
+        if listed_by:
+            schedule_update(refill_similar_projects, listed_by)
+
+
+@receiver(post_save, sender=Project)
+def update_project_leaderboard_entry(sender, instance, created, **kwargs):
+    # Cancelled projects leave the leaderboard, reactivated ones return
+    if not created:
+        update_project_rank(instance.pk)
+
+
+@receiver(post_save, sender=ProjectImage)
+def create_project_image_renditions(sender, instance, update_fields=None, **kwargs):
+    # Uploads through the views arrive with renditions (pages.ingest_utils)
+    if instance.has_renditions or not instance.image or not saves_any(update_fields, {'image'}):
+        return
+
+    def generate():
+        try:
+            generate_project_image_renditions(instance)
+        except Exception:  # The original keeps being served
+            logger.exception('Error generating renditions for %s', instance.image.name)
+            return
+        ProjectImage.objects.filter(pk=instance.pk).update(has_renditions=True)
+        invalidate('projects')
+
+    schedule_renditions(generate)
+
+
+@receiver(pre_save, sender=CustomUser)
+def note_deactivation(sender, instance, update_fields=None, **kwargs):
+    # Only saves that turn an account off look up the stored flag
+    if instance.is_active or instance._state.adding or not saves_any(update_fields, {'is_active'}):
+        return
+    now = timezone.now()
+    # Written here too, as update_fields may leave the stamp out of the save
+    if CustomUser._base_manager.filter(pk=instance.pk, is_active=True).update(deactivated_at=now):
+        instance.deactivated_at = now
+
+
+# The file field of each model stored through pages.storage_utils
+FILE_FIELDS = {ProjectImage: 'image', CustomUser: 'profile_picture'}
+
+
+@receiver(pre_save, sender=ProjectImage)
+@receiver(pre_save, sender=CustomUser)
+def note_previous_file(sender, instance, update_fields=None, **kwargs):
+    # The stored file name ('' for new rows), or None when the save leaves
+    # the field out, as the last_login update on each login does
+    field = FILE_FIELDS[sender]
+    instance._previous_file = None
+    if saves_any(update_fields, {field}):
+        instance._previous_file = '' if instance._state.adding else (
+            sender._base_manager.filter(pk=instance.pk).values_list(field, flat=True).first() or ''
+        )
+    # An upload of the same bytes keeps the name but still adds a reference
+    instance._uploading_file = not getattr(instance, field)._committed
+
+
+@receiver(post_save, sender=ProjectImage)
+@receiver(post_save, sender=CustomUser)
+def release_replaced_file(sender, instance, **kwargs):
+    # Replaced from the admin or a plain save: drop the old file's reference
+    # (uploads through pages.ingest_utils release it there)
+    field = FILE_FIELDS[sender]
+    previous = getattr(instance, '_previous_file', None)
+    if previous and (previous != getattr(instance, field).name or instance._uploading_file):
+        sender._meta.get_field(field).storage.delete(previous)
+
+
+@receiver(post_save, sender=CustomUser)
+def create_avatar_renditions(sender, instance, **kwargs):
+    # Only for a new picture, so a picture that failed is not retried on each save
+    previous = getattr(instance, '_previous_file', None)
+    if previous is None or not instance.profile_picture or previous == instance.profile_picture.name \
+            or instance.has_avatar_renditions():
+        return
+    name = instance.profile_picture.name
+
+    def generate():
+        try:
+            generate_avatar_renditions(instance)
+        except Exception:
+            logger.exception('Error generating renditions for %s', name)
+            return
+        CustomUser.objects.filter(pk=instance.pk, profile_picture=name).update(profile_picture_renditions=name)
+
+    schedule_renditions(generate)
+
+
+@receiver(post_delete, sender=ProjectImage)
+def release_project_image_file(sender, instance, **kwargs):
+    if instance.image:
+        instance.image.storage.delete(instance.image.name)
+
+
+@receiver(post_delete, sender=CustomUser)
+def release_profile_picture_file(sender, instance, **kwargs):
+    if instance.profile_picture:
+        instance.profile_picture.storage.delete(instance.profile_picture.name)
+
+
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+@receiver(post_save, sender=Donation)
+@receiver(post_delete, sender=Donation)
+@receiver(post_save, sender=ProjectImage)
+@receiver(post_delete, sender=ProjectImage)
+def invalidate_cached_projects(sender, **kwargs):
+    invalidate('projects')
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_cached_categories(sender, **kwargs):
+    # Project cards show the category name too
+    invalidate('categories')
+    invalidate('projects')
@@ -0,0 +1,116 @@
+import hashlib
+import os
+import tempfile
+
+from django.apps import apps
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+
+def content_name(directory, digest, extension):
+    """``<directory>/<aa>/<sha256><ext>``: where a file with this digest lives."""
+    return f'{directory}/{digest[:2]}/{digest}{extension.lower()}'
+
+
+def content_name_for(name, digest):
+    """The content name of a file saved as ``name``; a content name maps to itself."""
+    directory = os.path.dirname(name)
+    if os.path.basename(directory) == digest[:2]:
+        directory = os.path.dirname(directory)
+    return content_name(directory, digest, os.path.splitext(name)[1])
+
+
+def file_digest(chunks):
+    """``(sha256 hexdigest, size)`` of an iterable of byte chunks."""
+    hasher = hashlib.sha256()
+    size = 0
+    for chunk in chunks:
+        hasher.update(chunk)
+        size += len(chunk)
+    return hasher.hexdigest(), size
+
+
+def add_reference(name, size):
+    """Count one more reference to ``name``; True if it was not stored yet."""
+    StoredFile = apps.get_model('pages', 'StoredFile')
+    for _ in range(2):
+        if StoredFile.objects.filter(name=name).update(references=F('references') + 1):
+            return False
+        try:
+            with transaction.atomic():
+                StoredFile.objects.create(name=name, size=size)
+            return True
+        except IntegrityError:  # Stored concurrently; count on that row instead
+            continue
+    raise IntegrityError(f'Could not reference {name}')
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File storage for uploads that keeps every distinct file once, named by
+    the SHA-256 of its bytes, and counts the rows pointing at it in
+    StoredFile. ``delete`` drops one reference; the bytes (and any derived
+    files sharing the hash, such as renditions) are removed with the last.
+    Files from before this storage have no StoredFile row and are never
+    deleted by it; ``manage.py dedupe_media`` adopts them.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        return name  # The content decides the name in _save
+
+    def _save(self, name, content):
+        directory = os.path.dirname(name)
+        os.makedirs(self.path(directory), exist_ok=True)
+
+        # Hash while streaming to a temporary file next to the destination
+        fd, temp_path = tempfile.mkstemp(dir=self.path(directory), prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                def chunks():
+                    for chunk in content.chunks():
+                        f.write(chunk)
+                        yield chunk
+                digest, size = file_digest(chunks())
+
+            name = content_name_for(name, digest)
+            path = self.path(name)
+            if add_reference(name, size) or not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(temp_path, path)
+                if self.file_permissions_mode is not None:
+                    os.chmod(path, self.file_permissions_mode)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return name
+
+    def delete(self, name):
+        if not name:
+            raise ValueError('The name must be given to delete().')
+        StoredFile = apps.get_model('pages', 'StoredFile')
+        with transaction.atomic():
+            if StoredFile.objects.filter(name=name, references__gt=1).update(references=F('references') - 1):
+                return
+            if not StoredFile.objects.filter(name=name).delete()[0]:
+                return  # Not tracked by this storage
+        # Only once the release is committed, and unless re-uploaded meanwhile
+        transaction.on_commit(lambda: self.remove_unreferenced(name))
+
+    def remove_unreferenced(self, name):
+        if apps.get_model('pages', 'StoredFile').objects.filter(name=name).exists():
+            return
+        directory, filename = os.path.split(name)
+        stem = os.path.splitext(filename)[0]
+        try:
+            siblings = self.listdir(directory)[1]
+        except FileNotFoundError:
+            return
+        for sibling in siblings:
+            if sibling == filename or sibling.startswith(f'{stem}.'):
+                super().delete(f'{directory}/{sibling}')
+
+
+content_storage = ContentAddressedStorage()
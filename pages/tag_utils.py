@@ -0,0 +1,71 @@
+import re
+
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Project, Tag
+
+MAX_TAG_LENGTH = 50
+
+_SPACES_RE = re.compile(r'\s+')
+
+
+def normalize_tag(name):
+    """Lowercase ``name``, collapse its whitespace and cut it to MAX_TAG_LENGTH."""
+    return _SPACES_RE.sub(' ', name).strip().lower()[:MAX_TAG_LENGTH]
+
+
+def parse_tags(raw_tags):
+    """Split a comma-separated tag string into unique, normalized tag names."""
+    names = []
+    for part in (raw_tags or '').split(','):
+        name = normalize_tag(part)
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def sync_project_tags(project):
+    """
+    Bring ``project.tag_objects`` in line with its ``tags`` string and adjust
+    the usage counters of the tags that were attached or detached. Inactive
+    projects carry no tags.
+    """
+    names = parse_tags(project.tags) if project.is_active else []
+    current = {tag.name: tag for tag in project.tag_objects.all()}
+
+    added = [name for name in names if name not in current]
+    removed = [tag.pk for name, tag in current.items() if name not in names]
+    if not added and not removed:
+        return
+
+    with transaction.atomic():
+        if added:
+            Tag.objects.bulk_create([Tag(name=name) for name in added], ignore_conflicts=True)
+            added_ids = list(Tag.objects.filter(name__in=added).values_list('pk', flat=True))
+            project.tag_objects.add(*added_ids)
+            Tag.objects.filter(pk__in=added_ids).update(usage_count=F('usage_count') + 1)
+        if removed:
+            project.tag_objects.remove(*removed)
+            Tag.objects.filter(pk__in=removed).update(usage_count=F('usage_count') - 1)
+
+
+def release_project_tags(project):
+    """Decrement usage counters before a project and its tag links are deleted."""
+    if project.is_active:
+        Tag.objects.filter(projects=project).update(usage_count=F('usage_count') - 1)
+
+
+def popular_tags(limit=20):
+    return Tag.objects.filter(usage_count__gt=0).order_by('-usage_count')[:limit]
+
+
+def rebuild_tag_counts():
+    """Recompute every tag's usage counter in one UPDATE. Returns the tag count."""
+    active_links = Project.tag_objects.through.objects.filter(
+        tag=OuterRef('pk'), project__is_active=True
+    ).order_by().values('tag').annotate(value=Count('project')).values('value')
+    return Tag.objects.update(
+        usage_count=Coalesce(Subquery(active_links, output_field=IntegerField()), Value(0))
+    )
@@ -1,3 +1,1902 @@
-from django.test import TestCase
+import os
+import shutil
+import io
+import json
+import re
+import socketserver
+import tempfile
+import threading
+from datetime import date
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.mail.backends.locmem import EmailBackend as LocmemEmailBackend
+from django.template.loader import render_to_string
+from django.db import OperationalError, connection, connections
+from django.db.backends.sqlite3.base import DatabaseWrapper as SQLiteDatabaseWrapper
+from django.test.utils import CaptureQueriesContext
+from django.db.models import Q, Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.utils.http import urlencode
+
+from .cache_utils import get_or_build, invalidate
+from .comment_utils import load_comment_thread
+from .donation_utils import rebuild_donor_summaries, record_donation
+from PIL import Image
+
+from .email_utils import render_email, render_emails, send_activation_email
+from .ingest_utils import _dispatcher, _drain_in_background
+from .instrumentation_utils import BudgetExceeded
+from .leaderboard_utils import rebuild_leaderboard, top_rated_projects
+from .models import (
+    ActivationToken, Category, Comment, CustomUser, Donation, DonationRollup, DonorSummary, LeaderboardEntry,
+    OutboxEmail, PasswordResetToken, Project, ProjectImage, Rating, Report, SimilarProject, StagedImage, StoredFile,
+    Tag,
+)
+from .outbox_utils import drain_outbox, enqueue_email
+from .recommendation_utils import rebuild_similar_projects, recommendations_enabled, similar_projects_for
+from .rollup_utils import add_to_rollups as real_add_to_rollups, bucket_start, rebuild_rollups
+from .tag_utils import parse_tags, popular_tags, rebuild_tag_counts
+from .token_utils import check_token, make_token
+
+
+def make_user(index=0, **extra):
+    return CustomUser.objects.create_user(
+        username=f'user{index}@example.com',
+        email=f'user{index}@example.com',
+        password='password',
+        first_name='Test',
+        last_name=f'User{index}',
+        mobile_phone=f'010{index:08d}',
+        **extra
+    )
+
+
+def make_project(creator, category=None, **extra):
+    if category is None:
+        category, _ = Category.objects.get_or_create(name='General')
+    fields = {
+        'creator': creator,
+        'title': 'Test project',
+        'details': 'Test project details',
+        'category': category,
+        'total_target': Decimal('100000.00'),
+        'tags': 'test',
+        'start_date': timezone.now(),
+        'end_date': timezone.now() + timezone.timedelta(days=30),
+    }
+    fields.update(extra)
+    return Project.objects.create(**fields)
+
+
+class RecordDonationTests(TestCase):
+    def setUp(self):
+        self.donor = make_user(1)
+        self.project = make_project(make_user(2))
+
+    def test_updates_project_totals(self):
+        donation, created = record_donation(self.project.id, self.donor, Decimal('25.50'), message='Good luck')
+
+        self.assertTrue(created)
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.current_amount, Decimal('25.50'))
+        self.assertEqual(self.project.donation_count, 1)
+        self.assertEqual(donation.message, 'Good luck')
+
+    def test_idempotency_key_charges_once(self):
+        first, created = record_donation(self.project.id, self.donor, Decimal('10'), idempotency_key='abc')
+        second, created_again = record_donation(self.project.id, self.donor, Decimal('10'), idempotency_key='abc')
+
+        self.assertTrue(created)
+        self.assertFalse(created_again)
+        self.assertEqual(first.pk, second.pk)
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.current_amount, Decimal('10'))
+        self.assertEqual(self.project.donation_count, 1)
+
+    def test_locked_database_asks_the_donor_to_retry(self):
+        self.client.force_login(self.donor)
+        with mock.patch('pages.views.record_donation', side_effect=OperationalError('database is locked')):
+            with self.assertLogs('pages.views', 'WARNING'):
+                response = self.client.post(f'/projects/{self.project.pk}/donate/', {'amount': '10'}, follow=True)
+        self.assertRedirects(response, f'/projects/{self.project.pk}/')
+        self.assertContains(response, 'Please try again.')
+
+    def test_inactive_project_is_rejected(self):
+        Project.objects.filter(pk=self.project.pk).update(is_active=False)
+
+        with self.assertRaises(Project.DoesNotExist):
+            record_donation(self.project.id, self.donor, Decimal('10'))
+        self.assertFalse(Donation.objects.exists())
+        self.assertFalse(DonorSummary.objects.exists())
+
+    def test_keeps_the_donor_summary(self):
+        other = make_project(make_user(3))
+        record_donation(self.project.id, self.donor, Decimal('10'))
+        record_donation(self.project.id, self.donor, Decimal('5.25'), idempotency_key='abc')
+        record_donation(self.project.id, self.donor, Decimal('5.25'), idempotency_key='abc')
+        last, _ = record_donation(other.id, self.donor, Decimal('20'))
+
+        def summary():
+            return DonorSummary.objects.values_list(
+                'user', 'total_donated', 'donation_count', 'projects_backed', 'last_donation_at'
+            ).get()
+
+        kept = summary()
+        self.assertEqual(kept, (self.donor.pk, Decimal('35.25'), 3, 2, last.created_at))
+        self.assertEqual(rebuild_donor_summaries(), 1)
+        self.assertEqual(summary(), kept)
+
+
+class EngagementCounterTests(TestCase):
+    def setUp(self):
+        self.user = make_user(1)
+        self.project = make_project(make_user(2))
+        self.client.force_login(self.user)
+
+    def counters(self):
+        self.project.refresh_from_db()
+        return (
+            self.project.donation_count, self.project.comment_count, self.project.rating_count, self.project.rating_sum
+        )
+
+    def test_rerating_changes_the_sum_only(self):
+        self.client.post(f'/projects/{self.project.pk}/rate/', {'rating': 2})
+        self.client.post(f'/projects/{self.project.pk}/rate/', {'rating': 5})
+        self.client.post(f'/projects/{self.project.pk}/rate/', {'rating': 5})
+
+        self.assertEqual(self.counters()[2:], (1, 5))
+        self.assertEqual(LeaderboardEntry.objects.get().rating_count, 1)
+
+    def test_comments_are_counted(self):
+        self.client.post(f'/projects/{self.project.pk}/comment/', {'content': 'Good luck'})
+        parent = Comment.objects.get()
+        self.client.post(f'/projects/{self.project.pk}/comment/', {'content': 'Thanks', 'parent_comment': parent.pk})
+        self.client.post(f'/projects/{self.project.pk}/comment/', {'content': '   '})
+
+        self.assertEqual(self.counters()[1], 2)
+
+    def test_deletes_are_uncounted(self):
+        record_donation(self.project.pk, self.user, Decimal('10'))
+        self.client.post(f'/projects/{self.project.pk}/rate/', {'rating': 4})
+        self.client.post(f'/projects/{self.project.pk}/comment/', {'content': 'Good luck'})
+        self.assertEqual(self.counters(), (1, 1, 1, 4))
+
+        Donation.objects.all().delete()
+        Rating.objects.get().delete()
+        Comment.objects.get().delete()
+        self.assertEqual(self.counters(), (0, 0, 0, 0))
+        self.assertFalse(LeaderboardEntry.objects.exists())
+        # current_amount is the money raised, kept when a donation row goes
+        self.assertEqual(self.project.current_amount, Decimal('10'))
+
+    def test_rebuild_counters_repairs_drift(self):
+        record_donation(self.project.pk, self.user, Decimal('10'))
+        Rating.objects.create(project=self.project, user=self.user, rating=3)
+        Comment.objects.create(project=self.project, user=self.user, content='Hi')
+        Project.objects.filter(pk=self.project.pk).update(
+            donation_count=7, comment_count=0, rating_count=9, rating_sum=40
+        )
+
+        call_command('rebuild_counters', stdout=io.StringIO())
+        self.assertEqual(self.counters(), (1, 1, 1, 3))
+
+
+class DonationRollupTests(TestCase):
+    def setUp(self):
+        self.creator = make_user(1)
+        self.donor = make_user(2)
+        self.category = Category.objects.create(name='Health')
+        self.project = make_project(self.creator, category=self.category)
+        self.other = make_project(make_user(3), category=self.category)
+
+    def donate(self, project, amount, moment):
+        with mock.patch('django.utils.timezone.now', return_value=moment):
+            return record_donation(project.pk, self.donor, Decimal(amount))[0]
+
+    def rollups(self):
+        return sorted(DonationRollup.objects.values_list('scope', 'scope_id', 'period', 'bucket', 'amount', 'donation_count'))
+
+    def test_donations_are_added_to_their_buckets(self):
+        day = timezone.now().replace(hour=10, minute=0, second=0, microsecond=0) - timezone.timedelta(days=2)
+        self.donate(self.project, '10', day + timezone.timedelta(minutes=5))
+        self.donate(self.project, '2.50', day + timezone.timedelta(minutes=55))
+        self.donate(self.project, '7', day + timezone.timedelta(hours=3))
+        self.donate(self.other, '1', day + timezone.timedelta(days=1))
+
+        buckets = DonationRollup.objects.filter(scope='project', scope_id=self.project.pk)
+        self.assertEqual(
+            list(buckets.filter(period='hour').order_by('bucket').values_list('bucket', 'amount', 'donation_count')),
+            [(day, Decimal('12.50'), 2), (day + timezone.timedelta(hours=3), Decimal('7'), 1)],
+        )
+        self.assertEqual(
+            list(buckets.filter(period='day').values_list('bucket', 'amount', 'donation_count')),
+            [(bucket_start(day, 'day'), Decimal('19.50'), 3)],
+        )
+        category = DonationRollup.objects.filter(scope='category', scope_id=self.category.pk, period='day')
+        self.assertEqual(
+            list(category.order_by('bucket').values_list('amount', 'donation_count')), [(Decimal('19.50'), 3), (Decimal('1'), 1)]
+        )
+
+        kept = self.rollups()
+        self.assertEqual(rebuild_rollups(), len(kept))
+        self.assertEqual(self.rollups(), kept)
+
+    def test_analytics_endpoint_serves_the_creator(self):
+        day = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0) - timezone.timedelta(days=3)
+        for offset, amount in [(0, '10'), (1, '5'), (1, '5'), (3, '20')]:
+            self.donate(self.project, amount, day + timezone.timedelta(days=offset, hours=12))
+        url = f'/projects/{self.project.pk}/analytics/'
+
+        self.client.force_login(self.donor)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        self.client.force_login(self.creator)
+        data = self.client.get(url).json()
+        self.assertEqual((data['period'], data['total_amount'], data['total_donations']), ('day', '40.00', 4))
+        self.assertEqual(
+            [(bucket['start'], bucket['amount'], bucket['donations'], bucket['cumulative_amount']) for bucket in data['buckets']],
+            [
+                (day.isoformat(), '10.00', 1, '10.00'),
+                ((day + timezone.timedelta(days=1)).isoformat(), '10.00', 2, '20.00'),
+                ((day + timezone.timedelta(days=3)).isoformat(), '20.00', 1, '40.00'),
+            ],
+        )
+
+        data = self.client.get(url, {'period': 'hour', 'from': (day + timezone.timedelta(days=1)).date().isoformat(),
+                                     'to': (day + timezone.timedelta(days=2)).isoformat()}).json()
+        self.assertEqual([bucket['donations'] for bucket in data['buckets']], [2])
+        self.assertEqual(self.client.get(url, {'period': 'week'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'from': 'yesterday'}).status_code, 400)
+
+    def test_windowed_analytics_count_earlier_donations(self):
+        day = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0) - timezone.timedelta(days=3)
+        for offset, amount in [(0, '10'), (1, '5'), (1, '5'), (3, '20')]:
+            self.donate(self.project, amount, day + timezone.timedelta(days=offset, hours=12))
+        url = f'/projects/{self.project.pk}/analytics/'
+        self.client.force_login(self.creator)
+
+        def summary(**params):
+            data = self.client.get(url, params).json()
+            cumulative = [bucket['cumulative_amount'] for bucket in data['buckets']]
+            return data['total_amount'], data['total_donations'], data['truncated'], cumulative
+
+        second_day = (day + timezone.timedelta(days=1)).isoformat()
+        self.assertEqual(summary(**{'from': second_day}), ('40.00', 4, False, ['20.00', '40.00']))
+        self.assertEqual(summary(**{'to': (day + timezone.timedelta(days=2)).isoformat()}), ('20.00', 3, False, ['10.00', '20.00']))
+        # A window without donations still reports the total before it
+        self.assertEqual(
+            summary(**{'from': (day + timezone.timedelta(days=2)).isoformat(), 'to': (day + timezone.timedelta(days=3)).isoformat()}),
+            ('20.00', 3, False, []),
+        )
+        with mock.patch.dict('pages.rollup_utils.MAX_BUCKETS', {'day': 2}):
+            self.assertEqual(summary(), ('40.00', 4, True, ['20.00', '40.00']))
+
+
+class ConcurrentDonationTests(TransactionTestCase):
+    # Enough overlapping writers to contend for the lock on every donation,
+    # few enough that each one's wait stays far below the busy timeout
+    THREADS = 8
+    DONATIONS_PER_THREAD = 40
+
+    def test_parallel_donations_do_not_lose_updates(self):
+        project = make_project(make_user(0))
+        donors = [make_user(i + 1) for i in range(self.THREADS)]
+        errors = []
+        start = threading.Barrier(self.THREADS)
+
+        def donate(donor):
+            try:
+                start.wait()
+                for i in range(self.DONATIONS_PER_THREAD):
+                    # Every other donation is submitted twice with the same key
+                    key = f'{donor.pk}-{i}' if i % 2 else None
+                    record_donation(project.id, donor, Decimal('1.25'), idempotency_key=key)
+                    if key:
+                        record_donation(project.id, donor, Decimal('1.25'), idempotency_key=key)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=donate, args=(donor,)) for donor in donors]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        project.refresh_from_db()
+        expected_count = self.THREADS * self.DONATIONS_PER_THREAD
+        self.assertEqual(Donation.objects.count(), expected_count)
+        self.assertEqual(project.donation_count, expected_count)
+        self.assertEqual(
+            project.current_amount,
+            Donation.objects.filter(project=project).aggregate(total=Sum('amount'))['total']
+        )
+        self.assertEqual(
+            set(DonorSummary.objects.values_list('donation_count', 'total_donated')),
+            {(self.DONATIONS_PER_THREAD, Decimal('1.25') * self.DONATIONS_PER_THREAD)}
+        )
+
+    def test_locked_database_is_retried(self):
+        project = make_project(make_user(0))
+        donor = make_user(1)
+        failures = [OperationalError('database is locked')] * 2
+
+        def add_to_rollups(donation, category_id):
+            # Fails late in the transaction, after the other rows were written
+            if failures:
+                raise failures.pop()
+            real_add_to_rollups(donation, category_id)
+
+        with mock.patch('pages.donation_utils.add_to_rollups', add_to_rollups), mock.patch('time.sleep') as sleep:
+            donation, created = record_donation(project.id, donor, Decimal('10'))
+        self.assertTrue(created)
+        self.assertEqual(sleep.call_count, 2)
+        project.refresh_from_db()
+        self.assertEqual((project.donation_count, project.current_amount), (1, Decimal('10')))
+        self.assertEqual(list(Donation.objects.values_list('pk', flat=True)), [donation.pk])
+        self.assertEqual(DonorSummary.objects.get().donation_count, 1)
+
+        # Other errors, and a lock that outlasts the retries, reach the caller
+        failures[:] = [OperationalError('database is locked')] * 4
+        with mock.patch('pages.donation_utils.add_to_rollups', add_to_rollups), mock.patch('time.sleep'):
+            with self.assertRaisesRegex(OperationalError, 'locked'):
+                record_donation(project.id, donor, Decimal('10'))
+        failures[:] = [OperationalError('disk I/O error')]
+        with mock.patch('pages.donation_utils.add_to_rollups', add_to_rollups), mock.patch('time.sleep') as sleep:
+            with self.assertRaisesRegex(OperationalError, 'disk'):
+                record_donation(project.id, donor, Decimal('10'))
+        self.assertFalse(sleep.called)
+        self.assertEqual(Donation.objects.count(), 1)
+
+
+@override_settings(LEADERBOARD_PRIOR_MEAN=3.0, LEADERBOARD_PRIOR_VOTES=5)
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        self.creator = make_user(0)
+        self.raters = [make_user(i + 1) for i in range(10)]
+
+    def rate(self, project, user, value):
+        self.client.force_login(user)
+        self.client.post(f'/projects/{project.pk}/rate/', {'rating': value})
+
+    def test_rating_and_changed_rating_update_score(self):
+        project = make_project(self.creator)
+        self.rate(project, self.raters[0], 5)
+        entry = LeaderboardEntry.objects.get(project=project)
+        self.assertAlmostEqual(entry.score, (3.0 * 5 + 5) / 6)
+        self.assertEqual(entry.rating_count, 1)
+
+        self.rate(project, self.raters[0], 1)
+        entry.refresh_from_db()
+        self.assertAlmostEqual(entry.score, (3.0 * 5 + 1) / 6)
+        self.assertEqual(entry.average, 1.0)
+
+    def test_many_good_ratings_beat_a_single_perfect_one(self):
+        lucky = make_project(self.creator, title='One vote')
+        popular = make_project(self.creator, title='Many votes')
+        self.rate(lucky, self.raters[0], 5)
+        for rater in self.raters:
+            self.rate(popular, rater, 4)
+
+        self.assertEqual(list(top_rated_projects()), [popular, lucky])
+        response = self.client.get('/projects/top-rated/')
+        self.assertEqual(list(response.context['page_obj']), [popular, lucky])
+
+    def test_cancelled_project_leaves_leaderboard(self):
+        project = make_project(self.creator)
+        self.rate(project, self.raters[0], 4)
+        project.is_active = False
+        project.save()
+
+        self.assertFalse(LeaderboardEntry.objects.exists())
+        self.assertEqual(rebuild_leaderboard(), 0)
+
+
+class ProjectSearchTests(TestCase):
+    def setUp(self):
+        self.creator = make_user(1)
+
+    def search(self, query, **params):
+        response = self.client.get('/projects/', {'search': query, **params})
+        return [project.title for project in response.context['page_obj']]
+
+    def test_title_hits_outrank_details_hits(self):
+        make_project(self.creator, title='Clinic supplies', details='Medicine for the village')
+        make_project(self.creator, title='Village well', details='Water next to the new clinic')
+        make_project(self.creator, title='School books', details='Reading for everyone')
+
+        self.assertEqual(self.search('clinic'), ['Clinic supplies', 'Village well'])
+
+    def test_words_match_as_prefixes(self):
+        make_project(self.creator, title='Solar panels for the library')
+        make_project(self.creator, title='Sola bread bakery')
+
+        self.assertEqual(self.search('sol pan'), ['Solar panels for the library'])
+        self.assertEqual(sorted(self.search('sola')), ['Sola bread bakery', 'Solar panels for the library'])
+
+    def test_search_with_category_and_pages(self):
+        health = Category.objects.create(name='Health')
+        for i in range(17):
+            make_project(self.creator, category=health if i % 8 else None, title=f'Garden {i}')
+        make_project(self.creator, category=health, title='Clinic')
+
+        response = self.client.get('/projects/', {'search': 'garden', 'category': health.pk})
+        self.assertEqual(response.context['total_count'], 14)
+        first = self.search('garden', category=health.pk)
+        second = self.search('garden', category=health.pk, page=2)
+        self.assertEqual((len(first), len(second)), (12, 2))
+        self.assertEqual(sorted(first + second), sorted(f'Garden {i}' for i in range(17) if i % 8))
+
+    def test_index_follows_edits_cancels_and_deletes(self):
+        project = make_project(self.creator, title='Bee hives')
+        project.title = 'Honey farm'
+        project.save()
+        self.assertEqual(self.search('bee'), [])
+        self.assertEqual(self.search('honey'), ['Honey farm'])
+
+        # A save that leaves the searched fields out does not reindex them
+        project.title = 'Zebra park'
+        project.save(update_fields=['updated_at'])
+        self.assertEqual(self.search('zebra'), [])
+        self.assertEqual(self.search('honey'), ['Honey farm'])
+
+        project.is_active = False
+        project.save()
+        self.assertEqual(self.search('honey'), [])
+        project.is_active = True
+        project.title = 'Honey farm'
+        project.save()
+        self.assertEqual(self.search('honey'), ['Honey farm'])
+
+        project.delete()
+        self.assertEqual(self.search('honey'), [])
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM pages_project_fts')
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_queries_without_words_fall_back_to_substrings(self):
+        make_project(self.creator, title='Charity run ++ 2026')
+        make_project(self.creator, title='Charity walk')
+
+        self.assertEqual(self.search('++'), ['Charity run ++ 2026'])
+        self.assertEqual(self.search('"*'), [])
+
+
+class ProjectTagTests(TestCase):
+    def setUp(self):
+        self.creator = make_user(1)
+
+    def usage(self):
+        return dict(Tag.objects.values_list('name', 'usage_count'))
+
+    def test_parse_tags_normalizes(self):
+        self.assertEqual(
+            parse_tags(' Solar \t Lab, solar lab,, EDUCATION ,' + 'x' * 60),
+            ['solar lab', 'education', 'x' * 50],
+        )
+        self.assertEqual(parse_tags(None), [])
+
+    def test_usage_counts_follow_projects(self):
+        first = make_project(self.creator, tags='Water, Health')
+        second = make_project(self.creator, tags='health')
+        self.assertEqual(self.usage(), {'water': 1, 'health': 2})
+
+        first.tags = 'health, schools'
+        first.save()
+        self.assertEqual(self.usage(), {'water': 0, 'health': 2, 'schools': 1})
+
+        second.is_active = False
+        second.save()
+        self.assertEqual(self.usage(), {'water': 0, 'health': 1, 'schools': 1})
+
+        first.delete()
+        self.assertEqual(self.usage(), {'water': 0, 'health': 0, 'schools': 0})
+        second.is_active = True
+        second.save()
+        kept = self.usage()
+        rebuild_tag_counts()
+        self.assertEqual(self.usage(), kept)
+        self.assertEqual(kept['health'], 1)
+
+    def test_tag_filter_is_exact(self):
+        make_project(self.creator, title='Lab', tags='solar lab')
+        make_project(self.creator, title='Roof', tags='solar')
+
+        def titles(tag):
+            return [project.title for project in self.client.get('/projects/', {'tag': tag}).context['page_obj']]
+
+        self.assertEqual(titles(' Solar  Lab'), ['Lab'])
+        self.assertEqual(titles('solar'), ['Roof'])
+        self.assertEqual(titles('sol'), [])
+
+    def test_popular_tags(self):
+        for tags in ['a, b, c', 'b, c', 'c', 'unused']:
+            make_project(self.creator, tags=tags)
+        Project.objects.get(tags='unused').delete()
+
+        self.assertEqual([tag.name for tag in popular_tags()], ['c', 'b', 'a'])
+        self.assertEqual([tag.name for tag in popular_tags(limit=2)], ['c', 'b'])
+
+
+@skipUnless(recommendations_enabled(), 'Needs NumPy')
+@override_settings(PAGES_RECOMMENDATION_UPDATES='inline')
+class SimilarProjectTests(TestCase):
+    def setUp(self):
+        self.creator = make_user(1)
+        self.energy = Category.objects.create(name='Energy')
+        self.education = Category.objects.create(name='Education')
+
+    def make(self, title, tags, category, details=''):
+        with self.captureOnCommitCallbacks(execute=True):
+            return make_project(self.creator, title=title, tags=tags, category=category, details=details or title)
+
+    def neighbours(self, project):
+        return list(SimilarProject.objects.filter(project=project).order_by('-score').values_list('similar', flat=True))
+
+    def test_rebuild_ranks_the_closest_projects_first(self):
+        panels = self.make('Solar panels for the village school', 'solar, energy', self.energy)
+        clinic = self.make('Solar energy for the rural clinic', 'solar, energy', self.energy)
+        pumps = self.make('Solar water pumps for farms', 'solar, water', self.energy)
+        library = self.make('Village library books', 'books, education', self.education)
+        self.make('School books for children', 'books, education', self.education)
+        self.make('Children reading club', 'education, water', self.education)
+
+        self.assertEqual(rebuild_similar_projects(), (6, SimilarProject.objects.count()))
+        self.assertEqual(self.neighbours(panels)[:2], [clinic.pk, pumps.pk])
+        scores = list(SimilarProject.objects.filter(project=panels).order_by('-score').values_list('score', flat=True))
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        self.assertNotIn(panels.pk, self.neighbours(panels))
+
+        self.assertEqual(similar_projects_for(panels, limit=2), [clinic, pumps])
+        Project.objects.filter(pk=clinic.pk).update(is_active=False)
+        self.assertEqual(similar_projects_for(panels, limit=2)[0], pumps)
+        self.assertEqual(similar_projects_for(library, limit=1)[0].category, self.education)
+
+    def test_edits_and_cancels_rescore_incrementally(self):
+        projects = [self.make(f'Solar array {i}', f'solar, energy, site{i // 2}', self.energy) for i in range(11)]
+        school = self.make('Village school books', 'books, education', self.education)
+        rebuild_similar_projects()
+        first = projects[0]
+        self.assertEqual(len(self.neighbours(first)), 8)
+
+        # Moved to the other topic: its links follow, and the lists that
+        # held it are refilled rather than left a link short
+        first.title, first.tags, first.category = 'School books for the village', 'books, education', self.education
+        with self.captureOnCommitCallbacks(execute=True):
+            first.save()
+        self.assertEqual(self.neighbours(first)[0], school.pk)
+        self.assertIn(first.pk, self.neighbours(school))
+        for project in projects[1:]:
+            self.assertNotIn(first.pk, self.neighbours(project))
+            self.assertEqual(len(self.neighbours(project)), 8)
+
+        cancelled = projects[1]
+        cancelled.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            cancelled.save()
+        self.assertFalse(SimilarProject.objects.filter(Q(project=cancelled) | Q(similar=cancelled)).exists())
+        for project in projects[2:]:
+            self.assertEqual(len(self.neighbours(project)), 8)
+
+        deleted = projects[2]
+        with self.captureOnCommitCallbacks(execute=True):
+            deleted.delete()
+        for project in projects[3:]:
+            self.assertNotIn(deleted.pk, self.neighbours(project))
+            self.assertEqual(len(self.neighbours(project)), 7)  # Seven other active energy projects left
+
+    def test_saves_of_unscored_fields_do_not_rescore(self):
+        project = self.make('Solar array', 'solar, energy', self.energy)
+        self.make('Solar farm', 'solar, energy', self.energy)
+        rebuild_similar_projects()
+        SimilarProject.objects.update(score=0.5)
+
+        project.is_featured = True
+        project.current_amount = Decimal('10')
+        with self.captureOnCommitCallbacks(execute=True):
+            project.save()
+            project.save(update_fields=['title', 'updated_at'])
+        self.assertEqual(set(SimilarProject.objects.values_list('score', flat=True)), {0.5})
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.creator = make_user(0)
+        self.other = Category.objects.create(name='Other')
+        created_at = timezone.now()
+        for i in range(30):
+            project = make_project(self.creator, title=f'Project {i}', category=self.other if i % 3 == 0 else None)
+            # Pairs of projects share a timestamp so the id tie-break matters
+            Project.objects.filter(pk=project.pk).update(created_at=created_at - timezone.timedelta(minutes=i // 2))
+
+    def walk(self, url, params=None):
+        pages, cursor = [], ''
+        while True:
+            response = self.client.get(url, {**(params or {}), 'cursor': cursor})
+            page = response.context['page_obj']
+            pages.append([project.pk for project in page])
+            if not page.has_next:
+                return pages, page
+            cursor = page.next_cursor
+
+    def test_cursors_walk_every_project_once_in_order(self):
+        pages, last_page = self.walk('/projects/')
+        expected = list(Project.objects.order_by('-created_at', '-id').values_list('pk', flat=True))
+        self.assertEqual([pk for page in pages for pk in page], expected)
+        self.assertEqual([len(page) for page in pages], [12, 12, 6])
+
+        response = self.client.get('/projects/', {'cursor': last_page.previous_cursor})
+        self.assertEqual([project.pk for project in response.context['page_obj']], pages[1])
+        self.assertEqual(response.context['total_count'], 30)
+
+    def test_category_filter(self):
+        pages, _ = self.walk('/projects/', {'category': self.other.pk})
+        expected = list(
+            Project.objects.filter(category=self.other).order_by('-created_at', '-id').values_list('pk', flat=True)
+        )
+        self.assertEqual([pk for page in pages for pk in page], expected)
+
+    def test_tampered_cursor_starts_over(self):
+        first = self.client.get('/projects/', {'cursor': ''}).context['page_obj']
+        response = self.client.get('/projects/', {'cursor': first.next_cursor[:-2] + 'xx'})
+        self.assertEqual(list(response.context['page_obj']), list(first))
+
+    def test_profile_donation_history(self):
+        donor = make_user(1)
+        project = Project.objects.first()
+        for i in range(25):
+            record_donation(project.id, donor, Decimal('1'))
+        self.client.force_login(donor)
+
+        first = self.client.get('/profile/').context['user_donations']
+        response = self.client.get('/profile/', {'cursor': first.next_cursor})
+        second = response.context['user_donations']
+        self.assertEqual((len(first), len(second)), (20, 5))
+        self.assertFalse(second.has_next)
+        self.assertEqual(response.context['donor_summary'].donation_count, 25)
+        self.assertContains(response, '25.00 EGP')
+
+    def test_profile_project_grid(self):
+        self.client.force_login(self.creator)
+        pages, cursor = [], ''
+        while True:
+            page = self.client.get('/profile/', {'projects_cursor': cursor}).context['user_projects']
+            pages.append([project.title for project in page])
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        expected = list(Project.objects.order_by('-created_at', '-id').values_list('title', flat=True))
+        self.assertEqual([len(page) for page in pages], [6] * 5)
+        self.assertEqual([title for page in pages for title in page], expected)
+
+    def test_profile_cursor_links_keep_the_other_list(self):
+        project = Project.objects.first()
+        for i in range(25):
+            record_donation(project.id, self.creator, Decimal('1'))
+        self.client.force_login(self.creator)
+        first = self.client.get('/profile/').context
+        projects_cursor = first['user_projects'].next_cursor
+        donations_cursor = first['user_donations'].next_cursor
+
+        # Cursors are signed with the time they are rendered at, so only the
+        # carried-over parameter is compared as is
+        response = self.client.get('/profile/', {'projects_cursor': projects_cursor})
+        kept = re.escape(urlencode({'projects_cursor': projects_cursor}))
+        self.assertRegex(response.content.decode(), rf'href="\?cursor=[^"&]+&{kept}"')
+        response = self.client.get('/profile/', {'cursor': donations_cursor})
+        kept = re.escape(urlencode({'cursor': donations_cursor}))
+        self.assertRegex(response.content.decode(), rf'href="\?projects_cursor=[^"&]+&{kept}"')
+
+        response = self.client.get('/profile/', {'projects_cursor': projects_cursor, 'cursor': donations_cursor})
+        self.assertEqual(len(response.context['user_donations']), 5)
+        self.assertTrue(response.context['user_projects'].has_previous)
+
+
+class ListingQueryBudgetTests(TestCase):
+    """Listing pages run a fixed number of queries, however many cards they show."""
+
+    def setUp(self):
+        self.user = make_user(0)
+        self.client.force_login(self.user)
+        self.projects = 0
+        self.add_cards(1)
+
+    def add_cards(self, count):
+        for _ in range(count):
+            self.projects += 1
+            project = make_project(self.user, title=f'Card {self.projects}', tags='alpha, beta', is_featured=True)
+            ProjectImage.objects.create(project=project, image=f'project_images/card{self.projects}.jpg')
+            ProjectImage.objects.create(project=project, image=f'project_images/card{self.projects}b.jpg')
+            LeaderboardEntry.objects.create(project=project, score=4.0, average=4.0, rating_count=1)
+            record_donation(project.id, self.user, Decimal('5'))
+
+    def assertQueryBudget(self, url, budget):
+        cache.clear()
+        with CaptureQueriesContext(connection) as one_card:
+            self.client.get(url)
+        self.add_cards(11)
+        cache.clear()
+        with CaptureQueriesContext(connection) as many_cards:
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            len(many_cards), len(one_card),
+            '\n'.join(query['sql'] for query in many_cards.captured_queries)
+        )
+        self.assertLessEqual(len(many_cards), budget)
+        self.assertContains(response, '/media/project_images/card12.jpg')
+
+    def test_home(self):
+        self.assertQueryBudget('/', 7)
+
+    def test_project_list(self):
+        self.assertQueryBudget('/projects/', 7)
+
+    def test_project_list_cursor_mode(self):
+        self.assertQueryBudget('/projects/?cursor=', 7)
+
+    def test_top_rated(self):
+        self.assertQueryBudget('/projects/top-rated/', 4)
+
+    def test_profile(self):
+        self.assertQueryBudget('/profile/', 5)
+
+
+class CommentThreadTests(TestCase):
+    def setUp(self):
+        self.users = [make_user(i) for i in range(3)]
+        self.project = make_project(self.users[0])
+
+    def add_comments(self, count, replies=5):
+        for i in range(count):
+            comment = Comment.objects.create(project=self.project, user=self.users[i % 3], content=f'Comment {i}')
+            for j in range(replies):
+                Comment.objects.create(
+                    project=self.project, user=self.users[j % 3], content=f'Reply {i}.{j}', parent_comment=comment
+                )
+
+    def test_page_loads_in_two_queries(self):
+        self.add_comments(12)
+        with self.assertNumQueries(2):
+            page = load_comment_thread(self.project, preview_replies=3)
+            comments = list(page)
+            for comment in comments:
+                [reply.user.first_name for reply in comment.preview_replies]
+                comment.user.first_name
+
+        self.assertEqual([comment.content for comment in comments], [f'Comment {i}' for i in range(11, 1, -1)])
+        self.assertEqual([reply.content for reply in comments[0].preview_replies], ['Reply 11.0', 'Reply 11.1', 'Reply 11.2'])
+        self.assertEqual(comments[0].more_replies, 2)
+
+    def test_detail_page_query_count_does_not_grow_with_comments(self):
+        self.add_comments(1)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(f'/projects/{self.project.pk}/')
+        self.add_comments(30)
+        with CaptureQueriesContext(connection) as many:
+            self.client.get(f'/projects/{self.project.pk}/')
+        self.assertEqual(len(many), len(few))
+
+    def test_endpoints_page_through_comments_and_replies(self):
+        self.add_comments(25, replies=0)
+        first = load_comment_thread(self.project)
+        seen = [comment.content for comment in first]
+        url = f'/projects/{self.project.pk}/comments/?cursor={first.next_cursor}'
+        while url:
+            data = self.client.get(url).json()
+            seen += [line.strip()[len('<p class="mb-2">'):-len('</p>')]
+                     for line in data['html'].splitlines() if '<p class="mb-2">' in line]
+            url = data['next_url']
+        self.assertEqual(seen, [f'Comment {i}' for i in range(24, -1, -1)])
+
+        parent = Comment.objects.filter(parent_comment=None).first()
+        for j in range(45):
+            Comment.objects.create(project=self.project, user=self.users[0], content=f'Late reply {j}', parent_comment=parent)
+        data = self.client.get(f'/projects/{self.project.pk}/comments/{parent.pk}/replies/').json()
+        self.assertIn('Late reply 19', data['html'])
+        self.assertNotIn('Late reply 20', data['html'])
+        data = self.client.get(data['next_url']).json()
+        self.assertIn('Late reply 39<', data['html'])
+        data = self.client.get(data['next_url']).json()
+        self.assertIn('Late reply 44<', data['html'])
+        self.assertIsNone(data['next_url'])
+
+
+class HomePageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.project = make_project(make_user(1), title='Cached project')
+
+    def test_warm_home_page_runs_no_queries(self):
+        self.client.get('/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/')
+        self.assertContains(response, 'Cached project')
+
+    def test_donation_invalidates_project_sections(self):
+        self.client.get('/')
+        with self.captureOnCommitCallbacks(execute=True):
+            record_donation(self.project.id, make_user(2), Decimal('42.00'))
+
+        response = self.client.get('/')
+        self.assertContains(response, '42.00 / 100000.00 EGP')
+
+    def test_only_lock_holder_rebuilds_stale_entry(self):
+        get_or_build('test:entry', 'projects', lambda: 'old')
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate('projects')
+        # Another worker is already rebuilding
+        cache.add('pages:test:entry:lock', 'other', 30)
+
+        def builder():
+            raise AssertionError('only the lock holder may rebuild')
+
+        self.assertEqual(get_or_build('test:entry', 'projects', builder), 'old')
+
+        cache.delete('pages:test:entry:lock')
+        self.assertEqual(get_or_build('test:entry', 'projects', lambda: 'new'), 'new')
+
+
+class FileBasedHomePageCacheTests(HomePageCacheTests):
+    def setUp(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, True)
+        settings_override = override_settings(CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': location,
+            }
+        })
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        super().setUp()
+
+
+class FlakyEmailBackend(LocmemEmailBackend):
+    """Refuses every message to a "flaky" address."""
+
+    def send_messages(self, messages):
+        for message in messages:
+            if any('flaky' in address for address in message.to):
+                raise ConnectionError('temporary failure')
+        return super().send_messages(messages)
+
+
+class FakeSMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        with self.server.lock:
+            self.server.connections += 1
+        self.reply('220 localhost ready')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip()
+            verb = command[:4].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.reply('250 localhost')
+            elif verb in ('MAIL', 'RSET', 'NOOP'):
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                self.reply('550 No such user' if 'reject' in command else '250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                lines = []
+                while (data := self.rfile.readline()) not in (b'.\r\n', b''):
+                    lines.append(data)
+                with self.server.lock:
+                    self.server.messages.append(b''.join(lines))
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Not implemented')
+
+
+class FakeSMTPServer(socketserver.ThreadingTCPServer):
+    """A local SMTP stand-in that records messages and counts connections."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), FakeSMTPHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.messages = []
+
+
+class EmailOutboxTests(TestCase):
+    def test_views_queue_instead_of_sending(self):
+        user = make_user(1)
+        self.assertTrue(send_activation_email(user, 'http://testserver/activate/abc/'))
+
+        self.assertEqual(mail.outbox, [])
+        queued = OutboxEmail.objects.get()
+        self.assertEqual((queued.to, queued.status), (user.email, 'pending'))
+        self.assertIn('http://testserver/activate/abc/', queued.html_body)
+
+    def test_queueing_failures_are_logged(self):
+        user = make_user(1)
+        with mock.patch('pages.email_utils.enqueue_email', side_effect=RuntimeError('outbox down')):
+            with self.assertLogs('pages.email_utils', 'ERROR') as logs:
+                self.assertFalse(send_activation_email(user, 'http://testserver/activate/abc/'))
+        self.assertIn(f'Error queueing activation email to {user.email}', logs.output[0])
+        self.assertIn('RuntimeError: outbox down', logs.output[0])
+
+
+class EmailRenderingTests(TestCase):
+    def test_shell_matches_full_template_render(self):
+        user = make_user(1)
+        user.first_name = 'Ahmed <b>"&'
+        for name, context in [
+            ('activation_email', {'user': user, 'activation_link': 'http://testserver/activate/a?b=1&c=2'}),
+            ('password_reset_email', {'user': user, 'reset_link': 'http://testserver/reset/x/'}),
+            ('welcome_email', {'user': user, 'projects_url': '/projects/'}),
+        ]:
+            with self.subTest(name):
+                subject, text, html = render_email(name, **context)
+                self.assertEqual(html, render_to_string(f'emails/{name}.html', context))
+                self.assertEqual(text, render_to_string(f'emails/{name}.txt', context))
+                self.assertIn('Ahmed <b>"&', text)
+                self.assertNotIn('<', text.replace('Ahmed <b>', ''))
+
+    def test_batch_renders_each_user(self):
+        users = [{'first_name': f'First{i}', 'last_name': f'Last{i}'} for i in range(3)]
+        rendered = render_emails('welcome_email', [{'user': user, 'projects_url': '/projects/'} for user in users])
+        self.assertEqual([text.splitlines()[0] for _, text, _ in rendered], [f'مرحباً First{i} Last{i}!' for i in range(3)])
+
+
+class OutboxDeliveryTests(TransactionTestCase):
+    def enqueue(self, count, to='user{}@example.com'):
+        for i in range(count):
+            enqueue_email(f'Message {i}', to.format(i), f'Body {i}', f'<p>Body {i}</p>')
+
+    def test_pool_delivers_every_message_once(self):
+        self.enqueue(40)
+        stats = drain_outbox(workers=4, batch_size=5)
+
+        self.assertEqual(stats.sent, 40)
+        self.assertEqual(sorted(message.subject for message in mail.outbox), sorted(f'Message {i}' for i in range(40)))
+        self.assertFalse(OutboxEmail.objects.exclude(status='sent').exists())
+
+    @override_settings(EMAIL_BACKEND='pages.tests.FlakyEmailBackend')
+    def test_failures_back_off_then_give_up(self):
+        self.enqueue(3)
+        enqueue_email('Flaky', 'flaky@example.com', 'Body')
+
+        stats = drain_outbox(workers=2, max_attempts=2)
+        self.assertEqual((stats.sent, stats.retried, stats.failed), (3, 1, 0))
+        flaky = OutboxEmail.objects.get(to='flaky@example.com')
+        self.assertEqual((flaky.status, flaky.attempts), ('pending', 1))
+        self.assertGreater(flaky.next_attempt_at, timezone.now())
+        self.assertIn('temporary failure', flaky.last_error)
+
+        # Not due yet, so nothing is retried early
+        self.assertEqual(drain_outbox(workers=2, max_attempts=2).retried, 0)
+        OutboxEmail.objects.filter(pk=flaky.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(drain_outbox(workers=2, max_attempts=2).failed, 1)
+        self.assertEqual(OutboxEmail.objects.get(pk=flaky.pk).status, 'failed')
+
+    def test_smtp_connection_is_reused_per_worker(self):
+        server = FakeSMTPServer()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        self.enqueue(30)
+        enqueue_email('Rejected', 'reject@example.com', 'Body')
+        with override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST='127.0.0.1', EMAIL_PORT=server.server_address[1], EMAIL_USE_TLS=False,
+            EMAIL_HOST_USER='', EMAIL_HOST_PASSWORD=''
+        ):
+            stats = drain_outbox(workers=3, batch_size=4)
+
+        self.assertEqual((stats.sent, stats.retried), (30, 1))
+        self.assertEqual(len(server.messages), 30)
+        self.assertLessEqual(server.connections, 3)
+        self.assertEqual(stats.connections, server.connections)
+
+    def test_file_backend(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, True)
+        self.enqueue(10)
+        with override_settings(EMAIL_BACKEND='django.core.mail.backends.filebased.EmailBackend', EMAIL_FILE_PATH=location):
+            drain_outbox(workers=2)
+
+        written = ''.join(open(os.path.join(location, name)).read() for name in os.listdir(location))
+        self.assertEqual(written.count('Subject: Message'), 10)
+
+
+def media_root(test):
+    location = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, location, True)
+    settings_override = override_settings(MEDIA_ROOT=location)
+    settings_override.enable()
+    test.addCleanup(settings_override.disable)
+    return location
+
+
+def make_jpeg(width, height, name='photo.jpg'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), (200, 120, 40)).save(buffer, 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+@override_settings(IMAGE_INGEST_MODE='inline')
+class ImageRenditionTests(TestCase):
+    def setUp(self):
+        media_root(self)
+        cache.clear()
+        self.user = make_user(0)
+        self.project = make_project(self.user, title='Photo project')
+
+    def rendition_size(self, name):
+        with default_storage.open(name) as f, Image.open(f) as image:
+            return image.size
+
+    def test_upload_generates_project_renditions(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = ProjectImage.objects.create(project=self.project, image=make_jpeg(3000, 2000))
+
+        image.refresh_from_db()
+        self.assertTrue(image.has_renditions)
+        stem = image.image.name.rsplit('.', 1)[0]
+        self.assertEqual(self.rendition_size(f'{stem}.card-400w.jpg'), (400, 267))
+        self.assertEqual(self.rendition_size(f'{stem}.carousel-1600w.jpg'), (1600, 1067))
+
+        response = self.client.get('/projects/')
+        self.assertContains(response, f'src="/media/{stem}.card-400w.jpg"')
+        self.assertContains(response, f'/media/{stem}.card-800w.jpg 800w')
+        response = self.client.get(f'/projects/{self.project.pk}/')
+        self.assertContains(response, f'src="/media/{stem}.carousel-1200w.jpg"')
+
+    def test_small_originals_are_not_upscaled(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = ProjectImage.objects.create(project=self.project, image=make_jpeg(300, 200))
+        stem = image.image.name.rsplit('.', 1)[0]
+        self.assertEqual(self.rendition_size(f'{stem}.card-800w.jpg'), (300, 200))
+
+    @override_settings(IMAGE_RENDITION_FORMAT='WEBP')
+    def test_avatar_renditions_are_square_webp(self):
+        self.user.profile_picture = make_jpeg(900, 600, 'me.jpg')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.has_avatar_renditions())
+        self.assertTrue(self.user.avatar_url().endswith('.avatar-128w.webp'))
+        name = self.user.profile_picture.name.rsplit('.', 1)[0] + '.avatar-256w.webp'
+        self.assertEqual(self.rendition_size(name), (256, 256))
+
+    def test_avatar_renditions_follow_picture_changes_only(self):
+        self.user.profile_picture = SimpleUploadedFile('broken.jpg', b'not an image')
+        with mock.patch('pages.signals.generate_avatar_renditions', side_effect=OSError('Not an image')) as generate:
+            with self.assertLogs('pages.signals', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+                self.user.save()
+            self.assertEqual(generate.call_count, 1)
+
+            # Logins (last_login only) and edits of other fields do not retry it
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.force_login(self.user)
+                self.user.first_name = 'Changed'
+                self.user.save()
+            self.assertEqual(generate.call_count, 1)
+
+            self.user.profile_picture = make_jpeg(300, 300, 'me.jpg')
+            with self.assertLogs('pages.signals', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+                self.user.save()
+            self.assertEqual(generate.call_count, 2)
+
+    def test_backfill_command(self):
+        # Created without running the on-commit hook, like media from before renditions
+        images = [ProjectImage.objects.create(project=self.project, image=make_jpeg(1200, 900)) for _ in range(3)]
+        self.user.profile_picture = make_jpeg(500, 500, 'me.jpg')
+        self.user.save()
+
+        call_command('generate_renditions', workers=2, stdout=io.StringIO())
+
+        self.assertEqual(ProjectImage.objects.filter(has_renditions=True).count(), 3)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.has_avatar_renditions())
+        for image in images:
+            self.assertTrue(default_storage.exists(image.image.name.rsplit('.', 1)[0] + '.carousel-800w.jpg'))
+
+
+def project_form(**extra):
+    today = timezone.localdate().isoformat()
+    data = {
+        'title': 'Uploaded project',
+        'details': 'Details',
+        'category': Category.objects.get_or_create(name='General')[0].pk,
+        'total_target': '50000',
+        'tags': 'photos',
+        'start_date': today,
+        'end_date': (timezone.localdate() + timezone.timedelta(days=30)).isoformat(),
+    }
+    data.update(extra)
+    return data
+
+
+@override_settings(IMAGE_INGEST_MODE='queue')
+class ImageIngestTests(TestCase):
+    def setUp(self):
+        self.location = media_root(self)
+        cache.clear()
+        self.user = make_user(0)
+        self.client.force_login(self.user)
+
+    def test_project_images_are_attached_after_processing(self):
+        images = [make_jpeg(4000, 3000, 'first.jpg'), make_jpeg(600, 800, 'second.jpg')]
+        bogus = SimpleUploadedFile('notes.jpg', b'not an image', content_type='image/jpeg')
+        response = self.client.post('/projects/create/', {**project_form(), 'images': images + [bogus]})
+        project = Project.objects.get(title='Uploaded project')
+        self.assertRedirects(response, f'/projects/{project.pk}/')
+
+        # Nothing is decoded during the request
+        self.assertFalse(project.images.exists())
+        self.assertEqual(StagedImage.objects.filter(project=project, status='pending').count(), 3)
+        self.assertContains(self.client.get(f'/projects/{project.pk}/'), '3 images still processing')
+
+        call_command('process_staged_images', workers=0, stdout=io.StringIO())
+
+        attached = list(project.images.order_by('pk'))
+        self.assertEqual(len(attached), 2)
+        self.assertTrue(all(image.has_renditions for image in attached))
+        # Upload order is kept, so the first image is still the cover
+        with default_storage.open(attached[0].image.name) as f, Image.open(f) as image:
+            self.assertEqual(image.size, (2560, 1920))
+        with default_storage.open(attached[1].image.name) as f, Image.open(f) as image:
+            self.assertEqual(image.size, (600, 800))
+        self.assertTrue(default_storage.exists(attached[0].image.name.replace('.jpg', '.card-400w.jpg')))
+
+        failed = StagedImage.objects.get()
+        self.assertEqual(failed.status, 'failed')
+        self.assertIn('Not a valid image', failed.error)
+        self.assertEqual(os.listdir(os.path.join(self.location, 'staging')), [])
+        self.assertNotContains(self.client.get(f'/projects/{project.pk}/'), 'still processing')
+
+    def test_exif_is_applied_and_stripped(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotated 90 degrees
+        exif[0x010F] = 'Camera maker'
+        buffer = io.BytesIO()
+        Image.new('RGB', (300, 200), (10, 20, 30)).save(buffer, 'JPEG', exif=exif)
+        upload = SimpleUploadedFile('rotated.jpg', buffer.getvalue(), content_type='image/jpeg')
+        project = make_project(self.user)
+        self.client.post('/profile/edit/', {'first_name': 'Test', 'profile_picture': upload})
+        call_command('process_staged_images', workers=0, stdout=io.StringIO())
+
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.has_avatar_renditions())
+        with default_storage.open(self.user.profile_picture.name) as f, Image.open(f) as image:
+            self.assertEqual(image.size, (200, 300))
+            self.assertEqual(len(image.getexif()), 0)
+        self.assertTrue(self.user.avatar_url().endswith('.avatar-128w.jpg'))
+        self.assertFalse(project.staged_images.exists())
+
+    def test_process_pool(self):
+        project = make_project(self.user)
+        for index in range(4):
+            StagedImage.objects.create(
+                target='project_image', user=self.user, project=project,
+                file=SimpleUploadedFile(f'{index}.jpg', make_jpeg(1000 + index, 800).read())
+            )
+        output = io.StringIO()
+        call_command('process_staged_images', workers=2, stdout=output)
+        self.assertIn('Attached 4 images', output.getvalue())
+        widths = []
+        for image in project.images.order_by('pk'):
+            with default_storage.open(image.image.name) as f, Image.open(f) as decoded:
+                widths.append(decoded.width)
+        self.assertEqual(widths, [1000, 1001, 1002, 1003])
+
+
+@override_settings(IMAGE_INGEST_MODE='background', IMAGE_INGEST_WORKERS=2)
+class BackgroundImageIngestTests(TransactionTestCase):
+    def test_upload_returns_before_images_are_processed(self):
+        media_root(self)
+        user = make_user(0)
+        self.client.force_login(user)
+        self.client.post('/projects/create/', {**project_form(), 'images': [make_jpeg(1200, 900, f'{i}.jpg') for i in range(3)]})
+
+        # The dispatcher runs one drain at a time, so this waits for ours
+        _dispatcher.submit(lambda: None).result(timeout=60)
+        project = Project.objects.get()
+        self.assertEqual(project.images.filter(has_renditions=True).count(), 3)
+        self.assertFalse(StagedImage.objects.exists())
+
+    def test_drain_failures_are_logged_with_their_traceback(self):
+        with mock.patch('pages.ingest_utils.process_staged_images', side_effect=RuntimeError('Disk full')):
+            with self.assertLogs('pages.ingest_utils', 'ERROR') as logs:
+                _dispatcher.submit(_drain_in_background).result(timeout=60)
+        self.assertIn('RuntimeError: Disk full', logs.output[0])
+
+    def test_images_saved_elsewhere_render_on_the_ingest_thread(self):
+        media_root(self)
+        image = ProjectImage.objects.create(project=make_project(make_user(0)), image=make_jpeg(1200, 900))
+
+        _dispatcher.submit(lambda: None).result(timeout=60)
+        image.refresh_from_db()
+        self.assertTrue(image.has_renditions)
+
+
+@override_settings(IMAGE_INGEST_MODE='inline')
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        self.location = media_root(self)
+        self.user = make_user(0)
+        self.project = make_project(self.user)
+
+    def test_identical_uploads_are_stored_once(self):
+        first = ProjectImage.objects.create(project=self.project, image=make_jpeg(640, 480, 'a.jpg'))
+        second = ProjectImage.objects.create(project=self.project, image=make_jpeg(640, 480, 'a_copy.jpg'))
+        other = ProjectImage.objects.create(project=self.project, image=make_jpeg(320, 240, 'b.jpg'))
+
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertNotEqual(first.image.name, other.image.name)
+        self.assertRegex(first.image.name, r'^project_images/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+        self.assertEqual(StoredFile.objects.get(name=first.image.name).references, 2)
+        self.assertEqual(len(os.listdir(os.path.dirname(first.image.path))), 1)
+
+    def test_file_is_deleted_with_its_last_reference(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = ProjectImage.objects.create(project=self.project, image=make_jpeg(640, 480))
+        second = ProjectImage.objects.create(project=self.project, image=make_jpeg(640, 480))
+        name = first.image.name
+        self.assertTrue(default_storage.exists(name.replace('.jpg', '.card-400w.jpg')))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(default_storage.exists(name))
+        self.assertEqual(StoredFile.objects.get(name=name).references, 1)
+
+        # Deleting the project cascades to its images, renditions included
+        with self.captureOnCommitCallbacks(execute=True):
+            second.project.delete()
+        self.assertFalse(StoredFile.objects.exists())
+        self.assertFalse(default_storage.exists(name))
+        self.assertFalse(default_storage.exists(name.replace('.jpg', '.card-400w.jpg')))
+
+    def test_replacing_a_file_releases_the_old_one(self):
+        image = ProjectImage.objects.create(project=self.project, image=make_jpeg(640, 480, 'a.jpg'))
+        old = image.image.name
+        image.image = make_jpeg(320, 240, 'b.jpg')
+        with self.captureOnCommitCallbacks(execute=True):
+            image.save()
+        self.assertFalse(StoredFile.objects.filter(name=old).exists())
+        self.assertFalse(default_storage.exists(old))
+
+        # The same bytes again, then a save that keeps the file
+        image.image = make_jpeg(320, 240, 'b_again.jpg')
+        image.save()
+        image.save()
+        self.assertEqual(list(StoredFile.objects.values_list('name', 'references')), [(image.image.name, 1)])
+
+        self.user.profile_picture = make_jpeg(100, 100, 'me.jpg')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        first = self.user.profile_picture.name
+        self.client.force_login(self.user)
+        self.user.profile_picture = make_jpeg(120, 120, 'me2.jpg')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertFalse(StoredFile.objects.filter(name=first).exists())
+        self.user.profile_picture = None
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertEqual(list(StoredFile.objects.values_list('name', flat=True)), [image.image.name])
+
+    def test_files_from_before_are_never_deleted(self):
+        legacy = default_storage.save('project_images/legacy.jpg', make_jpeg(100, 100))
+        image = ProjectImage.objects.create(project=self.project, image=legacy)
+        with self.captureOnCommitCallbacks(execute=True):
+            image.delete()
+        self.assertTrue(default_storage.exists(legacy))
+
+    def test_dedupe_media_command(self):
+        # Two uploads of the same photo from before this storage, one with renditions
+        first = default_storage.save('profile_pics/FB_IMG_1.jpg', make_jpeg(300, 300))
+        second = default_storage.save('profile_pics/FB_IMG_1.jpg', make_jpeg(300, 300))
+        default_storage.save('profile_pics/FB_IMG_1.avatar-64w.jpg', make_jpeg(64, 64))
+        orphan = default_storage.save('profile_pics/unused.jpg', make_jpeg(50, 50))
+        self.assertNotEqual(first, second)
+        CustomUser.objects.filter(pk=self.user.pk).update(profile_picture=first, profile_picture_renditions=first)
+        make_user(1, profile_picture=second)
+        ProjectImage.objects.create(project=self.project, image=second)
+        size = default_storage.size(first)
+
+        output = io.StringIO()
+        call_command('dedupe_media', dry_run=True, stdout=output)
+        self.assertIn(f'Would reclaim {size / 1e6:.2f} MB', output.getvalue())
+        self.assertTrue(default_storage.exists(second))
+
+        output = io.StringIO()
+        call_command('dedupe_media', stdout=output)
+        self.assertIn(f'Reclaimed {size / 1e6:.2f} MB', output.getvalue())
+        self.assertIn('1 files', output.getvalue())
+
+        self.user.refresh_from_db()
+        name = self.user.profile_picture.name
+        self.assertRegex(name, r'^profile_pics/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+        self.assertEqual(set(CustomUser.objects.values_list('profile_picture', flat=True)), {name})
+        self.assertEqual(ProjectImage.objects.get().image.name, name)
+        self.assertTrue(self.user.has_avatar_renditions())
+        self.assertTrue(default_storage.exists(name.replace('.jpg', '.avatar-64w.jpg')))
+        self.assertEqual(StoredFile.objects.get().references, 3)
+        self.assertFalse(default_storage.exists(first))
+        self.assertFalse(default_storage.exists(second))
+        self.assertTrue(default_storage.exists(orphan))
+
+        # Nothing left to do the second time
+        output = io.StringIO()
+        call_command('dedupe_media', stdout=output)
+        self.assertIn('Reclaimed 0.00 MB', output.getvalue())
+        self.assertIn('0 renamed', output.getvalue())
+        self.assertEqual(StoredFile.objects.get().references, 3)
+
+
+class AccountTokenTests(TestCase):
+    def register(self):
+        self.client.post('/register/', {
+            'first_name': 'New', 'last_name': 'User', 'email': 'new@example.com', 'password': 'secret-pass',
+            'confirm_password': 'secret-pass', 'mobile_phone': '01012345678',
+        })
+        body = OutboxEmail.objects.get(to='new@example.com').body
+        return body.split('/activate/')[1].split('/')[0]
+
+    def test_signed_activation_touches_no_token_table(self):
+        token = self.register()
+        self.assertFalse(ActivationToken.objects.exists())
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/activate/{token}/')
+        self.assertTemplateUsed(response, 'pages/activation_success.html')
+        self.assertFalse(any('token' in query['sql'] for query in queries.captured_queries))
+        self.assertTrue(CustomUser.objects.get(email='new@example.com').is_active)
+
+        # Activating changed the user, so the link is spent
+        response = self.client.get(f'/activate/{token}/')
+        self.assertTemplateUsed(response, 'pages/activation_error.html')
+
+    def test_expired_and_tampered_links(self):
+        token = self.register()
+        with mock.patch('django.core.signing.time.time', return_value=timezone.now().timestamp() + 25 * 60 * 60):
+            response = self.client.get(f'/activate/{token}/')
+        self.assertContains(response, 'انتهت صلاحية')
+        response = self.client.get(f'/activate/{token[:-2]}xx/')
+        self.assertContains(response, 'غير صحيح')
+        self.assertFalse(CustomUser.objects.get(email='new@example.com').is_active)
+
+    def test_signed_password_reset_works_once(self):
+        user = make_user(0)
+        self.client.post('/forgot-password/', {'email': user.email})
+        self.assertFalse(PasswordResetToken.objects.exists())
+        link = OutboxEmail.objects.get(to=user.email).body.split('http://testserver')[1].split()[0]
+
+        self.assertTemplateUsed(self.client.get(link), 'pages/reset_password.html')
+        response = self.client.post(link, {'password': 'new-password', 'confirm_password': 'new-password'})
+        self.assertRedirects(response, '/login/')
+        user.refresh_from_db()
+        self.assertTrue(user.check_password('new-password'))
+        self.assertRedirects(self.client.get(link), '/login/')
+        response = self.client.post(link, {'password': 'again', 'confirm_password': 'again'})
+        user.refresh_from_db()
+        self.assertTrue(user.check_password('new-password'))
+
+    def test_deactivation_voids_earlier_activation_links(self):
+        for mode in ('signed', 'table'):
+            with self.subTest(mode=mode), override_settings(PAGES_TOKEN_MODE=mode):
+                token = self.register()
+                user = CustomUser.objects.get(email='new@example.com')
+                # An admin turns the account on and off again before the user ever logs in
+                user.is_active = True
+                user.save()
+                user.is_active = False
+                user.save(update_fields=['is_active'])
+
+                response = self.client.get(f'/activate/{token}/')
+                self.assertTemplateUsed(response, 'pages/activation_error.html')
+                user.refresh_from_db()
+                self.assertFalse(user.is_active)
+                self.assertIsNotNone(user.deactivated_at)
+                # Links issued afterwards still work
+                self.assertEqual(check_token(make_token(user, 'activation'), 'activation'), user)
+                user.delete()
+                OutboxEmail.objects.all().delete()
+
+    @override_settings(PAGES_TOKEN_MODE='table')
+    def test_table_mode(self):
+        token = self.register()
+        self.assertTrue(ActivationToken.objects.filter(token=token).exists())
+        self.assertTemplateUsed(self.client.get(f'/activate/{token}/'), 'pages/activation_success.html')
+        self.assertFalse(ActivationToken.objects.exists())
+
+    def test_purge_expired_tokens(self):
+        users = [make_user(i) for i in range(3)]
+        with override_settings(PAGES_TOKEN_MODE='table'):
+            for user in users:
+                make_token(user, 'activation')
+            make_token(users[0], 'password_reset')
+        ActivationToken.objects.filter(user__in=users[:2]).update(created_at=timezone.now() - timezone.timedelta(days=2))
+
+        output = io.StringIO()
+        call_command('purge_expired_tokens', stdout=output)
+        self.assertIn('Purged 2 activation, 0 password reset tokens.', output.getvalue())
+        self.assertEqual(ActivationToken.objects.count(), 1)
+        self.assertEqual(PasswordResetToken.objects.count(), 1)
+
+
+class ImportUsersTests(TestCase):
+    def import_file(self, content, suffix, **options):
+        handle, path = tempfile.mkstemp(suffix=suffix)
+        self.addCleanup(os.remove, path)
+        with os.fdopen(handle, 'w') as f:
+            f.write(content)
+        output, errors = io.StringIO(), io.StringIO()
+        call_command('import_users', path, stdout=output, stderr=errors, **options)
+        return output.getvalue(), errors.getvalue()
+
+    def test_csv_import(self):
+        make_user(0)
+        output, errors = self.import_file(
+            'email,first_name,last_name,mobile_phone,password,country\n'
+            'Ali@Partner.ORG,Ali,Hassan,01011111111,first-secret,Egypt\n'
+            'mona@partner.org,Mona,Adel,01122222222,,\n'
+            'bad@partner.org,Bad,Phone,12345,x,\n'
+            'ali@partner.org,Ali,Again,01233333333,x,\n'
+            'user0@example.com,Taken,Email,01244444444,x,\n'
+            'new@partner.org,Taken,Phone,01000000000,x,\n'
+            ',No,Email,01255555555,x,\n',
+            '.csv', workers=2, batch_size=2,
+        )
+        self.assertIn('Created 2 users', output)
+        self.assertIn('2 activation emails queued', output)
+        self.assertIn('Skipped 5', output)
+        self.assertIn('Line 4: invalid mobile phone', errors)
+        self.assertIn('Line 6: email already registered', errors)
+        self.assertIn('Line 7: mobile phone already registered', errors)
+
+        ali = CustomUser.objects.get(mobile_phone='01011111111')
+        self.assertEqual((ali.email, ali.username, ali.country), ('Ali@partner.org', 'Ali@partner.org', 'Egypt'))
+        self.assertFalse(ali.is_active)
+        self.assertTrue(ali.check_password('first-secret'))
+        self.assertFalse(CustomUser.objects.get(email='mona@partner.org').has_usable_password())
+
+        # The queued activation link works
+        body = OutboxEmail.objects.get(to='Ali@partner.org').body
+        token = body.split('/activate/')[1].split('/')[0]
+        self.client.get(f'/activate/{token}/')
+        ali.refresh_from_db()
+        self.assertTrue(ali.is_active)
+
+    @override_settings(PAGES_TOKEN_MODE='table')
+    def test_jsonl_import_of_active_users(self):
+        rows = [
+            {'email': f'member{i}@partner.org', 'first_name': 'Member', 'last_name': str(i), 'mobile_phone': f'0155{i:07d}'}
+            for i in range(5)
+        ]
+        content = '\n'.join(json.dumps(row) for row in rows) + '\nnot json\n'
+        output, errors = self.import_file(content, '.jsonl', workers=0, active=True)
+        self.assertIn('Created 5 users', output)
+        self.assertIn('Line 6: unreadable row', errors)
+        self.assertEqual(CustomUser.objects.filter(is_active=True).count(), 5)
+        self.assertFalse(OutboxEmail.objects.exists())
+        self.assertFalse(ActivationToken.objects.exists())
+
+    def test_invalid_optional_fields_are_skipped(self):
+        output, errors = self.import_file(
+            'email,first_name,last_name,mobile_phone,birthdate,facebook_profile\n'
+            'a@partner.org,A,One,01011111111,not-a-date,\n'
+            'b@partner.org,B,Two,01022222222,2001-02-30,\n'
+            'c@partner.org,C,Three,01033333333,,facebook\n'
+            'd@partner.org,D,Four,01044444444,1990-05-17,https://facebook.com/d\n',
+            '.csv', workers=0,
+        )
+        self.assertIn('Created 1 users', output)
+        self.assertIn('Skipped 3: 2 invalid birthdate, 1 invalid facebook_profile', output)
+        self.assertIn('Line 2: invalid birthdate (not-a-date)', errors)
+        self.assertIn('Line 3: invalid birthdate (2001-02-30)', errors)
+        self.assertIn('Line 4: invalid facebook_profile (facebook)', errors)
+        user = CustomUser.objects.get()
+        self.assertEqual((user.birthdate, user.facebook_profile), (date(1990, 5, 17), 'https://facebook.com/d'))
+
+    def test_dry_run(self):
+        output, _ = self.import_file('email,first_name,last_name,mobile_phone\na@b.org,A,B,01011111111\n', '.csv', dry_run=True)
+        self.assertIn('Validated 1 users', output)
+        self.assertFalse(CustomUser.objects.exists())
+
+
+class SeedPlatformTests(TestCase):
+    SIZES = {'users': 60, 'projects': 15, 'donations': 600, 'comments': 120, 'ratings': 80, 'reports': 10, 'images': 2}
+
+    def seed(self, **options):
+        call_command('seed_platform', stdout=io.StringIO(), skip_recommendations=True, **{**self.SIZES, **options})
+
+    def indexes(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'pages_donation'")
+            return sorted(name for name, in cursor.fetchall())
+
+    def test_seeded_rows_are_consistent(self):
+        media_root(self)
+        indexes = self.indexes()
+        self.seed()
+        self.assertEqual(
+            [model.objects.count() for model in (CustomUser, Project, Donation, Comment, Report)], [60, 15, 600, 120, 10]
+        )
+        self.assertLessEqual(Rating.objects.count(), 80)
+        self.assertEqual(self.indexes(), indexes)
+
+        for project in Project.objects.all():
+            donations = project.donations.all()
+            self.assertEqual(project.donation_count, donations.count())
+            self.assertEqual(project.current_amount, donations.aggregate(total=Sum('amount'))['total'] or 0)
+            self.assertEqual(project.comment_count, project.comments.count())
+            self.assertFalse(donations.filter(created_at__lt=project.created_at).exists())
+            self.assertFalse(donations.filter(created_at__gt=project.end_date).exists())
+        # Replies stay within their parent's project
+        for reply in Comment.objects.exclude(parent_comment=None).select_related('parent_comment'):
+            self.assertEqual(reply.project_id, reply.parent_comment.project_id)
+            self.assertIsNone(reply.parent_comment.parent_comment_id)
+        for summary in DonorSummary.objects.all():
+            donations = Donation.objects.filter(donor=summary.user_id)
+            self.assertEqual(summary.total_donated, donations.aggregate(total=Sum('amount'))['total'])
+            self.assertEqual(summary.donation_count, donations.count())
+            self.assertEqual(summary.projects_backed, donations.values('project').distinct().count())
+            self.assertEqual(summary.last_donation_at, donations.latest('created_at').created_at)
+        self.assertEqual(DonorSummary.objects.count(), Donation.objects.values('donor').distinct().count())
+        kept = sorted(DonationRollup.objects.values_list('scope', 'scope_id', 'period', 'bucket', 'amount', 'donation_count'))
+        self.assertEqual(rebuild_rollups(), len(kept))
+        self.assertEqual(
+            sorted(DonationRollup.objects.values_list('scope', 'scope_id', 'period', 'bucket', 'amount', 'donation_count')),
+            kept,
+        )
+        # Every image row holds a reference to its shared file
+        for stored in StoredFile.objects.all():
+            self.assertEqual(stored.references, ProjectImage.objects.filter(image=stored.name).count())
+
+        # A few campaigns draw most of the donations
+        counts = sorted(Project.objects.values_list('donation_count', flat=True), reverse=True)
+        self.assertGreater(sum(counts[:3]), sum(counts) / 3)
+
+        response = self.client.get(f'/projects/{Project.objects.order_by("-donation_count").first().pk}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_same_seed_gives_the_same_rows(self):
+        self.seed(images=0)
+        first = list(Donation.objects.order_by('pk').values_list('amount', 'message'))
+        last_id = Donation.objects.order_by('pk').last().pk
+        self.seed(images=0)
+        again = list(Donation.objects.filter(pk__gt=last_id).order_by('pk').values_list('amount', 'message'))
+        self.assertEqual(again, first)
+        self.assertEqual(CustomUser.objects.count(), 120)
+
+
+class SQLiteProfileTests(TestCase):
+    def connect(self, name):
+        # A connection to a scratch file, set up as settings.DATABASES does
+        # under SQLITE_PROFILE=name, whatever profile this run uses
+        profile = settings.SQLITE_PROFILES[name]
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        wrapper = SQLiteDatabaseWrapper({
+            **connection.settings_dict,
+            'NAME': os.path.join(directory, 'profile.sqlite3'),
+            'OPTIONS': {
+                **profile['options'],
+                'init_command': ''.join(f'PRAGMA {key}={value};' for key, value in profile['pragmas'].items()),
+            },
+            'CONN_MAX_AGE': profile['conn_max_age'],
+        }, alias=f'{name}_profile')
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def pragma(self, wrapper, name):
+        with wrapper.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_production_profile(self):
+        wrapper = self.connect('production')
+        self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma(wrapper, 'synchronous'), 1)  # NORMAL
+        self.assertEqual(self.pragma(wrapper, 'busy_timeout'), 5000)
+        self.assertEqual(self.pragma(wrapper, 'cache_size'), -32000)
+        self.assertEqual(wrapper.transaction_mode, 'IMMEDIATE')
+        self.assertEqual(wrapper.settings_dict['CONN_MAX_AGE'], 600)
+
+    def test_default_profile_leaves_the_file_alone(self):
+        wrapper = self.connect('default')
+        self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'delete')
+        self.assertIsNone(wrapper.transaction_mode)
+
+
+
+@override_settings(PAGES_SPLIT_ENGAGEMENT=True)
+class EngagementDatabaseTests(TestCase):
+    databases = {'default', 'engagement'}
+
+    def setUp(self):
+        self.creator = make_user(1)
+        self.donor = make_user(2)
+        self.project = make_project(self.creator)
+
+    def test_engagement_rows_are_written_to_their_own_database(self):
+        self.client.force_login(self.donor)
+        self.client.post(f'/projects/{self.project.pk}/donate/', {'amount': '40'})
+        self.client.post(f'/projects/{self.project.pk}/rate/', {'rating': 4})
+        self.client.post(f'/projects/{self.project.pk}/comment/', {'content': 'Good luck'})
+
+        self.assertEqual(Donation.objects.using('engagement').count(), 1)
+        self.assertEqual(Rating.objects.using('engagement').count(), 1)
+        self.assertEqual(Comment.objects.using('engagement').count(), 1)
+        self.assertFalse(Donation.objects.using('default').exists())
+        self.project.refresh_from_db()
+        self.assertEqual(
+            (self.project.donation_count, self.project.rating_sum, self.project.comment_count), (1, 4, 1)
+        )
+
+    def test_pages_read_across_the_databases(self):
+        comment = Comment.objects.create(project=self.project, user=self.donor, content='First')
+        Comment.objects.create(project=self.project, user=self.creator, content='Thanks', parent_comment=comment)
+        record_donation(self.project.pk, self.donor, Decimal('15'))
+
+        # The users come from the default database, one query for each of the two engagement queries
+        with self.assertNumQueries(2, using='engagement'), self.assertNumQueries(2):
+            [first] = load_comment_thread(self.project)
+            self.assertEqual(first.user, self.donor)
+            self.assertEqual(first.preview_replies[0].user, self.creator)
+
+        self.client.force_login(self.donor)
+        self.assertContains(self.client.get('/profile/'), self.project.title)
+        replies = self.client.get(f'/projects/{self.project.pk}/comments/{comment.pk}/replies/')
+        self.assertIn('Thanks', replies.json()['html'])
+
+    def test_donation_to_a_missing_project_does_not_break_the_profile(self):
+        Donation.objects.create(project_id=self.project.pk + 100, donor=self.donor, amount=Decimal('5'))
+        self.client.force_login(self.donor)
+        self.assertEqual(self.client.get('/profile/').status_code, 200)
+
+    def test_deleting_a_project_or_user_deletes_their_engagement_rows(self):
+        other = make_project(self.donor)
+        comment = Comment.objects.create(project=self.project, user=self.donor, content='Hi')
+        Report.objects.create(reporter=self.creator, report_type='comment', comment=comment, reason='Spam')
+        record_donation(self.project.pk, self.donor, Decimal('15'))
+        record_donation(other.pk, self.creator, Decimal('15'))
+
+        self.project.delete()
+        self.assertEqual(list(Donation.objects.values_list('project', flat=True)), [other.pk])
+        self.assertFalse(Comment.objects.exists())
+        self.assertFalse(Report.objects.exists())
+
+        self.assertEqual(DonorSummary.objects.using('engagement').count(), 2)
+        self.creator.delete()
+        self.assertFalse(Donation.objects.exists())
+        self.assertEqual(list(DonorSummary.objects.values_list('user', flat=True)), [self.donor.pk])
+
+    def test_rebuild_counters_aggregates_in_the_engagement_database(self):
+        record_donation(self.project.pk, self.donor, Decimal('15'))
+        Rating.objects.create(project=self.project, user=self.donor, rating=5)
+        Project.objects.filter(pk=self.project.pk).update(donation_count=0, rating_count=0, rating_sum=0)
+
+        call_command('rebuild_counters', stdout=io.StringIO())
+        self.project.refresh_from_db()
+        self.assertEqual((self.project.donation_count, self.project.rating_count, self.project.rating_sum), (1, 1, 5))
+
+    def test_split_command_moves_rows_and_keeps_them_intact(self):
+        with self.settings(PAGES_SPLIT_ENGAGEMENT=False):
+            donation, _ = record_donation(self.project.pk, self.donor, Decimal('12.34'), message='Hello')
+            Donation.objects.filter(pk=donation.pk).update(created_at=timezone.now() - timezone.timedelta(days=3))
+            comment = Comment.objects.create(project=self.project, user=self.donor, content='Hi')
+            Comment.objects.create(project=self.project, user=self.creator, content='Re', parent_comment=comment)
+            Report.objects.create(reporter=self.creator, report_type='comment', comment=comment, reason='Spam')
+            old = Donation.objects.get()
+
+        out = io.StringIO()
+        call_command('split_engagement_db', batch_size=1, stdout=out)
+        self.assertIn('both databases match', out.getvalue())
+        self.assertEqual(Donation.objects.get(), old)
+        moved = Donation.objects.get()
+        self.assertEqual((moved.amount, moved.message, moved.created_at), (old.amount, old.message, old.created_at))
+        self.assertEqual(Report.objects.get().comment.replies.get().content, 'Re')
+
+        self.assertEqual(DonorSummary.objects.get().total_donated, Decimal('12.34'))
+        # Rebuilt from the moved rows, so the back-dated donation is in its own day
+        self.assertEqual(
+            DonationRollup.objects.get(scope='project', period='day').bucket, bucket_start(old.created_at, 'day')
+        )
+
+        # Resumes without copying twice, then empties the originals
+        call_command('split_engagement_db', delete_source=True, stdout=out)
+        self.assertEqual(Comment.objects.count(), 2)
+        with connections['default'].cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM pages_donation')
+            self.assertEqual(cursor.fetchone()[0], 0)
+            cursor.execute('SELECT COUNT(*) FROM pages_donorsummary')
+            self.assertEqual(cursor.fetchone()[0], 0)
+            cursor.execute('SELECT COUNT(*) FROM pages_donationrollup')
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+
+class QueryPlanTests(TestCase):
+    """
+    Every query the pages run reads through an index: EXPLAIN QUERY PLAN
+    shows no full table scan and no temporary B-tree for sorting or
+    grouping. Lookup tables read whole on purpose are listed below, and
+    full-text matches (which have no index order) may be sorted.
+    """
+    WHOLE_TABLE_READS = {'pages_category'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [make_user(i) for i in range(4)]
+        cls.category = Category.objects.create(name='Other')
+        cls.projects = [
+            make_project(cls.users[i % 4], title=f'Project {i}', tags='alpha, beta' if i % 2 else 'gamma',
+                         category=cls.category if i % 3 else None, is_featured=i % 4 == 0)
+            for i in range(12)
+        ]
+        Project.objects.filter(pk=cls.projects[-1].pk).update(is_active=False)
+        cls.project = cls.projects[0]
+        for i, user in enumerate(cls.users):
+            record_donation(cls.project.pk, user, Decimal('10'))
+            Rating.objects.create(project=cls.project, user=user, rating=i % 5 + 1)
+            comment = Comment.objects.create(project=cls.project, user=user, content=f'Comment {i}')
+            Comment.objects.create(project=cls.project, user=cls.users[0], content='Reply', parent_comment=comment)
+            Report.objects.create(reporter=user, report_type='comment', comment=comment, reason='Spam')
+        cls.comment = comment
+        call_command('rebuild_counters', stdout=io.StringIO())
+
+    def plan(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+
+    def problems(self, plan):
+        # Subqueries in FROM show up as co-routines scanned by their alias
+        subqueries = {step.split()[1] for step in plan if step.startswith(('CO-ROUTINE', 'MATERIALIZE'))}
+        problems = []
+        for step in plan:
+            words = step.split()
+            if words[0] == 'SCAN' and 'USING' not in words and 'VIRTUAL' not in words \
+                    and words[1] not in self.WHOLE_TABLE_READS | subqueries and not words[1].startswith('('):
+                problems.append(step)
+            elif 'TEMP B-TREE' in step and not ('ORDER BY' in step and any('VIRTUAL TABLE' in s for s in plan)):
+                problems.append(step)
+        return problems
+
+    def assertIndexedQueries(self, queries):
+        failures = []
+        for sql in queries:
+            if sql.lstrip().upper().startswith('SELECT'):
+                plan = self.plan(sql)
+                if self.problems(plan):
+                    failures.append(f'{sql}\n  ' + '\n  '.join(plan))
+        if failures:
+            self.fail('Unindexed query plans:\n\n' + '\n\n'.join(failures))
+
+    def assertIndexedPage(self, url, params=None):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, 200)
+        self.assertIndexedQueries(query['sql'] for query in queries.captured_queries)
+
+    def test_home(self):
+        self.assertIndexedPage('/')
+
+    def test_project_list(self):
+        self.assertIndexedPage('/projects/')
+        self.assertIndexedPage('/projects/', {'page': 2})
+        self.assertIndexedPage('/projects/', {'category': self.category.pk})
+        self.assertIndexedPage('/projects/', {'tag': 'alpha'})
+        self.assertIndexedPage('/projects/', {'search': 'Project'})
+
+    def test_project_list_cursor_mode(self):
+        first = self.client.get('/projects/', {'cursor': ''}).context['page_obj']
+        self.assertIndexedPage('/projects/', {'cursor': first.next_cursor})
+        self.assertIndexedPage('/projects/', {'cursor': first.next_cursor, 'category': self.category.pk})
+
+    def test_top_rated(self):
+        self.assertIndexedPage('/projects/top-rated/')
+
+    def test_project_detail_and_comment_fragments(self):
+        self.assertIndexedPage(f'/projects/{self.project.pk}/')
+        self.assertIndexedPage(f'/projects/{self.project.pk}/comments/')
+        self.assertIndexedPage(f'/projects/{self.project.pk}/comments/{self.comment.pk}/replies/')
+
+    def test_profile(self):
+        self.client.force_login(self.users[0])
+        self.assertIndexedPage('/profile/')
+
+    def test_project_analytics(self):
+        self.client.force_login(self.project.creator)
+        self.assertIndexedPage(f'/projects/{self.project.pk}/analytics/')
+        self.assertIndexedPage(f'/projects/{self.project.pk}/analytics/', {'period': 'hour', 'from': '2020-01-01'})
+
+    def test_unresolved_reports(self):
+        self.assertIndexedQueries([str(Report.objects.filter(is_resolved=False).order_by('-created_at').query)])
+
+
+@override_settings(PAGES_INSTRUMENTATION=True, PAGES_BUDGET_ACTION='raise')
+class RequestInstrumentationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.users = [make_user(i) for i in range(3)]
+        self.project = make_project(self.users[0], tags='alpha', is_featured=True)
+        self.comment = Comment.objects.create(project=self.project, user=self.users[0], content='Hello')
+        for user in self.users:
+            Comment.objects.create(project=self.project, user=user, content='Reply', parent_comment=self.comment)
+            record_donation(self.project.pk, user, Decimal('5'))
+
+    def get(self, url, **params):
+        with self.assertLogs('pages.instrumentation') as logs:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(logs.records[-1].getMessage())
+
+    def test_records_one_line_per_request(self):
+        record = self.get(f'/projects/{self.project.pk}/')
+        self.assertEqual(record['url_name'], 'project_detail')
+        self.assertEqual((record['method'], record['status']), ('GET', 200))
+        self.assertGreater(record['queries'], 0)
+        self.assertGreater(record['template_ms'], 0)
+        self.assertGreaterEqual(record['wall_ms'], record['template_ms'])
+        self.assertEqual(record['repeated_queries'], [])
+
+    def test_pages_stay_within_their_budgets(self):
+        # Wall time is left to production logs; counts are deterministic
+        budgets = {
+            name: {measure: limit for measure, limit in budget.items() if measure != 'wall_ms'}
+            for name, budget in settings.PAGES_REQUEST_BUDGETS.items()
+        }
+        self.client.force_login(self.users[1])
+        with self.settings(PAGES_REQUEST_BUDGETS=budgets):
+            for url in ['/', '/projects/', '/projects/?tag=alpha', '/projects/top-rated/', '/profile/',
+                        f'/projects/{self.project.pk}/', f'/projects/{self.project.pk}/comments/',
+                        f'/projects/{self.project.pk}/comments/{self.comment.pk}/replies/']:
+                self.get(url)
+
+    def test_repeated_queries_are_traced_to_the_template_line(self):
+        # Replies rendered without their users joined: one query per reply
+        with mock.patch('pages.comment_utils.join_related', lambda queryset, *fields: queryset):
+            with self.settings(PAGES_BUDGET_ACTION='log'):
+                record = self.get(f'/projects/{self.project.pk}/comments/{self.comment.pk}/replies/')
+
+        [group] = record['repeated_queries']
+        self.assertEqual(group['count'], 3)
+        self.assertIn('FROM "pages_customuser"', group['sql'])
+        self.assertEqual(group['origins'], ['patrts/comment_reply.html:4'])
+        self.assertEqual(record['over_budget']['repeated_queries'], {'value': 1, 'limit': 0})
+
+    def test_listed_pages_inherit_the_default_limits(self):
+        # project_detail has its own entry but no repeated_queries limit of its own
+        self.assertNotIn('repeated_queries', settings.PAGES_REQUEST_BUDGETS['project_detail'])
+        with mock.patch('pages.comment_utils.join_related', lambda queryset, *fields: queryset):
+            with self.settings(PAGES_BUDGET_ACTION='raise'):
+                with self.assertRaisesRegex(BudgetExceeded, r'project_detail over budget: .*repeated_queries 1 > 0'):
+                    with self.assertLogs('pages.instrumentation'):
+                        self.client.get(f'/projects/{self.project.pk}/')
+
+    def test_over_budget_fails_the_request(self):
+        with self.settings(PAGES_REQUEST_BUDGETS={'home': {'queries': 1}}):
+            with self.assertRaisesRegex(BudgetExceeded, r'home over budget: queries \d+ > 1'):
+                with self.assertLogs('pages.instrumentation'):
+                    self.client.get('/')
@@ -0,0 +1,114 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare, get_random_string, salted_hmac
+
+from .models import ActivationToken, CustomUser, PasswordResetToken
+
+# Purpose -> the table used in 'table' mode
+TOKEN_MODELS = {
+    'activation': ActivationToken,
+    'password_reset': PasswordResetToken,
+}
+
+
+class InvalidToken(Exception):
+    pass
+
+
+class ExpiredToken(InvalidToken):
+    pass
+
+
+def token_mode():
+    """
+    PAGES_TOKEN_MODE: 'signed' (default) tokens carry the user id and a
+    timestamp under an HMAC and are checked without touching the token
+    tables; 'table' stores a random token per user as before.
+    """
+    return getattr(settings, 'PAGES_TOKEN_MODE', 'signed')
+
+
+def token_max_age():
+    return timedelta(seconds=getattr(settings, 'PAGES_TOKEN_MAX_AGE', 60 * 60 * 24))
+
+
+def _user_state(user, purpose):
+    # Activating the account or changing the password (which also happens
+    # on reset) changes this, so a signed token works once; so does a
+    # deactivation, which last_login misses for users who never logged in
+    last_login = '' if user.last_login is None else user.last_login.replace(microsecond=0, tzinfo=None)
+    value = f'{user.pk}{user.password}{user.is_active}{last_login}'
+    if user.deactivated_at is not None:  # Left out until set, so earlier links keep working
+        value += user.deactivated_at.replace(microsecond=0, tzinfo=None).isoformat()
+    return salted_hmac(f'pages.tokens.{purpose}', value).hexdigest()[:32]
+
+
+def make_token(user, purpose):
+    """Issue an activation or password reset token for ``user``."""
+    if token_mode() == 'table':
+        model = TOKEN_MODELS[purpose]
+        model.objects.filter(user=user).delete()
+        return model.objects.create(user=user, token=get_random_string(48)).token
+    signer = signing.TimestampSigner(salt=f'pages.tokens.{purpose}')
+    return signer.sign_object([user.pk, _user_state(user, purpose)])
+
+
+def make_tokens(users, purpose):
+    """``make_token`` for many new users; table mode writes the rows with one bulk insert."""
+    if token_mode() != 'table':
+        return [make_token(user, purpose) for user in users]
+    rows = TOKEN_MODELS[purpose].objects.bulk_create([
+        TOKEN_MODELS[purpose](user=user, token=get_random_string(48)) for user in users
+    ])
+    return [row.token for row in rows]
+
+
+def check_token(token, purpose):
+    """
+    Return the user ``token`` was issued to, or raise ExpiredToken or
+    InvalidToken. Tokens of either mode are accepted, so links sent before
+    the setting changed keep working.
+    """
+    model = TOKEN_MODELS[purpose]
+    if ':' not in token:  # Random table tokens never contain a colon
+        try:
+            row = model.objects.select_related('user').get(token=token)
+        except model.DoesNotExist:
+            raise InvalidToken(token)
+        if timezone.now() > row.created_at + token_max_age():
+            row.delete()
+            raise ExpiredToken(token)
+        if row.user.deactivated_at is not None and row.created_at <= row.user.deactivated_at:
+            row.delete()
+            raise InvalidToken(token)
+        return row.user
+
+    signer = signing.TimestampSigner(salt=f'pages.tokens.{purpose}')
+    try:
+        pk, state = signer.unsign_object(token, max_age=token_max_age())
+    except signing.SignatureExpired:
+        raise ExpiredToken(token)
+    except (signing.BadSignature, TypeError, ValueError):
+        raise InvalidToken(token)
+    user = CustomUser.objects.filter(pk=pk).first()
+    if user is None or not constant_time_compare(state, _user_state(user, purpose)):
+        raise InvalidToken(token)
+    return user
+
+
+def spend_token(token, purpose):
+    """Forget a used token; signed tokens are already void once the user changed."""
+    if ':' not in token:
+        TOKEN_MODELS[purpose].objects.filter(token=token).delete()
+
+
+def purge_expired_tokens():
+    """Delete expired token rows in bulk; return how many went per purpose."""
+    cutoff = timezone.now() - token_max_age()
+    return {
+        purpose: model.objects.filter(created_at__lt=cutoff).delete()[0]
+        for purpose, model in TOKEN_MODELS.items()
+    }
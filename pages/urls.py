@@ -18,10 +18,14 @@ urlpatterns = [
     path('reset-password/<str:token>/', views.reset_password, name='reset_password'),
     path('projects/create/', ProjectCreateView.as_view(), name='project_create'),
     path('projects/', views.project_list, name='project_list'),
+    path('projects/top-rated/', views.top_rated, name='top_rated'),
     path('projects/<int:project_id>/', views.project_detail, name='project_detail'),
     path('projects/<int:project_id>/donate/', views.donate_to_project, name='donate_to_project'),
     path('projects/<int:project_id>/rate/', views.rate_project, name='rate_project'),
     path('projects/<int:project_id>/comment/', views.add_comment, name='add_comment'),
+    path('projects/<int:project_id>/comments/', views.project_comments, name='project_comments'),
+    path('projects/<int:project_id>/comments/<int:comment_id>/replies/', views.comment_replies, name='comment_replies'),
     path('projects/<int:project_id>/report/', views.report_project, name='report_project'),
     path('projects/<int:project_id>/cancel/', views.cancel_project, name='cancel_project'),
+    path('projects/<int:project_id>/analytics/', views.project_analytics, name='project_analytics'),
 ]
@@ -1,24 +1,43 @@
 from django.shortcuts import render, redirect
+from django.template.loader import render_to_string
 from django.contrib.auth import get_user_model
 from django.contrib import messages
 from django.core.mail import send_mail
 from django.conf import settings
-from django.utils.crypto import get_random_string
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from django.urls import reverse
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
 from django.views import View
-from .models import CustomUser, ActivationToken, PasswordResetToken, Category, Project, ProjectImage, Comment, Donation, Rating, Report
+from .models import CustomUser, Category, Project, Comment, Donation, DonorSummary, Rating, Report
 from .email_utils import send_activation_email, send_password_reset_email, send_welcome_email
+from .cache_utils import get_or_build
+from .comment_utils import load_comment_thread, load_replies
+from .db_utils import engagement_atomic, is_lock_error, join_related
+from .donation_utils import record_donation
+from .ingest_utils import schedule_ingest, stage_upload
+from .leaderboard_utils import top_rated_projects, update_project_rank
+from .pagination_utils import CachedCountPaginator, keyset_enabled, keyset_paginate
+from .recommendation_utils import similar_projects_for
+from .rollup_utils import PERIODS, donation_series, totals_before
+from .search_utils import search_projects
+from .tag_utils import normalize_tag, popular_tags
+from .token_utils import ExpiredToken, InvalidToken, check_token, make_token, spend_token
+import datetime
 import re
+import uuid
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
-from django.db.models import Q, Avg
+from django.db import OperationalError
+from django.db.models import Exists, F, OuterRef
 from django.core.paginator import Paginator
 from decimal import Decimal, InvalidOperation
 from django.shortcuts import get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
+import logging
+
+logger = logging.getLogger(__name__)
 
 EGYPTIAN_PHONE_REGEX = r'^(\+20|0)?1[0125][0-9]{8}$'
 
@@ -67,15 +86,16 @@ class RegistrationView(View):
             first_name=first_name,
             last_name=last_name,
             mobile_phone=mobile_phone,
-            profile_picture=profile_picture,
             is_active=False
         )
         user.set_password(password)
         user.save()
+        if profile_picture:
+            stage_upload(profile_picture, 'profile_picture', user)
+            schedule_ingest()
 
         # Generate activation token
-        token = get_random_string(48)
-        ActivationToken.objects.create(user=user, token=token)
+        token = make_token(user, 'activation')
         
         
         
@@ -90,8 +110,8 @@ class RegistrationView(View):
                 messages.success(request, 'تم التسجيل بنجاح! يرجى التحقق من بريدك الإلكتروني لتفعيل حسابك.')
             else:
                 messages.warning(request, 'تم التسجيل بنجاح! لكن حدث خطأ في إرسال رسالة التفعيل. يرجى التواصل مع الدعم الفني.')
-        except Exception as e:
-            print(f"Error sending activation email: {e}")
+        except Exception:
+            logger.exception('Error sending activation email to %s', user.email)
             messages.warning(request, 'تم التسجيل بنجاح! لكن حدث خطأ في إرسال رسالة التفعيل. يرجى التواصل مع الدعم الفني.')
 
         return redirect('register')
@@ -121,15 +141,35 @@ class LoginView(View):
 class ProfileView(View):
     def get(self, request):
         user = request.user
-        # Get user's projects
-        user_projects = Project.objects.filter(creator=user, is_active=True).order_by('-created_at')
-        # Get user's donations
-        user_donations = Donation.objects.filter(donor=user).order_by('-created_at')
+        # Totals kept up to date by record_donation instead of aggregating the history
+        donor_summary = DonorSummary.objects.filter(user=user).first()
+        # Get user's projects, a page of cards at a time
+        user_projects = keyset_paginate(
+            Project.objects.for_cards().filter(creator=user, is_active=True),
+            request.GET.get('projects_cursor', ''),
+            6,
+            count_group=None
+        )
+        # Get user's donations, one cursor page at a time
+        user_donations = keyset_paginate(
+            join_related(Donation.objects.filter(donor=user), 'project'),
+            request.GET.get('cursor', ''),
+            20,
+            count_group=None
+        )
+        # Each list's cursor links keep the other list's position
+        projects_query = request.GET.copy()
+        projects_query.pop('projects_cursor', None)
+        donations_query = request.GET.copy()
+        donations_query.pop('cursor', None)
         
         context = {
             'user_obj': user,
+            'donor_summary': donor_summary,
             'user_projects': user_projects,
             'user_donations': user_donations,
+            'projects_query': projects_query.urlencode(),
+            'donations_query': donations_query.urlencode(),
         }
         return render(request, 'pages/profile.html', context)
 
@@ -153,11 +193,13 @@ class ProfileEditView(View):
         user.facebook_profile = data.get('facebook_profile', '')
         user.country = data.get('country', '')
         
-        # Handle profile picture
-        if 'profile_picture' in files:
-            user.profile_picture = files['profile_picture']
-        
         user.save()
+
+        # The new picture replaces the old one once it has been processed
+        if 'profile_picture' in files:
+            stage_upload(files['profile_picture'], 'profile_picture', user)
+            schedule_ingest()
+            messages.info(request, 'Your new profile picture will appear in a moment.')
         messages.success(request, 'Profile updated successfully!')
         return redirect('profile')
 
@@ -171,9 +213,6 @@ class ProjectCreateView(View):
         data = request.POST
         files = request.FILES.getlist('images')
         
-        # Debug: Print form data
-        print("Form data received:", data)
-        
         # Validate required fields
         required_fields = ['title', 'details', 'category', 'total_target', 'tags', 'start_date', 'end_date']
         missing_fields = [field for field in required_fields if not data.get(field)]
@@ -189,9 +228,6 @@ class ProjectCreateView(View):
             start_date_str = data.get('start_date')
             end_date_str = data.get('end_date')
             
-            print(f"Start date string: {start_date_str}")
-            print(f"End date string: {end_date_str}")
-            
             start_date = timezone.datetime.strptime(start_date_str, '%Y-%m-%d')
             end_date = timezone.datetime.strptime(end_date_str, '%Y-%m-%d')
             
@@ -199,10 +235,6 @@ class ProjectCreateView(View):
             start_date = timezone.make_aware(start_date)
             end_date = timezone.make_aware(end_date)
             
-            print(f"Parsed start date: {start_date}")
-            print(f"Parsed end date: {end_date}")
-            print(f"Current time: {timezone.now()}")
-            
             if end_date <= start_date:
                 messages.error(request, 'End date must be after start date.')
                 return self.get(request)
@@ -215,7 +247,7 @@ class ProjectCreateView(View):
                 
         except (Category.DoesNotExist, ValueError) as e:
             messages.error(request, f'Invalid data provided: {str(e)}')
-            print(f"Error in project creation: {e}")
+            logger.warning('Invalid project data: %s', e)
             return self.get(request)
         
         try:
@@ -231,48 +263,56 @@ class ProjectCreateView(View):
                 end_date=end_date
             )
             
-            # Handle multiple images
+            # Images are staged and attached once processed off the request
             for image_file in files:
                 if image_file:
-                    ProjectImage.objects.create(project=project, image=image_file)
+                    stage_upload(image_file, 'project_image', request.user, project)
+            schedule_ingest()
             
             messages.success(request, 'Project created successfully!')
             return redirect('project_detail', project_id=project.id)
             
         except Exception as e:
             messages.error(request, f'Error creating project: {str(e)}')
-            print(f"Error creating project: {e}")
+            logger.exception('Error creating project')
             return self.get(request)
 
-def home(request):
-    # Get highest rated projects (top 5 rated)
-    highest_rated_projects = Project.objects.filter(
-        is_active=True
-    ).annotate(
-        avg_rating=Avg('ratings__rating')
-    ).filter(
-        avg_rating__isnull=False
-    ).order_by('-avg_rating')[:5]
-    
-    # Get latest projects
-    latest_projects = Project.objects.filter(
-        is_active=True
-    ).order_by('-created_at')[:5]
-    
+def _render_highest_rated_section():
+    # Get highest rated projects (top 5 of the leaderboard)
+    highest_rated_projects = top_rated_projects()[:5]
+    return render_to_string('patrts/home_highest_rated.html', {'highest_rated_projects': highest_rated_projects})
+
+def _render_featured_section():
     # Get featured projects (admin selected)
-    featured_projects = Project.objects.filter(
+    featured_projects = Project.objects.for_cards().filter(
         is_active=True, 
         is_featured=True
     ).order_by('-created_at')[:5]
-    
-    # Get categories
-    categories = Category.objects.all()
+    return render_to_string('patrts/home_featured.html', {'featured_projects': featured_projects})
+
+def _render_latest_section():
+    # Get latest projects
+    latest_projects = Project.objects.for_cards().filter(
+        is_active=True
+    ).order_by('-created_at')[:5]
+    return render_to_string('patrts/home_latest.html', {'latest_projects': latest_projects})
+
+def home(request):
+    # Every section is cached and invalidated by signals (see pages.signals)
+    categories = get_or_build('home:categories', 'categories', lambda: list(Category.objects.all()))
     
     context = {
-        'highest_rated_projects': highest_rated_projects,
-        'latest_projects': latest_projects,
-        'featured_projects': featured_projects,
         'categories': categories,
+        'active_project_count': get_or_build(
+            'home:active_project_count', 'projects', Project.objects.filter(is_active=True).count
+        ),
+        'categories_section': get_or_build(
+            'home:categories_section', 'categories',
+            lambda: render_to_string('patrts/home_categories.html', {'categories': categories})
+        ),
+        'highest_rated_section': get_or_build('home:highest_rated_section', 'projects', _render_highest_rated_section),
+        'featured_section': get_or_build('home:featured_section', 'projects', _render_featured_section),
+        'latest_section': get_or_build('home:latest_section', 'projects', _render_latest_section),
     }
     return render(request, "pages/home.html", context)
 
@@ -286,37 +326,71 @@ def game3(request):
     return render(request, "pages/game3.html")
 
 def project_list(request):
-    projects = Project.objects.filter(is_active=True).order_by('-created_at')
+    projects = Project.objects.for_cards().filter(is_active=True).order_by('-created_at')
     
     # Search functionality
     search_query = request.GET.get('search', '')
     if search_query:
-        projects = projects.filter(
-            Q(title__icontains=search_query) | 
-            Q(tags__icontains=search_query) |
-            Q(details__icontains=search_query)
-        )
+        projects = search_projects(projects, search_query)
     
     # Category filter
     category_id = request.GET.get('category', '')
     if category_id:
         projects = projects.filter(category_id=category_id)
     
-    # Pagination
-    paginator = Paginator(projects, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Exact tag filter, answered from the tag index. EXISTS rather than a
+    # join keeps the newest-first index order, so no sort of every match
+    tag_name = normalize_tag(request.GET.get('tag', ''))
+    if tag_name:
+        projects = projects.filter(Exists(
+            Project.tag_objects.through.objects.filter(project=OuterRef('pk'), tag__name=tag_name)
+        ))
+    
+    projects = projects.prefetch_related('tag_objects')
+    
+    # Pagination: opt-in cursor mode keyed on (created_at, id), otherwise
+    # numbered pages. Both read the total from a cached count.
+    keyset = keyset_enabled(request)
+    if keyset:
+        page_obj = keyset_paginate(projects, request.GET.get('cursor', ''), 12)
+        total_count = page_obj.count
+    else:
+        paginator = CachedCountPaginator(projects, 12)
+        page_number = request.GET.get('page')
+        page_obj = paginator.get_page(page_number)
+        total_count = paginator.count
+    
+    # Current filters, carried over by the cursor links
+    filter_query = request.GET.copy()
+    filter_query.pop('cursor', None)
+    filter_query.pop('page', None)
     
     categories = Category.objects.all()
     
     context = {
         'page_obj': page_obj,
+        'keyset': keyset,
+        'total_count': total_count,
+        'filter_query': filter_query.urlencode(),
         'categories': categories,
         'search_query': search_query,
-        'selected_category': category_id
+        'selected_category': category_id,
+        'selected_tag': tag_name,
+        'popular_tags': popular_tags()
     }
     return render(request, 'pages/project_list.html', context)
 
+def top_rated(request):
+    # Leaderboard of active projects ranked by Bayesian average rating
+    paginator = Paginator(top_rated_projects(), 12)
+    page_obj = paginator.get_page(request.GET.get('page'))
+
+    context = {
+        'page_obj': page_obj,
+        'projects': page_obj,
+    }
+    return render(request, 'pages/top_rated.html', context)
+
 def project_detail(request, project_id):
     try:
         project = Project.objects.get(id=project_id, is_active=True)
@@ -324,34 +398,112 @@ def project_detail(request, project_id):
         messages.error(request, 'Project not found.')
         return redirect('project_list')
     
-    # Get average rating
-    avg_rating = project.ratings.aggregate(Avg('rating'))['rating__avg'] or 0
+    # Get average rating from the denormalized counters
+    avg_rating = project.get_average_rating()
     
-    # Get similar projects based on tags
-    similar_projects = Project.objects.filter(
-        is_active=True,
-        tags__icontains=project.tags
-    ).exclude(id=project.id)[:4]
+    # Get precomputed similar projects
+    similar_projects = similar_projects_for(project)
     
-    # Get comments
-    comments = project.comments.filter(parent_comment=None).order_by('-created_at')
+    # Get the newest top-level comments with a preview of their replies;
+    # older comments and further replies load from the fragment endpoints
+    comments = load_comment_thread(project)
+    
+    # Uploads still being processed, shown to the creator only
+    images_processing = 0
+    if request.user.id == project.creator_id:
+        images_processing = project.staged_images.exclude(status='failed').count()
     
     context = {
         'project': project,
         'avg_rating': round(avg_rating, 1),
         'similar_projects': similar_projects,
-        'comments': comments
+        'comments': comments,
+        'images_processing': images_processing,
+        'donation_key': uuid.uuid4().hex
     }
     return render(request, 'pages/project_detail.html', context)
 
+def project_comments(request, project_id):
+    # Next page of top-level comments as an HTML fragment
+    project = get_object_or_404(Project, id=project_id, is_active=True)
+    comments = load_comment_thread(project, request.GET.get('cursor', ''))
+    html = render_to_string('patrts/comment_list.html', {'comments': comments, 'project': project}, request=request)
+    next_url = None
+    if comments.has_next:
+        next_url = f"{reverse('project_comments', args=[project.id])}?cursor={comments.next_cursor}"
+    return JsonResponse({'html': html, 'next_url': next_url})
+
+def comment_replies(request, project_id, comment_id):
+    # Replies to one comment after the last one shown, as an HTML fragment
+    project = get_object_or_404(Project, id=project_id, is_active=True)
+    comment = get_object_or_404(Comment, id=comment_id, project=project, parent_comment=None)
+    try:
+        after = int(request.GET.get('after', 0))
+    except ValueError:
+        after = 0
+    replies, has_more = load_replies(comment, after)
+    html = render_to_string('patrts/comment_replies.html', {'replies': replies}, request=request)
+    next_url = None
+    if has_more:
+        next_url = f"{reverse('comment_replies', args=[project_id, comment.id])}?after={replies[-1].id}"
+    return JsonResponse({'html': html, 'next_url': next_url})
+
+def _parse_moment(value):
+    # An ISO date or datetime from the query string, naive ones read as UTC
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(value)
+        moment = datetime.datetime.combine(day, datetime.time())
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment, datetime.timezone.utc)
+    return moment
+
+@login_required
+def project_analytics(request, project_id):
+    # Donations over time for the project's creator, as JSON: ?period=hour|day
+    # and optional ?from= / ?to= (ISO dates or datetimes, to exclusive). The
+    # totals and cumulative amounts count every donation before ?to=;
+    # truncated says the oldest buckets of the window were left out.
+    project = get_object_or_404(Project, id=project_id, creator=request.user)
+    period = request.GET.get('period', 'day')
+    if period not in PERIODS:
+        return JsonResponse({'error': f"period must be one of {', '.join(PERIODS)}."}, status=400)
+    try:
+        start = _parse_moment(request.GET['from']) if request.GET.get('from') else None
+        end = _parse_moment(request.GET['to']) if request.GET.get('to') else None
+    except ValueError:
+        return JsonResponse({'error': 'from and to must be ISO dates or datetimes.'}, status=400)
+
+    series, truncated = donation_series('project', project.id, period, start, end)
+    # Running totals include the donations before the first bucket served
+    total_amount, total_donations = totals_before('project', project.id, period, series[0][0] if series else end)
+    buckets = []
+    for bucket, amount, donations in series:
+        total_amount += amount
+        total_donations += donations
+        buckets.append({
+            'start': bucket.isoformat(),
+            'amount': amount,
+            'donations': donations,
+            'cumulative_amount': total_amount,
+        })
+    return JsonResponse({
+        'project': project.id,
+        'period': period,
+        'total_amount': total_amount,
+        'total_donations': total_donations,
+        'truncated': truncated,
+        'buckets': buckets,
+    })
+
 
 
 @login_required
 def donate_to_project(request, project_id):
     if request.method == 'POST':
         try:
-            project = Project.objects.get(id=project_id, is_active=True)
-            
             # safe conversion to Decimal
             try:
                 amount = Decimal(request.POST.get('amount', '0'))
@@ -365,22 +517,27 @@ def donate_to_project(request, project_id):
                 messages.error(request, 'Invalid donation amount.')
                 return redirect('project_detail', project_id=project_id)
             
-            # Create donation
-            donation = Donation.objects.create(
-                project=project,
-                donor=request.user,
-                amount=amount,
-                message=message
+            # Create donation and update project totals atomically
+            donation, created = record_donation(
+                project_id,
+                request.user,
+                amount,
+                message=message,
+                idempotency_key=request.POST.get('idempotency_key')
             )
             
-            # Update project current amount
-            project.current_amount += amount
-            project.save()
-            
-            messages.success(request, f'Thank you for your donation of {amount} EGP!')
+            if created:
+                messages.success(request, f'Thank you for your donation of {amount} EGP!')
+            else:
+                messages.info(request, 'This donation was already received.')
             
         except Project.DoesNotExist:
             messages.error(request, 'Invalid project.')
+        except OperationalError as e:
+            if not is_lock_error(e):
+                raise
+            logger.warning('Donation to project %s gave up on a locked database', project_id)
+            messages.error(request, 'We are receiving a lot of donations right now and yours was not recorded. Please try again.')
     
     return redirect('project_detail', project_id=project_id)
 
@@ -395,12 +552,30 @@ def rate_project(request, project_id):
                 messages.error(request, 'Invalid rating value.')
                 return redirect('project_detail', project_id=project_id)
             
-            # Update or create rating
-            rating, created = Rating.objects.update_or_create(
-                project=project,
-                user=request.user,
-                defaults={'rating': rating_value}
-            )
+            with engagement_atomic():
+                previous_value = Rating.objects.select_for_update().filter(
+                    project=project, user=request.user
+                ).values_list('rating', flat=True).first()
+
+                # Update or create rating
+                rating, created = Rating.objects.update_or_create(
+                    project=project,
+                    user=request.user,
+                    defaults={'rating': rating_value}
+                )
+
+                # Keep the rating counters in sync, including changed ratings
+                if created:
+                    Project.objects.filter(pk=project.pk).update(
+                        rating_count=F('rating_count') + 1,
+                        rating_sum=F('rating_sum') + rating_value
+                    )
+                elif previous_value != rating_value:
+                    Project.objects.filter(pk=project.pk).update(
+                        rating_sum=F('rating_sum') + (rating_value - previous_value)
+                    )
+                if created or previous_value != rating_value:
+                    update_project_rank(project.pk)
             
             messages.success(request, 'Rating submitted successfully!')
             
@@ -428,12 +603,14 @@ def add_comment(request, project_id):
                 except Comment.DoesNotExist:
                     pass
             
-            Comment.objects.create(
-                project=project,
-                user=request.user,
-                content=content,
-                parent_comment=parent_comment
-            )
+            with engagement_atomic():
+                Comment.objects.create(
+                    project=project,
+                    user=request.user,
+                    content=content,
+                    parent_comment=parent_comment
+                )
+                Project.objects.filter(pk=project.pk).update(comment_count=F('comment_count') + 1)
             
             messages.success(request, 'Comment added successfully!')
             
@@ -507,35 +684,32 @@ def delete_account(request):
 
 def activate_account(request, token):
     try:
-        activation = ActivationToken.objects.get(token=token)
-        if activation.is_expired():
-            activation.delete()
-            return render(request, 'pages/activation_error.html', {
-                'error_message': 'انتهت صلاحية رابط التفعيل. يرجى التسجيل مرة أخرى.'
-            })
-        
-        user = activation.user
+        user = check_token(token, 'activation')
         user.is_active = True
         user.save()
-        activation.delete()
+        spend_token(token, 'activation')
         
         # Send welcome email
         try:
             send_welcome_email(user)
-        except Exception as e:
-            print(f"Error sending welcome email: {e}")
+        except Exception:
+            logger.exception('Error sending welcome email to %s', user.email)
             # Continue even if welcome email fails
         
         return render(request, 'pages/activation_success.html', {
             'user': user
         })
         
-    except ActivationToken.DoesNotExist:
+    except ExpiredToken:
+        return render(request, 'pages/activation_error.html', {
+            'error_message': 'انتهت صلاحية رابط التفعيل. يرجى التسجيل مرة أخرى.'
+        })
+    except InvalidToken:
         return render(request, 'pages/activation_error.html', {
             'error_message': 'رابط التفعيل غير صحيح أو تم استخدامه من قبل.'
         })
-    except Exception as e:
-        print(f"Error in activation: {e}")
+    except Exception:
+        logger.exception('Error in activation')
         return render(request, 'pages/activation_error.html', {
             'error_message': 'حدث خطأ أثناء تفعيل الحساب. يرجى المحاولة مرة أخرى.'
         })
@@ -546,12 +720,8 @@ def forgot_password(request):
         try:
             user = CustomUser.objects.get(email=email)
             
-            # حذف أي رموز موجودة للمستخدم لتجنب خطأ UNIQUE
-            PasswordResetToken.objects.filter(user=user).delete()
-            
             # إنشاء رمز جديد
-            token = get_random_string(48)
-            PasswordResetToken.objects.create(user=user, token=token)
+            token = make_token(user, 'password_reset')
             
             # إرسال رابط إعادة التعيين
             reset_link = request.build_absolute_uri(
@@ -572,11 +742,7 @@ def forgot_password(request):
 
 def reset_password(request, token):
     try:
-        reset_token = PasswordResetToken.objects.get(token=token)
-        if reset_token.is_expired():
-            reset_token.delete()
-            messages.error(request, 'Password reset link has expired.')
-            return redirect('login')
+        user = check_token(token, 'password_reset')
         
         if request.method == 'POST':
             password = request.POST.get('password')
@@ -587,17 +753,19 @@ def reset_password(request, token):
                 return render(request, 'pages/reset_password.html')
             
             # Update password
-            user = reset_token.user
             user.set_password(password)
             user.save()
-            reset_token.delete()
+            spend_token(token, 'password_reset')
             
             messages.success(request, 'Password reset successfully. You can now login with your new password.')
             return redirect('login')
         
         return render(request, 'pages/reset_password.html')
         
-    except PasswordResetToken.DoesNotExist:
+    except ExpiredToken:
+        messages.error(request, 'Password reset link has expired.')
+        return redirect('login')
+    except InvalidToken:
         messages.error(request, 'Invalid password reset link.')
         return redirect('login')
 
@@ -29,6 +29,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'pages.middleware.RequestInstrumentationMiddleware',  # Outermost, so wall time covers the rest
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -59,12 +60,156 @@ WSGI_APPLICATION = 'project.wsgi.application'
 
 
 # Database
+# SQLite connection profiles, picked with SQLITE_PROFILE. The PRAGMAs run on
+# every new connection. 'production' uses WAL (readers no longer wait for
+# writers), waits up to busy_timeout ms for a lock instead of failing, and
+# starts write transactions with BEGIN IMMEDIATE so two transactions that
+# read and then write cannot deadlock. 'default' is plain SQLite, and is
+# what the checked-in db2.sqlite3 is opened with: WAL is written into the
+# database file, so set SQLITE_PROFILE=production in the deployment's
+# environment only.
+SQLITE_PROFILES = {
+    'default': {
+        'pragmas': {},
+        'options': {},
+        'conn_max_age': 0,
+    },
+    'production': {
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',  # Durable across crashes of the app; only an OS crash can lose the last commits
+            'busy_timeout': 5000,
+            'cache_size': -32000,  # 32 MB per connection
+            'mmap_size': 256 * 1024 * 1024,
+            'temp_store': 'MEMORY',
+        },
+        'options': {'transaction_mode': 'IMMEDIATE'},
+        'conn_max_age': 600,
+    },
+}
+SQLITE_PROFILE = config('SQLITE_PROFILE', default='default')
+_sqlite = SQLITE_PROFILES[SQLITE_PROFILE]
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db2.sqlite3',  # Changed from db.sqlite3 to db2.sqlite3
+        'OPTIONS': {
+            **_sqlite['options'],
+            'init_command': ''.join(f'PRAGMA {name}={value};' for name, value in _sqlite['pragmas'].items()),
+        },
+        # Keep connections between requests, checked before reuse
+        'CONN_MAX_AGE': _sqlite['conn_max_age'],
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {
+            # File-backed so threaded tests get real SQLite locking instead of
+            # the shared in-memory cache
+            'NAME': BASE_DIR / 'test_db2.sqlite3',
+        },
+    },
+    # Donation, Rating, Comment and Report, once PAGES_SPLIT_ENGAGEMENT is on
+    # (see pages.db_utils and manage.py split_engagement_db)
+    'engagement': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'engagement.sqlite3',
+        'OPTIONS': {
+            **_sqlite['options'],
+            'init_command': ''.join(f'PRAGMA {name}={value};' for name, value in _sqlite['pragmas'].items()),
+        },
+        'CONN_MAX_AGE': _sqlite['conn_max_age'],
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {
+            'NAME': BASE_DIR / 'test_engagement.sqlite3',
+        },
+    },
+}
+DATABASE_ROUTERS = ['pages.db_utils.EngagementRouter']
+PAGES_SPLIT_ENGAGEMENT = config('PAGES_SPLIT_ENGAGEMENT', default=False, cast=bool)
+
+
+# Cache
+# pages.cache_utils keeps the home page sections here; a file-based cache
+# ('django.core.cache.backends.filebased.FileBasedCache' with a LOCATION
+# directory) works too and is shared between worker processes
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
+PAGES_CACHE_TIMEOUT = 300  # Safety net; sections are invalidated by signals
+
+
+# Top-rated leaderboard: every project's average is pulled towards this
+# prior as if it had LEADERBOARD_PRIOR_VOTES extra ratings of
+# LEADERBOARD_PRIOR_MEAN stars (pages.leaderboard_utils)
+LEADERBOARD_PRIOR_MEAN = 3.0
+LEADERBOARD_PRIOR_VOTES = 5
+
+# Serve project listings with (created_at, id) cursors instead of numbered
+# pages; a single request can opt in with ?cursor= (pages.pagination_utils)
+PAGES_KEYSET_PAGINATION = False
+
+# Uploaded images are staged and processed off the request: 'background'
+# (a process pool in the web process), 'queue' (manage.py
+# process_staged_images) or 'inline' (pages.ingest_utils)
+IMAGE_INGEST_MODE = 'background'
+IMAGE_INGEST_WORKERS = 2
+
+# Similar projects of a saved project are rescored after the save commits,
+# when its title, details, tags, category or is_active changed: 'background'
+# (a thread in the web process), 'inline' (before the response) or 'off'
+# (manage.py rebuild_recommendations only; pages.recommendation_utils)
+PAGES_RECOMMENDATION_UPDATES = 'background'
+
+# Activation and password reset links carry signed tokens that are checked
+# without a database row; 'table' stores one per user instead
+# (pages.token_utils). Either kind expires after PAGES_TOKEN_MAX_AGE seconds.
+PAGES_TOKEN_MODE = 'signed'
+PAGES_TOKEN_MAX_AGE = 60 * 60 * 24
+
+# Per-request instrumentation (pages.middleware): query count, SQL,
+# template and wall time per URL name and repeated query shapes (N+1,
+# PAGES_N_PLUS_ONE_THRESHOLD runs or more), one JSON line per request in
+# PAGES_INSTRUMENTATION_LOG. Requests over their budget are flagged there,
+# or fail with PAGES_BUDGET_ACTION = 'raise' (as in the tests).
+PAGES_INSTRUMENTATION = config('PAGES_INSTRUMENTATION', default=False, cast=bool)
+PAGES_INSTRUMENTATION_LOG = BASE_DIR / 'request_metrics.jsonl'
+PAGES_N_PLUS_ONE_THRESHOLD = 3
+PAGES_BUDGET_ACTION = 'log'
+PAGES_REQUEST_BUDGETS = {
+    '*': {'queries': 20, 'repeated_queries': 0, 'wall_ms': 1000},
+    'home': {'queries': 7, 'wall_ms': 300},
+    'project_list': {'queries': 7, 'wall_ms': 300},
+    'top_rated': {'queries': 4, 'wall_ms': 300},
+    'project_detail': {'queries': 12, 'wall_ms': 300},
+    'profile': {'queries': 6, 'wall_ms': 300},
+    'project_analytics': {'queries': 4, 'wall_ms': 300},
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'request_metrics': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': PAGES_INSTRUMENTATION_LOG,
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            'delay': True,  # No file until something is recorded
+            'formatter': 'message',
+        },
+    },
+    'loggers': {
+        'pages.instrumentation': {
+            'handlers': ['request_metrics'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
 
 
 # Password validation